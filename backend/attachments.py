@@ -0,0 +1,219 @@
+"""Adjuntos: subida y descarga por frames binarios del WebSocket, guardados por hash.
+
+Cada archivo se guarda una sola vez en `ATTACHMENT_DIR/objects/<sha256[:2]>/<sha256>`;
+dos subidas con el mismo contenido terminan en el mismo objeto. Los mensajes solo
+llevan la referencia (hash, nombre, tipo, tamaño y una firma), nunca los bytes.
+
+Frame binario, en los dos sentidos: HEADER (id de la transferencia en 16 bytes y
+offset de 8 bytes big-endian) seguido de los datos del tramo.
+"""
+import hashlib
+import hmac
+import os
+import struct
+import time
+import unicodedata
+import uuid
+
+from dotenv import load_dotenv
+
+import auth
+
+load_dotenv()
+
+# directorio de los objetos y de las subidas en curso; vacío desactiva los adjuntos
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "attachment_data")
+ATTACHMENT_MAX_MB = float(os.getenv("ATTACHMENT_MAX_MB", "25"))
+# datos por frame binario (subida y descarga)
+ATTACHMENT_CHUNK_KB = int(os.getenv("ATTACHMENT_CHUNK_KB", "64"))
+# firma de las referencias; por defecto la misma clave de los JWT (igual en todos los workers)
+ATTACHMENT_SECRET = os.getenv("ATTACHMENT_SECRET", "") or auth.JWT_SECRET
+# tipos aceptados (separados por coma); lo demás, p. ej. text/html o image/svg+xml, se rechaza
+ATTACHMENT_MIME_TYPES = os.getenv(
+    "ATTACHMENT_MIME_TYPES",
+    "image/jpeg,image/png,image/gif,image/webp,audio/mpeg,audio/ogg,audio/webm,audio/mp4,"
+    "video/mp4,video/webm,application/pdf,text/plain,application/zip,application/octet-stream",
+)
+# subidas a medias más viejas que esto se borran al arrancar (las dejó un proceso caído)
+STALE_UPLOAD_S = 24 * 3600
+NAME_MAX = 255
+
+HEADER = struct.Struct(">16sQ")
+
+
+class AttachmentError(Exception):
+    pass
+
+
+def parse_frame(frame: bytes) -> tuple[bytes, int, memoryview]:
+    # (id de la transferencia, offset, datos) sin copiar los datos
+    if len(frame) < HEADER.size:
+        raise AttachmentError("Frame binario incompleto")
+    transfer_id, offset = HEADER.unpack_from(frame)
+    return transfer_id, offset, memoryview(frame)[HEADER.size:]
+
+
+def make_frame(transfer_id: bytes, offset: int, data: bytes) -> bytes:
+    return HEADER.pack(transfer_id, offset) + data
+
+
+def clean_name(name) -> str:
+    # solo el nombre (sin rutas) y sin caracteres de control ni de formato (p. ej. U+202E)
+    name = str(name or "").replace("\\", "/").rsplit("/", 1)[-1]
+    name = "".join(c for c in name if unicodedata.category(c) not in ("Cc", "Cf")).strip()
+    return name[:NAME_MAX] or "archivo"
+
+
+class Upload:
+    """Subida en curso: los tramos llegan en orden y se escriben a un archivo temporal."""
+
+    __slots__ = ("id", "chat_id", "size", "mime", "name", "received", "path", "_file", "_hash")
+
+    def __init__(self, chat_id: str, size: int, mime: str, name: str, tmp_dir: str):
+        self.id = uuid.uuid4().bytes
+        self.chat_id = chat_id
+        self.size = size
+        self.mime = mime
+        self.name = name
+        self.received = 0
+        self.path = os.path.join(tmp_dir, f"{self.id.hex()}.part")
+        self._file = open(self.path, "wb")
+        self._hash = hashlib.sha256()
+
+    @property
+    def transfer_id(self) -> str:
+        return str(uuid.UUID(bytes=self.id))
+
+    def write(self, data) -> bool:
+        # bloqueante (disco): llamar fuera del event loop; True cuando llegó todo
+        self._file.write(data)
+        self._hash.update(data)
+        self.received += len(data)
+        return self.received >= self.size
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class AttachmentStore:
+    def __init__(self, root: str, max_bytes: int, chunk_size: int, secret: str, mime_types: str = ATTACHMENT_MIME_TYPES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._secret = secret.encode("utf-8")
+        self.mime_types = frozenset(t.strip().lower() for t in mime_types.split(",") if t.strip())
+        self.uploads = 0
+        self.dedup_hits = 0
+        self.bytes_in = 0
+        self.downloads = 0
+        self.bytes_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def _tmp_dir(self) -> str:
+        path = os.path.join(self.root, "tmp")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def object_path(self, digest: str) -> str:
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise AttachmentError("Adjunto inválido")
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    # ---------------- REFERENCIAS ----------------
+    def sign(self, chat_id: str, digest: str) -> str:
+        # la firma ata el objeto al chat: solo sus miembros pueden descargarlo
+        return hmac.new(self._secret, f"{chat_id}:{digest}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def verify(self, chat_id: str, digest: str, sig) -> bool:
+        return isinstance(sig, str) and hmac.compare_digest(self.sign(chat_id, str(digest)), sig)
+
+    def reference(self, chat_id: str, digest: str, size: int, mime: str, name: str) -> dict:
+        return {"id": digest, "name": name, "mime": mime, "size": size, "sig": self.sign(chat_id, digest)}
+
+    def check_mime(self, mime) -> str:
+        """Tipo normalizado (minúsculas, sin parámetros); AttachmentError si no está permitido."""
+        mime = str(mime or "application/octet-stream").split(";", 1)[0].strip().lower()
+        if mime not in self.mime_types:
+            raise AttachmentError("Tipo de archivo no permitido")
+        return mime
+
+    # ---------------- SUBIDA ----------------
+    def begin(self, chat_id: str, size: int, mime: str, name: str) -> Upload:
+        if size <= 0 or size > self.max_bytes:
+            raise AttachmentError(f"El adjunto debe pesar entre 1 byte y {self.max_bytes // 2**20} MB")
+        return Upload(chat_id, size, self.check_mime(mime), clean_name(name), self._tmp_dir())
+
+    def finish(self, upload: Upload) -> dict:
+        """Mueve la subida completa a su objeto; si ya existía, descarta la copia."""
+        upload._file.flush()
+        os.fsync(upload._file.fileno())
+        upload.close()
+        digest = upload._hash.hexdigest()
+        target = self.object_path(digest)
+        self.uploads += 1
+        self.bytes_in += upload.received
+        if os.path.exists(target):
+            os.remove(upload.path)
+            self.dedup_hits += 1
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # rename atómico: otro worker con el mismo contenido deja el mismo archivo
+            os.replace(upload.path, target)
+        # el tamaño es el del archivo armado, no el que anunció el cliente
+        return self.reference(upload.chat_id, digest, upload.received, upload.mime, upload.name)
+
+    def abort(self, upload: Upload):
+        upload.close()
+        try:
+            os.remove(upload.path)
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self) -> int:
+        # subidas abandonadas por un proceso que se cayó; las de otros workers vivos son recientes
+        if not self.enabled or not os.path.isdir(os.path.join(self.root, "tmp")):
+            return 0
+        removed, limit = 0, time.time() - STALE_UPLOAD_S
+        with os.scandir(os.path.join(self.root, "tmp")) as entries:
+            for entry in entries:
+                if entry.name.endswith(".part") and entry.stat().st_mtime < limit:
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
+
+    # ---------------- DESCARGA ----------------
+    def size_of(self, digest: str) -> int | None:
+        try:
+            return os.path.getsize(self.object_path(digest))
+        except OSError:
+            return None
+
+    def read(self, digest: str, offset: int, length: int) -> bytes:
+        with open(self.object_path(digest), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        self.bytes_out += len(data)
+        return data
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "uploads": self.uploads,
+            "dedupHits": self.dedup_hits,
+            "bytesIn": self.bytes_in,
+            "downloads": self.downloads,
+            "bytesOut": self.bytes_out,
+        }
+
+
+store = AttachmentStore(
+    ATTACHMENT_DIR,
+    max_bytes=int(ATTACHMENT_MAX_MB * 2**20),
+    chunk_size=ATTACHMENT_CHUNK_KB * 1024,
+    secret=ATTACHMENT_SECRET,
+)
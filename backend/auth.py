@@ -4,19 +4,50 @@ import jwt
 import os
 from dotenv import load_dotenv
 
+from lru import LRUCache
+
 load_dotenv()
 JWT_SECRET = os.getenv("JWT_SECRET", "change_me")
+# costo de bcrypt (2^rounds iteraciones); al cambiarlo los hashes viejos se rehacen al iniciar sesión
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+if not 4 <= BCRYPT_ROUNDS <= 31:
+    raise ValueError(f"BCRYPT_ROUNDS fuera de rango (4-31): {BCRYPT_ROUNDS}")
+# tokens ya verificados (token -> payload) hasta su exp: una reconexión no vuelve a validar la firma
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+verified_tokens = LRUCache(TOKEN_CACHE_SIZE)
 
-def hash_password(p: str) -> str:
-    return bcrypt.hashpw(p.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+def hash_password(p: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(p.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
 
 def verify_password(p: str, hashed: str) -> bool:
     return bcrypt.checkpw(p.encode("utf-8"), hashed.encode("utf-8"))
 
+def password_rounds(hashed: str) -> int | None:
+    # formato $2b$12$<salt+hash>
+    parts = hashed.split("$")
+    return int(parts[2]) if len(parts) > 3 and parts[2].isdigit() else None
+
+def needs_rehash(hashed: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    return password_rounds(hashed) != rounds
+
+def verify_and_rehash(p: str, hashed: str, rounds: int = BCRYPT_ROUNDS) -> tuple[bool, str | None]:
+    # (contraseña correcta, hash nuevo si el costo cambió); una sola ida al pool de procesos
+    if not verify_password(p, hashed):
+        return False, None
+    return True, hash_password(p, rounds) if needs_rehash(hashed, rounds) else None
+
 def create_token(user_id: str, username: str, ttl: int = 60 * 60 * 8) -> str:
     now = int(time.time())
     payload = {"sub": user_id, "usr": username, "iat": now, "exp": now + ttl}
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 def verify_token(token: str) -> dict:
-    return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            return payload
+        verified_tokens.pop(token)
+    # jwt.decode lanza si la firma no es válida o el token expiró
+    payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    verified_tokens.put(token, payload)
+    return payload
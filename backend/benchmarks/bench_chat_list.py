@@ -0,0 +1,111 @@
+"""Latencia de chat:list (db.list_chats_for_user) según la cantidad de chats del usuario.
+
+Compara la hidratación anterior (1 consulta por chat para miembros + 1 para el
+último mensaje, orden en Python) contra la hidratación por conjuntos.
+
+SQLite corre en proceso y no paga ida y vuelta de red; `--rtt-ms` simula la
+latencia por consulta que sí existe contra un MySQL en la LAN.
+
+    python benchmarks/bench_chat_list.py                 # SQLite temporal, rtt 0.3 ms
+    python benchmarks/bench_chat_list.py --rtt-ms 0      # solo costo del motor
+    python benchmarks/bench_chat_list.py --backend mysql # usa MYSQL_* del .env (inserta datos)
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import create_storage  # noqa: E402
+
+
+def naive_list_chats(storage, user_id: str) -> list[dict]:
+    # implementación previa: N+1 consultas y orden en Python
+    rows = storage._query(
+        """
+        SELECT ch.id, ch.type, ch.title, ch.description
+        FROM chats ch
+        JOIN chat_members cm ON cm.chatId = ch.id
+        WHERE cm.userId = %s
+        ORDER BY ch.created_at DESC
+        """,
+        (user_id,),
+    )
+    chats = [storage._hydrate_chat_for_user(row, user_id) for row in rows]
+    chats.sort(key=lambda ch: ch.get("lastMessage", {}).get("createdAt", 0), reverse=True)
+    return chats
+
+
+def add_round_trip(storage, rtt_ms: float):
+    if rtt_ms <= 0:
+        return
+    delay = rtt_ms / 1000
+    query, query_one = storage._query, storage._query_one
+
+    def _query(sql, params=()):
+        time.sleep(delay)
+        return query(sql, params)
+
+    def _query_one(sql, params=()):
+        time.sleep(delay)
+        return query_one(sql, params)
+
+    storage._query, storage._query_one = _query, _query_one
+
+
+def seed(storage, n_chats: int, msgs_per_chat: int, tag: str) -> str:
+    me = storage.create_user(f"bench_{tag}_me", "Bench", None, "x")
+    for i in range(n_chats):
+        other = storage.create_user(f"bench_{tag}_{i}", f"Contacto {i}", None, "x")
+        chat = storage.create_direct_chat(me["id"], other["id"])
+        for j in range(msgs_per_chat):
+            sender = me["id"] if j % 2 else other["id"]
+            storage.save_message(chat["id"], sender, "text", f"mensaje {j}")
+    return me["id"]
+
+
+def measure(fn, repeat: int) -> tuple[float, float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", default="sqlite", choices=["sqlite", "mysql"])
+    ap.add_argument("--sizes", default="10,50,100,300")
+    ap.add_argument("--messages", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--rtt-ms", type=float, default=0.3)
+    args = ap.parse_args()
+
+    if args.backend == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    storage = create_storage(args.backend)
+
+    print(f"backend={storage.name} mensajes/chat={args.messages} rtt={args.rtt_ms}ms repeticiones={args.repeat}")
+    print(f"{'chats':>6} {'antes p50':>10} {'antes p95':>10} {'ahora p50':>10} {'ahora p95':>10} {'mejora':>7}")
+    tag = str(int(time.time()))
+    for n in (int(x) for x in args.sizes.split(",")):
+        user_id = seed(storage, n, args.messages, f"{tag}_{n}")
+        add_round_trip(storage, args.rtt_ms)
+        assert [c["id"] for c in naive_list_chats(storage, user_id)] == [
+            c["id"] for c in storage.list_chats_for_user(user_id)
+        ]
+        b50, b95 = measure(lambda: naive_list_chats(storage, user_id), args.repeat)
+        a50, a95 = measure(lambda: storage.list_chats_for_user(user_id), args.repeat)
+        print(f"{n:>6} {b50:>9.2f}ms {b95:>9.2f}ms {a50:>9.2f}ms {a95:>9.2f}ms {b50 / a50:>6.1f}x")
+        # el siguiente tamaño se siembra sin latencia simulada
+        storage.__dict__.pop("_query", None)
+        storage.__dict__.pop("_query_one", None)
+
+
+if __name__ == "__main__":
+    main()
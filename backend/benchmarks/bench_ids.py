@@ -0,0 +1,117 @@
+"""Velocidad de INSERT y tamaño de índices según el formato del id de `messages`.
+
+Compara tres variantes de una tabla con la forma de `messages` (PK por id más
+el índice (chatId, createdAt, id) del historial):
+
+- `uuid4 CHAR(36)`: el formato anterior, aleatorio.
+- `uuid7 CHAR(36)`: ordenado por tiempo, todavía como texto.
+- `uuid7 BINARY(16)`: el formato actual en MySQL.
+
+En MySQL el tamaño sale de information_schema.TABLES tras ANALYZE TABLE; en
+SQLite (tablas WITHOUT ROWID, para que la PK sea el índice clustered como en
+InnoDB) de `dbstat`, si la compilación lo trae, o del tamaño del archivo.
+
+    python benchmarks/bench_ids.py                       # SQLite temporal
+    python benchmarks/bench_ids.py --rows 1000000 --backend mysql  # usa MYSQL_* del .env (crea tablas bench_ids_*)
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import create_storage  # noqa: E402
+from storage.ids import id_to_bytes, new_id  # noqa: E402
+
+VARIANTS = [
+    ("uuid4 CHAR(36)", "uuid4_char", lambda: str(uuid.uuid4()), "CHAR(36)", False),
+    ("uuid7 CHAR(36)", "uuid7_char", new_id, "CHAR(36)", False),
+    ("uuid7 BINARY(16)", "uuid7_binary", new_id, "BINARY(16)", True),
+]
+
+
+def create_table(storage, table: str, id_type: str):
+    if storage.name == "sqlite":
+        id_type = "BLOB" if id_type.startswith("BINARY") else "TEXT"
+        storage._execute(f"DROP TABLE IF EXISTS {table}")
+        storage._execute(
+            f"CREATE TABLE {table} (id {id_type} PRIMARY KEY, chatId {id_type} NOT NULL, "
+            "content TEXT NOT NULL, createdAt INTEGER NOT NULL) WITHOUT ROWID"
+        )
+    else:
+        storage._execute(f"DROP TABLE IF EXISTS {table}")
+        storage._execute(
+            f"CREATE TABLE {table} (id {id_type} NOT NULL PRIMARY KEY, chatId {id_type} NOT NULL, "
+            "content TEXT NOT NULL, createdAt BIGINT NOT NULL) ENGINE=InnoDB"
+        )
+    storage._execute(f"CREATE INDEX idx_{table}_chat ON {table} (chatId, createdAt, id)")
+
+
+def insert_rows(storage, table: str, make_id, binary: bool, rows: int, chats: list, batch: int) -> float:
+    encode = id_to_bytes if binary else (lambda v: v)
+    chat_ids = [encode(c) for c in chats]
+    values = ",".join(["(%s,%s,%s,%s)"] * batch)
+    t0 = time.perf_counter()
+    for _ in range(rows // batch):
+        now = int(time.time() * 1000)
+        params = []
+        for _ in range(batch):
+            params.extend((encode(make_id()), random.choice(chat_ids), "mensaje de prueba", now))
+        with storage._transaction() as cur:
+            cur.execute(f"INSERT INTO {table} (id, chatId, content, createdAt) VALUES {values}", tuple(params))
+    return time.perf_counter() - t0
+
+
+def table_size(storage, table: str) -> tuple[int, int]:
+    # (bytes de datos / PK, bytes de índices secundarios)
+    if storage.name == "sqlite":
+        try:
+            rows = storage._query(
+                "SELECT name, SUM(pgsize) AS size FROM dbstat WHERE name LIKE %s GROUP BY name",
+                (f"%{table}%",),
+            )
+        except Exception:
+            return os.path.getsize(storage.path), 0
+        data = sum(r["size"] for r in rows if not r["name"].startswith("idx_"))
+        return data, sum(r["size"] for r in rows if r["name"].startswith("idx_"))
+    storage._query(f"ANALYZE TABLE {table}")
+    row = storage._query_one(
+        "SELECT DATA_LENGTH AS data, INDEX_LENGTH AS idx FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,),
+    )
+    return row["data"], row["idx"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", default="sqlite", choices=["sqlite", "mysql"])
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--chats", type=int, default=1000)
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--keep", action="store_true", help="no borra las tablas bench_ids_* al terminar")
+    args = ap.parse_args()
+
+    if args.backend == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    storage = create_storage(args.backend)
+    chats = [new_id() for _ in range(args.chats)]
+
+    print(f"backend={storage.name} filas={args.rows} chats={args.chats} lote={args.batch}")
+    print(f"{'variante':<18} {'filas/s':>10} {'datos+PK':>10} {'índices':>10}")
+    for label, suffix, make_id, id_type, binary in VARIANTS:
+        table = f"bench_ids_{suffix}"
+        create_table(storage, table, id_type)
+        elapsed = insert_rows(storage, table, make_id, binary, args.rows, chats, args.batch)
+        data, idx = table_size(storage, table)
+        print(f"{label:<18} {args.rows / elapsed:>10.0f} {data / 2**20:>8.1f}MB {idx / 2**20:>8.1f}MB")
+        if not args.keep:
+            storage._execute(f"DROP TABLE {table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Memoria por conexión ociosa del registro de sesiones.
+
+Mide con tracemalloc lo que el servidor retiene por socket autenticado sin
+tráfico (sin contar el objeto del socket de websockets), comparando el esquema
+anterior (4 diccionarios socket/usuario/room + Outbox con deque, dict, Event y
+tarea escritora creados al conectar) contra Session con __slots__ y Outbox perezoso.
+
+    python benchmarks/bench_session_memory.py
+    python benchmarks/bench_session_memory.py --sizes 10000,100000 --rooms 1
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fanout import FanoutMetrics, Outbox  # noqa: E402
+from sessions import SessionRegistry  # noqa: E402
+
+
+class _EagerOutbox:
+    # Outbox anterior: reserva cola, índice y tarea escritora al conectar
+    __slots__ = ("ws", "max_frames", "policy", "metrics", "_frames", "_keyed", "_wakeup", "_task", "closed")
+
+    def __init__(self, ws, max_frames, policy, metrics):
+        self.ws = ws
+        self.max_frames = max_frames
+        self.policy = policy
+        self.metrics = metrics
+        self._frames = deque()
+        self._keyed = {}
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self.closed = False
+
+    async def _run(self):
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+
+def open_before(n: int, rooms: int, metrics: FanoutMetrics) -> tuple:
+    sockets = [object() for _ in range(n)]
+    ws_user, user_ws, room_ws, ws_rooms, outboxes = {}, {}, {}, {}, {}
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for i, ws in enumerate(sockets):
+        outboxes[ws] = _EagerOutbox(ws, 256, "coalesce", metrics)
+        uid = f"user-{i:08d}"
+        ws_user[ws] = uid
+        user_ws.setdefault(uid, set()).add(ws)
+        for r in range(rooms):
+            chat_id = f"chat-{i:08d}-{r}"
+            room_ws.setdefault(chat_id, set()).add(ws)
+            ws_rooms.setdefault(ws, set()).add(chat_id)
+    return start, (sockets, ws_user, user_ws, room_ws, ws_rooms, outboxes)
+
+
+def open_after(n: int, rooms: int, metrics: FanoutMetrics) -> tuple:
+    sockets = [object() for _ in range(n)]
+    registry = SessionRegistry()
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for i, ws in enumerate(sockets):
+        session = registry.open(ws, Outbox(ws, 256, "coalesce", metrics))
+        registry.bind(session, f"user-{i:08d}")
+        for r in range(rooms):
+            registry.join(session, f"chat-{i:08d}-{r}")
+    return start, (sockets, registry)
+
+
+async def measure(open_fn, n: int, rooms: int) -> float:
+    start, keep = open_fn(n, rooms, FanoutMetrics())
+    # deja que las tareas escritoras arranquen y queden esperando
+    await asyncio.sleep(0)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    if isinstance(keep[-1], dict):
+        # esquema anterior: cancela las tareas escritoras ociosas
+        for outbox in keep[-1].values():
+            outbox.closed = True
+            outbox._task.cancel()
+    del keep
+    await asyncio.sleep(0)
+    gc.collect()
+    return used / n
+
+
+async def run(args):
+    print(f"rooms/socket={args.rooms} (bytes por conexión, ids de usuario/room incluidos)")
+    print(f"{'conexiones':>10} {'antes':>10} {'ahora':>10} {'antes total':>12} {'ahora total':>12}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        before = await measure(open_before, n, args.rooms)
+        after = await measure(open_after, n, args.rooms)
+        print(
+            f"{n:>10} {before:>9.0f}B {after:>9.0f}B "
+            f"{before * n / 2**20:>10.1f}MB {after * n / 2**20:>10.1f}MB"
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000")
+    ap.add_argument("--rooms", type=int, default=0)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+from .base import Bus, LocalBus
+
+BACKENDS = ("local", "unix")
+
+
+def create_bus(kind: str, worker_id: str, path: str = "/tmp/chat-bus.sock") -> Bus:
+    kind = (kind or "local").strip().lower()
+
+    if kind == "local":
+        return LocalBus(worker_id)
+    if kind == "unix":
+        from .unix import UnixSocketBus
+
+        return UnixSocketBus(path, worker_id)
+
+    raise ValueError(f"BUS_BACKEND desconocido: {kind} (usa {', '.join(BACKENDS)})")
+
+
+__all__ = ["BACKENDS", "Bus", "LocalBus", "create_bus"]
@@ -0,0 +1,45 @@
+from typing import Awaitable, Callable, Iterable
+
+# evento que viaja entre workers: {"kind": ..., ...}; lo interpreta server.py
+OnEvent = Callable[[dict], Awaitable[None]]
+
+
+class Bus:
+    """Pub/sub entre procesos del servidor con un directorio de presencia compartido.
+
+    Cada worker anuncia qué usuarios tienen sesiones en él (`announce`). Con ese
+    directorio `workers_of` dice qué otros workers tienen alguno de los destinatarios,
+    y `publish` envía el evento solo a esos. `LocalBus` (un solo proceso) no tiene
+    workers remotos: todo lo resuelve el registro local.
+    """
+
+    name = "base"
+    # False: no hay otros procesos y el servidor puede saltarse el trabajo de enrutado
+    distributed = False
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+
+    async def start(self, on_event: OnEvent, local_users: Callable[[], Iterable[str]]):
+        # local_users: usuarios con sesión en este worker (se re-anuncian al reconectar)
+        pass
+
+    def announce(self, user_id: str, online: bool):
+        pass
+
+    def workers_of(self, user_ids: Iterable[str]) -> set[str]:
+        return set()
+
+    def publish(self, workers: Iterable[str] | None, event: dict):
+        # workers=None: todos los demás workers
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "worker": self.worker_id}
+
+
+class LocalBus(Bus):
+    name = "local"
@@ -0,0 +1,308 @@
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Callable, Iterable
+
+from .base import Bus, OnEvent
+
+# cada línea es un JSON; los frames de chat pueden ser grandes
+_LINE_LIMIT = 16 * 1024 * 1024
+
+
+def _encode(obj: dict) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+
+
+class _Peer:
+    """Conexión de un worker en el broker, con su cola de salida acotada por bytes.
+
+    Una sola tarea escribe y espera `drain`: un worker lento acumula en su cola, no en
+    el buffer del transporte, y al pasar el límite se le corta la conexión.
+    """
+
+    __slots__ = ("writer", "lines", "queued", "task")
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.lines: deque[bytes] = deque()
+        self.queued = 0
+        self.task: asyncio.Task | None = None
+
+
+class Broker:
+    """Broker local sobre un socket Unix: reenvía eventos y mantiene el directorio.
+
+    Protocolo (una línea JSON por mensaje):
+      worker -> broker: hello {worker}, dir {user, online}, pub {to, event}
+      broker -> worker: snapshot {entries: [[user, worker], ...]}, dir {worker, user, online},
+                        drop {worker}, event {event}
+
+    Si la cola de un worker pasa `max_queue_bytes` se lo desconecta: al reconectar
+    descarta sus cachés (perdió eventos) y vuelve a anunciar sus usuarios.
+    """
+
+    def __init__(self, path: str, max_queue_bytes: int = 64 * 2**20):
+        self.path = path
+        self.max_queue_bytes = max_queue_bytes
+        self._server: asyncio.AbstractServer | None = None
+        self._peers: dict[str, _Peer] = {}
+        # userId -> workers con sesiones de ese usuario
+        self._directory: dict[str, set[str]] = {}
+        self.forwarded = 0
+        self.overflows = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=_LINE_LIMIT)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for peer in list(self._peers.values()):
+            peer.writer.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _put(self, worker: str, line: bytes) -> bool:
+        peer = self._peers.get(worker)
+        if peer is None or peer.writer.is_closing():
+            return False
+        if peer.queued + len(line) > self.max_queue_bytes:
+            # worker que no lee: se lo desconecta en lugar de crecer sin límite
+            self.overflows += 1
+            print(f"[Bus] worker {worker} no lee sus eventos ({peer.queued} bytes en cola), se desconecta")
+            peer.lines.clear()
+            peer.queued = 0
+            peer.writer.close()
+            return False
+        peer.lines.append(line)
+        peer.queued += len(line)
+        if peer.task is None:
+            peer.task = asyncio.create_task(self._drain(peer))
+        return True
+
+    async def _drain(self, peer: _Peer):
+        try:
+            while peer.lines:
+                # todo lo encolado en una escritura; drain espera a que el worker lo lea
+                chunk = b"".join(peer.lines)
+                peer.lines.clear()
+                peer.queued = 0
+                peer.writer.write(chunk)
+                await peer.writer.drain()
+        except (ConnectionError, RuntimeError):
+            # conexión cerrada: _serve hace la limpieza
+            pass
+        finally:
+            peer.task = None
+
+    def _send(self, worker: str, obj: dict):
+        self._put(worker, _encode(obj))
+
+    def _send_others(self, worker: str, obj: dict):
+        line = _encode(obj)
+        for wid in list(self._peers):
+            if wid != worker:
+                self._put(wid, line)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = None
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            worker = hello.get("worker")
+            if hello.get("op") != "hello" or not worker:
+                return
+            # un worker que reconecta empieza de cero: sus usuarios se re-anuncian
+            self._drop(worker)
+            self._peers[worker] = _Peer(writer)
+            entries = [[uid, wid] for uid, wids in self._directory.items() for wid in wids]
+            self._send(worker, {"op": "snapshot", "entries": entries})
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                msg = json.loads(line)
+                op = msg.get("op")
+                if op == "dir":
+                    self._set(worker, msg["user"], msg["online"])
+                    self._send_others(worker, {"op": "dir", "worker": worker, "user": msg["user"], "online": msg["online"]})
+                elif op == "pub":
+                    out = _encode({"op": "event", "event": msg["event"]})
+                    targets = msg.get("to")
+                    for wid in (targets if targets is not None else list(self._peers)):
+                        if wid != worker and self._put(wid, out):
+                            self.forwarded += 1
+        except (ConnectionError, asyncio.IncompleteReadError, json.JSONDecodeError) as e:
+            print(f"[Bus] worker {worker} desconectado: {e}")
+        finally:
+            peer = self._peers.get(worker) if worker is not None else None
+            if peer is not None and peer.writer is writer:
+                del self._peers[worker]
+                if peer.task is not None:
+                    peer.task.cancel()
+                self._drop(worker)
+                self._send_others(worker, {"op": "drop", "worker": worker})
+            writer.close()
+
+    def _set(self, worker: str, user_id: str, online: bool):
+        if online:
+            self._directory.setdefault(user_id, set()).add(worker)
+            return
+        workers = self._directory.get(user_id)
+        if workers is not None:
+            workers.discard(worker)
+            if not workers:
+                del self._directory[user_id]
+
+    def _drop(self, worker: str):
+        for user_id in [uid for uid, wids in self._directory.items() if worker in wids]:
+            self._set(worker, user_id, False)
+
+
+class UnixSocketBus(Bus):
+    """Cliente del Broker. Guarda una réplica del directorio para decidir, sin ida y
+    vuelta, a qué workers publicar."""
+
+    name = "unix"
+    distributed = True
+
+    def __init__(self, path: str, worker_id: str):
+        super().__init__(worker_id)
+        self.path = path
+        self._writer: asyncio.StreamWriter | None = None
+        self._task: asyncio.Task | None = None
+        self._on_event: OnEvent | None = None
+        self._local_users: Callable[[], Iterable[str]] = lambda: ()
+        # userId -> otros workers con sesiones de ese usuario
+        self._directory: dict[str, set[str]] = {}
+        self._connected = asyncio.Event()
+        self.reconnects = 0
+        self.published = 0
+        self.received = 0
+        self.lost = 0
+
+    async def start(self, on_event: OnEvent, local_users: Callable[[], Iterable[str]]):
+        self._on_event = on_event
+        self._local_users = local_users
+        self._task = asyncio.create_task(self._run())
+        await asyncio.wait_for(self._connected.wait(), 10)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _send(self, obj: dict) -> bool:
+        if self._writer is None or self._writer.is_closing():
+            return False
+        self._writer.write(_encode(obj))
+        return True
+
+    def announce(self, user_id: str, online: bool):
+        self._send({"op": "dir", "user": user_id, "online": online})
+
+    def workers_of(self, user_ids: Iterable[str]) -> set[str]:
+        found: set[str] = set()
+        for uid in user_ids:
+            workers = self._directory.get(uid)
+            if workers:
+                found |= workers
+        return found
+
+    def publish(self, workers: Iterable[str] | None, event: dict):
+        to = None if workers is None else list(workers)
+        if to is not None and not to:
+            return
+        if self._send({"op": "pub", "to": to, "event": event}):
+            self.published += 1
+        else:
+            # sin broker (reconectando): el evento se pierde, igual que un frame a un socket caído
+            self.lost += 1
+
+    async def _run(self):
+        delay = 0.1
+        connected_before = False
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path, limit=_LINE_LIMIT)
+                self._send({"op": "hello", "worker": self.worker_id})
+                for uid in self._local_users():
+                    self.announce(uid, True)
+                delay = 0.1
+                if connected_before:
+                    # mientras no hubo conexión (o el broker nos cortó por lento) se perdieron
+                    # eventos: lo cacheado a partir de ellos puede estar desactualizado
+                    self.reconnects += 1
+                    try:
+                        await self._on_event({"kind": "resync"})
+                    except Exception as e:
+                        print(f"[Bus] error procesando resync: {e}")
+                connected_before = True
+                await self._read(reader)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.IncompleteReadError) as e:
+                print(f"[Bus] sin conexión con el broker ({self.path}): {e}")
+            self._writer = None
+            self._directory.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionResetError("broker cerrado")
+            msg = json.loads(line)
+            op = msg.get("op")
+            if op == "event":
+                self.received += 1
+                try:
+                    await self._on_event(msg["event"])
+                except Exception as e:
+                    print(f"[Bus] error procesando evento: {e}")
+            elif op == "dir":
+                self._set(msg["worker"], msg["user"], msg["online"])
+            elif op == "drop":
+                for uid in [u for u, wids in self._directory.items() if msg["worker"] in wids]:
+                    self._set(msg["worker"], uid, False)
+            elif op == "snapshot":
+                self._directory.clear()
+                for uid, wid in msg["entries"]:
+                    self._set(wid, uid, True)
+                self._connected.set()
+
+    def _set(self, worker: str, user_id: str, online: bool):
+        if worker == self.worker_id:
+            return
+        if online:
+            self._directory.setdefault(user_id, set()).add(worker)
+            return
+        workers = self._directory.get(user_id)
+        if workers is not None:
+            workers.discard(worker)
+            if not workers:
+                del self._directory[user_id]
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "connected": self._writer is not None,
+            "remoteUsers": len(self._directory),
+            "published": self.published,
+            "received": self.received,
+            "lost": self.lost,
+            "reconnects": self.reconnects,
+        }
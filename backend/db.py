@@ -1,375 +1,371 @@
 import os
+import threading
 import time
-import uuid
 
 from dotenv import load_dotenv
-from mysql.connector.pooling import MySQLConnectionPool
+
+from lru import LRUCache
+from membership import MembershipCache
+from message_cache import MessageCache
+from message_index import MessageIndex
+from user_index import UserIndex
+from storage import Storage, create_storage
+from storage.migrations import check_plans as _check_plans
 
 load_dotenv()
 
-_pool = MySQLConnectionPool(
-    pool_name="chat_pool",
-    pool_size=10,
-    host=os.getenv("MYSQL_HOST", "127.0.0.1"),
-    port=int(os.getenv("MYSQL_PORT", "3306")),
-    user=os.getenv("MYSQL_USER", "root"),
-    password=os.getenv("MYSQL_PASSWORD", ""),
-    database=os.getenv("MYSQL_DB", "chatapp"),
-    autocommit=True,
-)
+# mysql (por defecto) | sqlite | memory
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mysql")
+POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "10"))
+# aplica las migraciones pendientes al arrancar; 0 si el esquema lo administra otro proceso
+DB_MIGRATE = os.getenv("DB_MIGRATE", "1") == "1"
+MEMBERSHIP_CACHE_CHATS = int(os.getenv("MEMBERSHIP_CACHE_CHATS", "10000"))
+MEMBERSHIP_CACHE_USERS = int(os.getenv("MEMBERSHIP_CACHE_USERS", "10000"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+# vigencia de un perfil cacheado: acota lo que puede atrasarse un cambio hecho en otro proceso
+PROFILE_CACHE_TTL_S = float(os.getenv("PROFILE_CACHE_TTL_S", "300"))
+# últimos mensajes de los chats activos; MESSAGE_CACHE_MB=0 lo desactiva
+MESSAGE_CACHE_MB = float(os.getenv("MESSAGE_CACHE_MB", "64"))
+MESSAGE_CACHE_PER_CHAT = int(os.getenv("MESSAGE_CACHE_PER_CHAT", "200"))
+# índice de message:search en disco local (compartido por los workers); vacío lo desactiva
+MESSAGE_INDEX_PATH = os.getenv("MESSAGE_INDEX_PATH", "message_index.sqlite3")
+# mensajes más recientes que se puntúan por búsqueda (los que tienen la palabra menos frecuente)
+MESSAGE_SEARCH_SCAN = int(os.getenv("MESSAGE_SEARCH_SCAN", "5000"))
+# mensajes con más de ARCHIVE_AFTER_DAYS días pasan a segmentos comprimidos; 0 = no se archiva
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_SEGMENT_SIZE = int(os.getenv("ARCHIVE_SEGMENT_SIZE", "500"))
+
+_storage: Storage | None = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                storage = create_storage(STORAGE_BACKEND, pool_size=POOL_SIZE)
+                # con el archivo activo las lecturas de historial miran los segmentos de cada chat
+                storage.archive_enabled = ARCHIVE_AFTER_DAYS > 0
+                _storage = storage
+    return _storage
+
+
+def set_storage(storage: Storage):
+    # para benchmarks/soak tests: inyecta un backend ya construido
+    global _storage
+    with _storage_lock:
+        _storage = storage
+    membership.clear()
+    profiles.clear()
+    profile_ids.clear()
+    recent_messages.clear()
+
+
+def close_storage():
+    # al detener el servidor; si el backend no llegó a crearse no hay nada que cerrar
+    global _storage
+    with _storage_lock:
+        storage, _storage = _storage, None
+    if storage is not None:
+        storage.close()
+
+
+def migrate() -> list[int]:
+    # conexión propia y de corta vida: corre antes de crear pools, workers y procesos de bcrypt
+    storage = create_storage(STORAGE_BACKEND, pool_size=1)
+    try:
+        return storage.migrate()
+    finally:
+        storage.close()
 
 
-def conn():
-    return _pool.get_connection()
+def check_plans() -> list[str]:
+    return _check_plans(get_storage())
 
 
-# ---------------- USERS ----------------
-def create_user(username: str, displayName: str, email: str | None, password_hash: str) -> dict:
-    user_id = str(uuid.uuid4())
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute(
-            "INSERT INTO users (id, username, email, displayName, password_hash, status) "
-            "VALUES (%s,%s,%s,%s,%s,'offline')",
-            (user_id, username, email, displayName, password_hash),
-        )
-        return {
-            "id": user_id,
-            "username": username,
-            "displayName": displayName,
-            "email": email,
-            "avatarUrl": None,
-            "status": "offline",
-        }
-    finally:
-        c.close()
+# ---------------- PERFILES PÚBLICOS (cacheados) ----------------
+# userId -> usuario público; el estado se actualiza por escritura
+profiles = LRUCache(PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL_S)
+# username -> userId (el username no cambia)
+profile_ids = LRUCache(PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL_S)
 
 
-def get_user_by_username(username: str) -> dict | None:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute("SELECT * FROM users WHERE username=%s LIMIT 1", (username,))
-        return cur.fetchone()
-    finally:
-        c.close()
+def get_user_public_by_id(user_id: str) -> dict | None:
+    u = profiles.get(user_id)
+    if u is None:
+        u = get_storage().get_user_public_by_id(user_id)
+        if u is None:
+            return None
+        profiles.put(user_id, u)
+    return dict(u)
 
 
-# Alias legacy
-find_user_by_username = get_user_by_username
+def get_user_public_by_username(username: str) -> dict | None:
+    user_id = profile_ids.get(username)
+    if user_id is not None:
+        return get_user_public_by_id(user_id)
+    u = get_storage().get_user_public_by_username(username)
+    if u is None:
+        return None
+    profiles.put(u["id"], u)
+    profile_ids.put(username, u["id"])
+    return dict(u)
+
+
+def get_users_public_by_ids(user_ids: list[str]) -> dict[str, dict]:
+    # lo que no está en caché se lee en una sola consulta
+    found, missing = {}, []
+    for user_id in dict.fromkeys(user_ids):
+        u = profiles.get(user_id)
+        if u is None:
+            missing.append(user_id)
+        else:
+            found[user_id] = dict(u)
+    if missing:
+        for user_id, u in get_storage().get_users_public_by_ids(missing).items():
+            profiles.put(user_id, u)
+            found[user_id] = dict(u)
+    return found
+
+
+def cached_user_public(user_id: str) -> dict | None:
+    # solo memoria: sin pasar por el executor de DB
+    u = profiles.get(user_id)
+    return dict(u) if u is not None else None
 
 
-def get_user_by_email(email: str) -> dict | None:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute("SELECT * FROM users WHERE email=%s LIMIT 1", (email,))
-        return cur.fetchone()
-    finally:
-        c.close()
+def set_user_status(user_id: str, status: str):
+    get_storage().set_user_status(user_id, status)
+    _cache_status(user_id, status)
 
 
-def get_user_by_id(user_id: str) -> dict | None:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute("SELECT * FROM users WHERE id=%s LIMIT 1", (user_id,))
-        return cur.fetchone()
-    finally:
-        c.close()
+def set_users_status(statuses: dict[str, str]):
+    get_storage().set_users_status(statuses)
+    cache_users_status(statuses)
 
 
-def set_user_status(user_id: str, status: str):
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute("UPDATE users SET status=%s WHERE id=%s", (status, user_id))
-    finally:
-        c.close()
+def cache_users_status(statuses: dict[str, str]):
+    # también para cambios anunciados por otros workers (ya guardados por ellos)
+    for user_id, status in statuses.items():
+        _cache_status(user_id, status)
 
 
-def _to_public_user(row: dict) -> dict:
-    return {
-        "id": row["id"],
-        "username": row["username"],
-        "displayName": row.get("displayName"),
-        "avatarUrl": row.get("avatarUrl"),
-        "status": row.get("status", "offline"),
-    }
+def _cache_status(user_id: str, status: str):
+    u = profiles.peek(user_id)
+    if u is not None and u.get("status") != status:
+        profiles.put(user_id, {**u, "status": status})
 
 
-def get_user_public_by_username(username: str) -> dict | None:
-    u = get_user_by_username(username)
-    return _to_public_user(u) if u else None
+# ---------------- MEMBRESÍAS (cacheadas) ----------------
+membership = MembershipCache(max_chats=MEMBERSHIP_CACHE_CHATS, max_users=MEMBERSHIP_CACHE_USERS)
 
 
-def get_user_public_by_id(user_id: str) -> dict | None:
-    u = get_user_by_id(user_id)
-    return _to_public_user(u) if u else None
+def user_is_member(chat_id: str, user_id: str) -> bool:
+    return membership.is_member(chat_id, user_id, get_storage().list_user_ids_for_chat)
 
 
-# ---------------- CHATS ----------------
-def _get_last_message_for_chat(chat_id: str) -> dict | None:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute(
-            """
-            SELECT id, chatId, senderId, kind, content, createdAt
-            FROM messages
-            WHERE chatId=%s
-            ORDER BY createdAt DESC
-            LIMIT 1
-            """,
-            (chat_id,),
-        )
-        return cur.fetchone()
-    finally:
-        c.close()
+def list_user_ids_for_chat(chat_id: str) -> list[str]:
+    return list(membership.members(chat_id, get_storage().list_user_ids_for_chat))
 
 
-def list_members_for_chat(chat_id: str) -> list[dict]:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute(
-            """
-            SELECT u.id, u.username, u.displayName, u.avatarUrl, u.status
-            FROM chat_members cm
-            JOIN users u ON u.id = cm.userId
-            WHERE cm.chatId=%s
-            """,
-            (chat_id,),
-        )
-        rows = cur.fetchall() or []
-        return [_to_public_user(r) for r in rows]
-    finally:
-        c.close()
+def list_chat_ids_for_user(user_id: str) -> list[str]:
+    return list(membership.chats(user_id, get_storage().list_chat_ids_for_user))
+
+
+def list_related_user_ids(user_id: str) -> list[str]:
+    return list(membership.contacts(user_id, get_storage().list_related_user_ids))
 
 
-def _hydrate_chat_for_user(base_chat: dict, user_id: str) -> dict:
-    chat = {
-        "id": base_chat["id"],
-        "type": base_chat["type"],
-        "title": base_chat["title"],
-        "description": base_chat.get("description"),
-    }
+def related_user_ids_many(user_ids: list[str]) -> dict[str, frozenset]:
+    # grafo de contactos de varios usuarios en una sola llamada al executor
+    load = get_storage().list_related_user_ids
+    return {uid: membership.contacts(uid, load) for uid in user_ids}
 
-    members = list_members_for_chat(base_chat["id"])
-    chat["members"] = members
 
-    if chat["type"] == "direct":
-        other = next((m for m in members if m["id"] != user_id), None)
-        if other:
-            chat["title"] = other.get("displayName") or other.get("username") or chat["title"]
+def add_chat_member(chat_id: str, user_id: str, role: str = "member"):
+    get_storage().add_chat_member(chat_id, user_id, role=role)
+    membership.add_member(chat_id, user_id)
 
-    last_message = _get_last_message_for_chat(base_chat["id"])
-    if last_message:
-        chat["lastMessage"] = last_message
 
+def create_group_chat(title: str, description: str | None, owner_id: str) -> dict:
+    chat = get_storage().create_group_chat(title=title, description=description, owner_id=owner_id)
+    membership.chat_created(chat["id"], [owner_id])
     return chat
 
 
-def list_chats_for_user(user_id: str) -> list[dict]:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute(
-            """
-            SELECT ch.id, ch.type, ch.title, ch.description
-            FROM chats ch
-            JOIN chat_members cm ON cm.chatId = ch.id
-            WHERE cm.userId = %s
-            ORDER BY ch.created_at DESC
-            """,
-            (user_id,),
-        )
-        rows = cur.fetchall() or []
-    finally:
-        c.close()
+def create_direct_chat(a: str, b: str) -> dict:
+    chat = get_storage().create_direct_chat(a, b)
+    membership.chat_created(chat["id"], [a, b])
+    return chat
 
-    chats = [_hydrate_chat_for_user(row, user_id) for row in rows]
 
-    chats.sort(
-        key=lambda ch: ch.get("lastMessage", {}).get("createdAt", 0),
-        reverse=True,
-    )
-    return chats
+# ---------------- BÚSQUEDA DE USUARIOS ----------------
+# índice por prefijo de username/displayName; se carga al arrancar y crece con cada registro
+user_index = UserIndex()
 
 
-def get_chat_for_user(chat_id: str, user_id: str) -> dict | None:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute(
-            """
-            SELECT ch.id, ch.type, ch.title, ch.description
-            FROM chats ch
-            JOIN chat_members cm ON cm.chatId = ch.id
-            WHERE ch.id=%s AND cm.userId=%s
-            LIMIT 1
-            """,
-            (chat_id, user_id),
-        )
-        row = cur.fetchone()
-    finally:
-        c.close()
+def create_user(username: str, displayName: str, email: str | None, password_hash: str) -> dict:
+    u = get_storage().create_user(username=username, displayName=displayName, email=email, password_hash=password_hash)
+    user_index.add(u["id"], u["username"], u.get("displayName"))
+    return u
 
-    return _hydrate_chat_for_user(row, user_id) if row else None
 
+def load_user_index(batch_size: int = 5000) -> int:
+    # recorre users por id en lotes (keyset) con solo las 3 columnas del índice
+    storage = get_storage()
 
-def user_is_member(chat_id: str, user_id: str) -> bool:
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute(
-            "SELECT 1 FROM chat_members WHERE chatId=%s AND userId=%s LIMIT 1",
-            (chat_id, user_id),
-        )
-        return cur.fetchone() is not None
-    finally:
-        c.close()
+    def rows():
+        last_id = ""
+        while True:
+            batch = storage.list_users_brief(after_id=last_id, limit=batch_size)
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1]["id"]
 
+    user_index.build(rows())
+    return len(user_index)
 
-def list_related_user_ids(user_id: str) -> list[str]:
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute(
-            """
-            SELECT DISTINCT cm2.userId
-            FROM chat_members cm1
-            JOIN chat_members cm2 ON cm2.chatId = cm1.chatId
-            WHERE cm1.userId = %s
-            """,
-            (user_id,),
-        )
-        rows = cur.fetchall() or []
-        return [r[0] for r in rows]
-    finally:
-        c.close()
 
+# ---------------- MENSAJES RECIENTES (cacheados) ----------------
+recent_messages = MessageCache(per_chat=MESSAGE_CACHE_PER_CHAT, max_bytes=int(MESSAGE_CACHE_MB * 2**20))
 
-def list_user_ids_for_chat(chat_id: str) -> list[str]:
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute("SELECT userId FROM chat_members WHERE chatId=%s", (chat_id,))
-        rows = cur.fetchall() or []
-        return [r[0] for r in rows]
-    finally:
-        c.close()
 
+def save_messages(messages: list[dict]):
+    get_storage().save_messages(messages)
+    record_saved_messages(messages)
 
-def add_chat_member(chat_id: str, user_id: str, role: str = "member"):
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute(
-            "INSERT IGNORE INTO chat_members (chatId, userId, role) VALUES (%s,%s,%s)",
-            (chat_id, user_id, role),
-        )
-    finally:
-        c.close()
 
+def record_saved_messages(messages: list[dict]):
+    # lo que sigue a un commit: caché de rooms calientes e índice de búsqueda
+    recent_messages.add(messages)
+    _index_messages(messages)
 
-def create_group_chat(title: str, description: str | None, owner_id: str) -> dict:
-    chat_id = str(uuid.uuid4())
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute(
-            "INSERT INTO chats (id, type, title, description) VALUES (%s,'group',%s,%s)",
-            (chat_id, title, description),
-        )
-        cur.execute(
-            "INSERT INTO chat_members (chatId, userId, role) VALUES (%s,%s,'owner')",
-            (chat_id, owner_id),
-        )
-    finally:
-        c.close()
-    return get_chat_for_user(chat_id, owner_id)
 
+def saved_message_seqs(messages: list[dict]) -> dict[str, int]:
+    """{id: seq} de los que ya están guardados (reintento del MessageWriter tras un error).
 
-def find_direct_chat_between(a: str, b: str) -> dict | None:
-    c = conn()
-    try:
-        cur = c.cursor(dictionary=True)
-        cur.execute(
-            """
-            SELECT ch.id, ch.type, ch.title, ch.description
-            FROM chats ch
-            JOIN chat_members cm1 ON cm1.chatId = ch.id AND cm1.userId = %s
-            JOIN chat_members cm2 ON cm2.chatId = ch.id AND cm2.userId = %s
-            WHERE ch.type='direct'
-            LIMIT 1
-            """,
-            (a, b),
-        )
-        row = cur.fetchone()
-    finally:
-        c.close()
+    Si save_messages falló después del COMMIT no llegó a record_saved_messages: los
+    encontrados pasan por ahí con el seq recuperado.
+    """
+    saved = get_storage().saved_message_seqs(messages)
+    found = [m for m in messages if m["id"] in saved]
+    for m in found:
+        m["seq"] = saved[m["id"]]
+    if found:
+        record_saved_messages(found)
+    return saved
 
-    return _hydrate_chat_for_user(row, a) if row else None
 
+def save_message(chat_id: str, sender_id: str, kind: str, content: str) -> dict:
+    msg = get_storage().save_message(chat_id, sender_id, kind, content)
+    recent_messages.add([msg])
+    _index_messages([msg])
+    return msg
 
-def create_direct_chat(a: str, b: str) -> dict:
-    chat_id = str(uuid.uuid4())
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute(
-            "INSERT INTO chats (id, type, title, description) VALUES (%s,'direct','',NULL)",
-            (chat_id,),
-        )
-        cur.execute("INSERT INTO chat_members (chatId, userId, role) VALUES (%s,%s,'member')", (chat_id, a))
-        cur.execute("INSERT INTO chat_members (chatId, userId, role) VALUES (%s,%s,'member')", (chat_id, b))
-    finally:
-        c.close()
 
-    return get_chat_for_user(chat_id, a)
+def _load_recent(chat_ids: list[str], n: int) -> dict[str, list[dict]]:
+    return get_storage().list_messages_many(dict.fromkeys(chat_ids), n)
 
 
-# ---------------- MESSAGES ----------------
-def save_message(chat_id: str, sender_id: str, kind: str, content: str) -> dict:
-    msg_id = str(uuid.uuid4())
-    created_ms = int(time.time() * 1000)
-    c = conn()
-    try:
-        cur = c.cursor()
-        cur.execute(
-            "INSERT INTO messages (id, chatId, senderId, kind, content, createdAt) VALUES (%s,%s,%s,%s,%s,%s)",
-            (msg_id, chat_id, sender_id, kind, content, created_ms),
-        )
-        return {
-            "id": msg_id,
-            "chatId": chat_id,
-            "senderId": sender_id,
-            "kind": kind,
-            "content": content,
-            "createdAt": created_ms,
-        }
-    finally:
-        c.close()
+def list_messages_page(
+    chat_id: str,
+    before: tuple[int, str] | None = None,
+    after: tuple[int, str] | None = None,
+    limit: int = 50,
+) -> list[dict]:
+    page = recent_messages.page(chat_id, before=before, after=after, limit=limit)
+    if page is not None:
+        return page
+    if recent_messages.enabled and before is None and after is None and limit <= recent_messages.per_chat:
+        # la página más reciente trae la ventana completa y deja el chat en caché
+        return recent_messages.load([chat_id], _load_recent)[chat_id][-limit:]
+    return get_storage().list_messages_page(chat_id, before=before, after=after, limit=limit)
 
 
 def list_messages(chat_id: str, limit: int = 150) -> list[dict]:
-    c = conn()
+    return list_messages_page(chat_id, limit=limit)
+
+
+def list_messages_many(pages: dict[str, tuple[int, str] | None], limit: int) -> dict[str, list[dict]]:
+    out: dict[str, list[dict]] = {}
+    missing: dict[str, tuple[int, str] | None] = {}
+    for chat_id, after in pages.items():
+        page = recent_messages.page(chat_id, after=after, limit=limit)
+        if page is None:
+            missing[chat_id] = after
+        else:
+            out[chat_id] = page
+    latest = [cid for cid, after in missing.items() if after is None]
+    if recent_messages.enabled and latest and limit <= recent_messages.per_chat:
+        for chat_id, msgs in recent_messages.load(latest, _load_recent).items():
+            out[chat_id] = msgs[-limit:]
+        missing = {cid: after for cid, after in missing.items() if after is not None}
+    if missing:
+        out.update(get_storage().list_messages_many(missing, limit))
+    return out
+
+
+# ---------------- BÚSQUEDA DE MENSAJES ----------------
+message_index = MessageIndex(MESSAGE_INDEX_PATH, scan_limit=MESSAGE_SEARCH_SCAN)
+
+
+def _index_messages(messages: list[dict]):
+    # los mensajes ya están guardados: ningún fallo del índice (disco, archivo dañado, un bug)
+    # debe volver al que los guardó; se recupera con rebuild-message-index
     try:
-        cur = c.cursor(dictionary=True)
-        cur.execute(
-            """
-            SELECT id, chatId, senderId, kind, content, createdAt
-            FROM messages
-            WHERE chatId=%s
-            ORDER BY createdAt DESC
-            LIMIT %s
-            """,
-            (chat_id, limit),
-        )
-        rows = cur.fetchall() or []
-        rows.reverse()
-        return rows
-    finally:
-        c.close()
+        message_index.add(messages)
+    except Exception as e:
+        print(f"[Search] no se pudieron indexar {len(messages)} mensajes: {type(e).__name__}: {e}")
+
+
+def search_messages(user_id: str, query: str, limit: int, offset: int = 0, chat_id: str | None = None):
+    # el alcance es la membresía actual, no la del momento en que se indexó el mensaje
+    chat_ids = list_chat_ids_for_user(user_id)
+    if chat_id is not None:
+        chat_ids = [chat_id] if chat_id in chat_ids else []
+    return message_index.search(query, chat_ids, limit, offset)
+
+
+def rebuild_message_index(batch_size: int = 1000, force: bool = False) -> int | None:
+    """Reconstruye el índice desde messages y los segmentos archivados; None si no hacía falta
+    o si otro proceso ya lo está haciendo."""
+    if force:
+        message_index.invalidate()
+    if not message_index.claim_rebuild():
+        return None
+    storage = get_storage()
+
+    def batches():
+        last_id = ""
+        while True:
+            batch = storage.scan_messages(after_id=last_id, limit=batch_size)
+            if not batch:
+                break
+            yield batch
+            last_id = batch[-1]["id"]
+        after = None
+        while True:
+            segments = storage.scan_archived(after=after, limit=max(1, batch_size // 100))
+            if not segments:
+                return
+            yield [m for s in segments for m in s["messages"]]
+            after = (segments[-1]["chatId"], segments[-1]["segment"])
+
+    return message_index.rebuild(batches())
+
+
+def archive_old_messages(days: float | None = None) -> int:
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    if days <= 0:
+        return 0
+    older_than = int((time.time() - days * 86400) * 1000)
+    return get_storage().archive_messages(older_than, segment_size=ARCHIVE_SEGMENT_SIZE)
+
+
+def __getattr__(name: str):
+    # db.create_user(...), db.list_messages(...), etc. delegan en el backend activo
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return getattr(get_storage(), name)
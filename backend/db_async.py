@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from dotenv import load_dotenv
+
+import db
+
+load_dotenv()
+
+# Máximo de llamadas pendientes (en cola + en ejecución) antes de rechazar
+DB_QUEUE_LIMIT = int(os.getenv("DB_QUEUE_LIMIT", "256"))
+# Timeout por llamada en segundos (0 = sin timeout)
+DB_CALL_TIMEOUT = float(os.getenv("DB_CALL_TIMEOUT", "5"))
+
+
+class DBBusyError(Exception):
+    pass
+
+
+class DBTimeoutError(Exception):
+    """La llamada no llegó a ejecutarse dentro del tiempo límite: no tuvo efecto."""
+
+
+class DBOutcomeUnknownError(DBTimeoutError):
+    """La llamada ya corría cuando venció el tiempo límite y sigue en su hilo.
+
+    Una escritura puede terminar confirmándose después: no se debe reintentar a
+    ciegas, sino verificar qué quedó guardado (ver MessageWriter).
+    """
+
+
+class DBExecutor:
+    """Ejecuta funciones bloqueantes de db.py en un pool de hilos acotado.
+
+    Un hilo no se puede interrumpir: al vencer el tiempo límite solo se abandona la
+    espera. Si la llamada seguía en cola se cancela y se lanza DBTimeoutError (no se
+    ejecutó); si ya estaba corriendo se lanza DBOutcomeUnknownError. `timeout=0`
+    espera sin límite, para escrituras cuyo resultado hay que conocer.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, timeout: float):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout or None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def _release(self, _fut):
+        # se llama desde el hilo que completa/cancela el future
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, timeout: float | None = None, **kwargs):
+        # timeout: None usa el del executor, 0 espera sin límite
+        timeout = self.timeout if timeout is None else (timeout or None)
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                self.rejected += 1
+                raise DBBusyError(f"Cola de DB llena ({self._pending})")
+            self._pending += 1
+            self.submitted += 1
+
+        cfut = self._pool.submit(partial(fn, *args, **kwargs))
+        # el slot se libera cuando el hilo termina, no cuando el await expira
+        cfut.add_done_callback(self._release)
+        afut = asyncio.wrap_future(cfut)
+
+        try:
+            return await asyncio.wait_for(afut, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            name = getattr(fn, "__name__", fn)
+            # cancel() solo tiene efecto si seguía en cola: entonces no llega a ejecutarse
+            if cfut.cancel():
+                raise DBTimeoutError(f"{name} excedió el tiempo límite")
+            if cfut.done():
+                # terminó justo al vencer: el resultado se conoce
+                return cfut.result()
+            raise DBOutcomeUnknownError(f"{name} excedió el tiempo límite y sigue en ejecución")
+        except asyncio.CancelledError:
+            cfut.cancel()
+            self.cancelled += 1
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "pending": pending,
+            "queueLimit": self.queue_limit,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncDB:
+    """Expone cada función de db.py como corrutina: `await adb.save_message(...)`."""
+
+    def __init__(self, executor: DBExecutor):
+        self.executor = executor
+
+    def __getattr__(self, name: str):
+        fn = getattr(db, name)
+        if not callable(fn):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.executor.run(fn, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+
+executor = DBExecutor(workers=db.POOL_SIZE, queue_limit=DB_QUEUE_LIMIT, timeout=DB_CALL_TIMEOUT)
+adb = AsyncDB(executor)
@@ -0,0 +1,146 @@
+import asyncio
+from collections import deque
+
+# qué hacer cuando la cola de salida de un socket está llena
+POLICIES = ("drop", "coalesce", "disconnect")
+
+
+class FanoutMetrics:
+    def __init__(self):
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.disconnected = 0
+        # frames en cola sumando todas las conexiones
+        self.depth = 0
+        self.max_depth = 0
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "slowConsumerDisconnects": self.disconnected,
+            "queuedFrames": self.depth,
+            "maxQueuedFrames": self.max_depth,
+        }
+
+
+class Outbox:
+    """Cola de salida acotada de un socket, drenada por su propia tarea escritora.
+
+    `put` nunca espera: un cliente lento solo retrasa su propia cola. Los frames con
+    `key` (p. ej. presencia de un usuario) representan estado; con la política
+    "coalesce" un frame nuevo reemplaza al pendiente con la misma clave, y con la cola
+    llena solo esos se descartan: un frame sin clave (message:receive, message:ack)
+    cierra la conexión, así el cliente reconecta y hace `sync` en lugar de perderlo.
+
+    La cola y la tarea escritora existen solo mientras hay frames pendientes, así una
+    conexión ociosa no retiene un deque ni una tarea.
+    """
+
+    __slots__ = (
+        "ws", "max_frames", "policy", "metrics", "_frames", "_keyed", "_task", "_closer", "closed", "sent", "dropped",
+    )
+
+    def __init__(self, ws, max_frames: int, policy: str, metrics: FanoutMetrics):
+        self.ws = ws
+        self.max_frames = max_frames
+        self.policy = policy
+        self.metrics = metrics
+        # cada entrada es [frame, key] para poder reemplazar el frame en su lugar
+        self._frames: deque[list] | None = None
+        self._keyed: dict[str, list] | None = None
+        self._task: asyncio.Task | None = None
+        self._closer: asyncio.Task | None = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._frames) if self._frames else 0
+
+    def put(self, frame: str, key: str | None = None) -> bool:
+        if self.closed:
+            return False
+
+        if key is not None and self.policy == "coalesce" and self._keyed:
+            pending = self._keyed.get(key)
+            if pending is not None:
+                pending[0] = frame
+                self.metrics.coalesced += 1
+                return True
+
+        if self._frames is None:
+            self._frames = deque()
+        elif len(self._frames) >= self.max_frames:
+            self.dropped += 1
+            if self.policy == "disconnect" or (self.policy == "coalesce" and key is None):
+                self.metrics.disconnected += 1
+                self.close(code=1013, reason="Cliente demasiado lento")
+            else:
+                self.metrics.dropped += 1
+            return False
+
+        entry = [frame, key]
+        self._frames.append(entry)
+        if key is not None:
+            if self._keyed is None:
+                self._keyed = {}
+            self._keyed[key] = entry
+        self.metrics.enqueued += 1
+        self.metrics.depth += 1
+        if self.metrics.depth > self.metrics.max_depth:
+            self.metrics.max_depth = self.metrics.depth
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return True
+
+    async def _run(self):
+        frames = self._frames
+        try:
+            while frames:
+                entry = frames.popleft()
+                self.metrics.depth -= 1
+                if entry[1] is not None and self._keyed.get(entry[1]) is entry:
+                    del self._keyed[entry[1]]
+                await self.ws.send(entry[0])
+                self.sent += 1
+                self.metrics.sent += 1
+        except asyncio.CancelledError:
+            return
+        except Exception:
+            # socket cerrado: el handler de la conexión hace la limpieza
+            self._discard()
+            return
+        # cola vacía: se liberan la cola y la tarea hasta el próximo frame
+        self._frames = None
+        self._keyed = None
+        self._task = None
+
+    def _discard(self):
+        self.closed = True
+        if self._frames:
+            self.metrics.depth -= len(self._frames)
+        self._frames = None
+        self._keyed = None
+
+    def close(self, code: int | None = None, reason: str = ""):
+        if self.closed:
+            return
+        self._discard()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if code is not None:
+            # con referencia: la tarea no la recoge el GC a medias y su error se retira al terminar
+            self._closer = asyncio.create_task(self.ws.close(code=code, reason=reason))
+            self._closer.add_done_callback(_close_done)
+
+
+def _close_done(task: asyncio.Task):
+    # retira el error de cerrar un socket que ya se cayó; la limpieza la hace el handler
+    if not task.cancelled():
+        task.exception()
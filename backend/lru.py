@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Diccionario acotado con expulsión LRU, seguro entre hilos y con contadores.
+
+    Con `ttl` (segundos) cada entrada vence ese tiempo después de guardarse.
+    """
+
+    def __init__(self, max_items: int, ttl: float | None = None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        # key -> vencimiento (time.monotonic), solo con ttl
+        self._expires: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _alive(self, key) -> bool:
+        # con el lock tomado; borra la entrada si ya venció
+        if self.ttl is None or self._expires.get(key, 0) > time.monotonic():
+            return True
+        del self._data[key]
+        self._expires.pop(key, None)
+        self.expired += 1
+        return False
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING or not self._alive(key):
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        # sin tocar orden ni contadores
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING or (self.ttl is not None and self._expires.get(key, 0) <= time.monotonic()):
+                return default
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.ttl is not None:
+                self._expires[key] = time.monotonic() + self.ttl
+            while len(self._data) > self.max_items:
+                old, _ = self._data.popitem(last=False)
+                self._expires.pop(old, None)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self._expires.pop(key, None)
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxItems": self.max_items,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hitRatio": round(self.hits / total, 4) if total else None,
+        }
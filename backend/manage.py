@@ -0,0 +1,74 @@
+import argparse
+
+import db
+
+
+def cmd_backfill_last_message(args):
+    n = db.backfill_last_message(batch_size=args.batch_size)
+    print(f"chats actualizados: {n}")
+
+
+def cmd_backfill_seq(args):
+    n = db.backfill_seq(batch_size=args.batch_size)
+    print(f"chats numerados: {n}")
+
+
+def cmd_archive(args):
+    n = db.archive_old_messages(days=args.days)
+    print(f"mensajes archivados: {n}")
+
+
+def cmd_rebuild_message_index(args):
+    n = db.rebuild_message_index(batch_size=args.batch_size, force=True)
+    if n is None:
+        print("otro proceso está reconstruyendo el índice")
+        raise SystemExit(1)
+    print(f"mensajes indexados: {n}")
+
+
+def cmd_migrate(args):
+    applied = db.migrate()
+    print(f"migraciones aplicadas: {applied or 'ninguna'}")
+
+
+def cmd_check_plans(args):
+    problems = db.check_plans()
+    for problem in problems:
+        print(problem)
+    if problems:
+        raise SystemExit(1)
+    print("sin recorridos completos en las consultas calientes")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tareas de mantenimiento de KaapehChat")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("backfill-last-message", help="recalcula chats.lastMessageId/lastMessageAt")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.set_defaults(func=cmd_backfill_last_message)
+
+    p = sub.add_parser("backfill-seq", help="numera messages.seq y fija chats.lastSeq")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.set_defaults(func=cmd_backfill_seq)
+
+    p = sub.add_parser("archive", help="mueve los mensajes viejos a segmentos comprimidos")
+    p.add_argument("--days", type=float, default=None, help="antigüedad mínima (por defecto ARCHIVE_AFTER_DAYS)")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("rebuild-message-index", help="reconstruye el índice local de message:search")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_rebuild_message_index)
+
+    p = sub.add_parser("migrate", help="crea/actualiza tablas e índices (MySQL)")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("check-plans", help="EXPLAIN de las consultas calientes; falla si alguna recorre una tabla")
+    p.set_defaults(func=cmd_check_plans)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import threading
+from typing import Callable, Iterable
+
+from lru import LRUCache
+
+
+class MembershipCache:
+    """Membresías chat <-> usuario en memoria.
+
+    Guarda tres índices con expulsión LRU: chatId -> {userId}, userId -> {chatId} y
+    userId -> {contactos} (usuarios con los que comparte algún chat). Se llenan de forma perezosa con la función `load` que recibe cada consulta y se
+    actualizan por escritura (write-through) desde db.py cuando cambian las membresías.
+    """
+
+    def __init__(self, max_chats: int, max_users: int):
+        self._chat_members = LRUCache(max_chats)
+        self._user_chats = LRUCache(max_users)
+        self._contacts = LRUCache(max_users)
+        self._lock = threading.Lock()
+        # cambia con cada escritura: una carga que empezó antes no debe guardar datos viejos
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, cache: LRUCache, key: str, load: Callable[[str], Iterable[str]]) -> frozenset:
+        version = self._version
+        value = frozenset(load(key))
+        with self._lock:
+            self.misses += 1
+            if version == self._version:
+                cache.put(key, value)
+        return value
+
+    def members(self, chat_id: str, load: Callable[[str], Iterable[str]]) -> frozenset:
+        value = self._chat_members.get(chat_id)
+        if value is None:
+            return self._load(self._chat_members, chat_id, load)
+        self.hits += 1
+        return value
+
+    def chats(self, user_id: str, load: Callable[[str], Iterable[str]]) -> frozenset:
+        value = self._user_chats.get(user_id)
+        if value is None:
+            return self._load(self._user_chats, user_id, load)
+        self.hits += 1
+        return value
+
+    def contacts(self, user_id: str, load: Callable[[str], Iterable[str]]) -> frozenset:
+        value = self._contacts.get(user_id)
+        if value is None:
+            return self._load(self._contacts, user_id, load)
+        self.hits += 1
+        return value
+
+    def is_member(self, chat_id: str, user_id: str, load_members: Callable[[str], Iterable[str]]) -> bool:
+        # si ya conocemos los chats del usuario no hace falta cargar el chat
+        user_chats = self._user_chats.peek(user_id)
+        if user_chats is not None:
+            self.hits += 1
+            return chat_id in user_chats
+        return user_id in self.members(chat_id, load_members)
+
+    def add_member(self, chat_id: str, user_id: str):
+        with self._lock:
+            self._version += 1
+            members = self._chat_members.peek(chat_id)
+            if members is not None:
+                self._chat_members.put(chat_id, members | {user_id})
+            user_chats = self._user_chats.peek(user_id)
+            if user_chats is not None:
+                self._user_chats.put(user_id, user_chats | {chat_id})
+            # el nuevo miembro pasa a ser contacto de todos los del chat
+            if members is None:
+                self._contacts.clear()
+            else:
+                self._contacts.pop(user_id)
+                for other in members:
+                    self._contacts.pop(other)
+
+    def chat_created(self, chat_id: str, member_ids: Iterable[str]):
+        member_ids = frozenset(member_ids)
+        with self._lock:
+            self._version += 1
+            self._chat_members.put(chat_id, member_ids)
+            for user_id in member_ids:
+                user_chats = self._user_chats.peek(user_id)
+                if user_chats is not None:
+                    self._user_chats.put(user_id, user_chats | {chat_id})
+                contacts = self._contacts.peek(user_id)
+                if contacts is not None:
+                    self._contacts.put(user_id, contacts | member_ids)
+
+    def invalidate_chat(self, chat_id: str):
+        with self._lock:
+            self._version += 1
+            members = self._chat_members.pop(chat_id)
+            if members is None:
+                self._contacts.clear()
+            for user_id in members or ():
+                self._user_chats.pop(user_id)
+                self._contacts.pop(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._chat_members.clear()
+            self._user_chats.clear()
+            self._contacts.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / total, 4) if total else None,
+            "chats": self._chat_members.stats(),
+            "users": self._user_chats.stats(),
+            "contacts": self._contacts.stats(),
+        }
@@ -0,0 +1,171 @@
+import bisect
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+
+def _position(msg: dict) -> tuple[int, str]:
+    return msg["createdAt"], msg["id"]
+
+
+def _size(msg: dict) -> int:
+    # aproximado: el dict más sus valores (las claves son literales compartidos)
+    return sys.getsizeof(msg) + sum(sys.getsizeof(v) for v in msg.values())
+
+
+class _Ring:
+    __slots__ = ("messages", "complete", "bytes")
+
+    def __init__(self, messages: list[dict], complete: bool):
+        # últimos mensajes del chat en orden (createdAt, id); complete: no hay más antiguos
+        self.messages = messages
+        self.complete = complete
+        self.bytes = sum(_size(m) for m in messages)
+
+
+class MessageCache:
+    """Últimos `per_chat` mensajes de los chats activos, en memoria.
+
+    Un chat entra al caché cuando se lee su página más reciente y desde ahí se
+    mantiene por escritura (write-through) con cada lote guardado. `page` responde
+    las páginas de historial que caen dentro de la ventana cacheada y devuelve None
+    en otro caso. La memoria total se acota a `max_bytes` expulsando los chats menos
+    usados.
+    """
+
+    def __init__(self, per_chat: int, max_bytes: int):
+        self.per_chat = per_chat
+        self.max_bytes = max_bytes
+        self._rings: OrderedDict[str, _Ring] = OrderedDict()
+        self._lock = threading.Lock()
+        # chatId -> [cargas en curso, hubo escrituras]: una carga que vio datos viejos no se guarda
+        self._loading: dict[str, list] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.per_chat > 0
+
+    def page(
+        self,
+        chat_id: str,
+        before: tuple[int, str] | None = None,
+        after: tuple[int, str] | None = None,
+        limit: int = 50,
+    ) -> list[dict] | None:
+        # misma semántica que Storage.list_messages_page
+        with self._lock:
+            ring = self._rings.get(chat_id)
+            page = self._slice(ring, before, after, limit) if ring is not None else None
+            if page is None:
+                self.misses += 1
+                return None
+            self._rings.move_to_end(chat_id)
+            self.hits += 1
+        return [dict(m) for m in page]
+
+    @staticmethod
+    def _slice(ring: _Ring, before, after, limit: int) -> list[dict] | None:
+        msgs = ring.messages
+        if after is not None:
+            if not ring.complete and (not msgs or after < _position(msgs[0])):
+                return None
+            start = bisect.bisect_right(msgs, after, key=_position)
+            return msgs[start:start + limit]
+        end = bisect.bisect_left(msgs, before, key=_position) if before is not None else len(msgs)
+        if end - limit < 0 and not ring.complete:
+            return None
+        return msgs[max(0, end - limit):end]
+
+    def load(self, chat_ids: list[str], fetch: Callable[[list[str], int], dict[str, list[dict]]]) -> dict[str, list[dict]]:
+        """Lee de la DB los últimos per_chat mensajes de cada chat y los deja en caché.
+
+        `fetch(chat_ids, n)` hace la lectura; su resultado se devuelve tal cual. Si
+        durante la lectura se guardó un mensaje de un chat, ese chat no se cachea.
+        """
+        with self._lock:
+            for chat_id in chat_ids:
+                self._loading.setdefault(chat_id, [0, False])[0] += 1
+        loaded = None
+        try:
+            loaded = fetch(chat_ids, self.per_chat)
+        finally:
+            with self._lock:
+                for chat_id in chat_ids:
+                    loading = self._loading[chat_id]
+                    loading[0] -= 1
+                    if loading[0] == 0:
+                        del self._loading[chat_id]
+                    if loaded is not None and not loading[1] and chat_id not in self._rings:
+                        self._put(chat_id, loaded.get(chat_id, []))
+                self._evict()
+        return loaded
+
+    def _put(self, chat_id: str, messages: list[dict]):
+        ring = _Ring([dict(m) for m in messages], complete=len(messages) < self.per_chat)
+        self._rings[chat_id] = ring
+        self.bytes += ring.bytes
+
+    def add(self, messages: list[dict]):
+        # write-through: solo los chats ya cacheados; los que se están cargando se marcan
+        if not self.enabled:
+            return
+        with self._lock:
+            for m in messages:
+                loading = self._loading.get(m["chatId"])
+                if loading is not None:
+                    loading[1] = True
+                ring = self._rings.get(m["chatId"])
+                if ring is None:
+                    continue
+                msgs = ring.messages
+                i = bisect.bisect_left(msgs, _position(m), key=_position)
+                if i < len(msgs) and msgs[i]["id"] == m["id"]:
+                    continue
+                row = dict(m)
+                msgs.insert(i, row)
+                ring.bytes += _size(row)
+                self.bytes += _size(row)
+                while len(msgs) > self.per_chat:
+                    dropped = _size(msgs.pop(0))
+                    ring.bytes -= dropped
+                    self.bytes -= dropped
+                    ring.complete = False
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._rings:
+            _, ring = self._rings.popitem(last=False)
+            self.bytes -= ring.bytes
+            self.evictions += 1
+
+    def discard(self, chat_id: str):
+        with self._lock:
+            ring = self._rings.pop(chat_id, None)
+            if ring is not None:
+                self.bytes -= ring.bytes
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            messages = sum(len(r.messages) for r in self._rings.values())
+        total = self.hits + self.misses
+        return {
+            "chats": len(self._rings),
+            "messages": messages,
+            "bytes": self.bytes,
+            "maxBytes": self.max_bytes,
+            "perChat": self.per_chat,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRatio": round(self.hits / total, 4) if total else None,
+        }
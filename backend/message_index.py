@@ -0,0 +1,355 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from user_index import fold
+
+# sube al cambiar la tokenización: un índice con otra versión se reconstruye
+INDEX_VERSION = "1"
+# un constructor sin latido en este tiempo se da por muerto y otro proceso toma la reconstrucción
+BUILD_STALE_MS = 60_000
+# BM25
+_K1, _B = 1.2, 0.75
+
+_WORD = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id TEXT PRIMARY KEY,
+    chatId TEXT NOT NULL,
+    senderId TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    content TEXT NOT NULL,
+    createdAt INTEGER NOT NULL,
+    seq INTEGER,
+    length INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    chatId TEXT NOT NULL,
+    createdAt INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chatId, createdAt, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+
+def tokenize(text: str) -> list[str]:
+    # mismas reglas que user:search: minúsculas y sin acentos ("Canción" == "cancion")
+    return [t[:32] for t in _WORD.findall(fold(text)) if len(t) >= 2]
+
+
+class MessageIndex:
+    """Índice invertido de mensajes de texto en un archivo SQLite local.
+
+    `postings` guarda (término, chatId, createdAt, id) ordenado: las búsquedas leen
+    solo los rangos de los chats del usuario. `docs` guarda una copia del mensaje,
+    así los resultados no dependen de que siga en `messages` (puede estar archivado).
+    Se mantiene con `add` en cada lote guardado; `rebuild` lo reconstruye desde la DB
+    en una pasada por lotes. Varios workers pueden compartir el mismo archivo.
+
+    Las escrituras van por una sola conexión protegida por `_lock`; cada hilo que
+    busca usa su propia conexión de lectura, así con WAL una búsqueda no espera a un
+    lote ni a la reconstrucción.
+    """
+
+    def __init__(self, path: str, scan_limit: int = 5000):
+        self.path = path
+        self.scan_limit = scan_limit
+        # solo para escribir: las lecturas no lo toman
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self.ready = False
+        self._closed = False
+        self._building = False
+        self.searches = 0
+        self.added = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _open(self) -> sqlite3.Connection:
+        c = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        c.executescript(SCHEMA)
+        return c
+
+    def _db(self) -> sqlite3.Connection:
+        # conexión de escritura, con _lock tomado; se abre al primer uso (cada proceso la suya)
+        if self._conn is None:
+            self._conn = self._open()
+        return self._conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # una conexión de lectura por hilo (los del executor se reutilizan)
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = self._open()
+            self._local.conn = c
+            with self._readers_lock:
+                self._readers.append(c)
+        return c
+
+    def _meta(self, c: sqlite3.Connection, key: str) -> str | None:
+        row = c.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(c: sqlite3.Connection, values: dict):
+        c.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(k, str(v)) for k, v in values.items()],
+        )
+
+    def check_ready(self) -> bool:
+        # otro worker pudo terminar la reconstrucción: se relee del archivo mientras no esté listo
+        if not self.ready and self.enabled:
+            c = self._reader()
+            self.ready = self._meta(c, "ready") == "1" and self._meta(c, "version") == INDEX_VERSION
+        return self.ready
+
+    # ---------------- ESCRITURA ----------------
+    def add(self, messages: list[dict]) -> int:
+        """Indexa los mensajes de texto que falten; devuelve cuántos entraron."""
+        docs = [m for m in messages if m.get("kind", "text") == "text" and m.get("content")]
+        if not docs or not self.enabled or self._closed:
+            return 0
+        with self._lock:
+            c = self._db()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                added = self._insert(c, docs)
+                c.execute("COMMIT")
+            except BaseException:
+                c.execute("ROLLBACK")
+                raise
+            self.added += added
+        return added
+
+    @staticmethod
+    def _insert(c: sqlite3.Connection, docs: list[dict]) -> int:
+        added, tokens, postings, df = 0, 0, [], Counter()
+        for m in docs:
+            terms = Counter(tokenize(m["content"]))
+            cur = c.execute(
+                "INSERT OR IGNORE INTO docs (id, chatId, senderId, kind, content, createdAt, seq, length) "
+                "VALUES (?,?,?,?,?,?,?,?)",
+                (m["id"], m["chatId"], m["senderId"], m["kind"], m["content"], m["createdAt"], m.get("seq"),
+                 sum(terms.values())),
+            )
+            if not cur.rowcount:
+                # ya estaba (otro worker o una reconstrucción en curso)
+                continue
+            added += 1
+            tokens += sum(terms.values())
+            for term, tf in terms.items():
+                postings.append((term, m["chatId"], m["createdAt"], m["id"], tf))
+                df[term] += 1
+        if not added:
+            return 0
+        c.executemany("INSERT OR IGNORE INTO postings (term, chatId, createdAt, id, tf) VALUES (?,?,?,?,?)", postings)
+        c.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            list(df.items()),
+        )
+        # totales para idf y el largo promedio de BM25
+        c.execute(
+            "INSERT INTO meta (key, value) VALUES ('docs', ?), ('tokens', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + CAST(excluded.value AS INTEGER)",
+            (added, tokens),
+        )
+        return added
+
+    def claim_rebuild(self) -> bool:
+        """True si este proceso debe reconstruir: el índice no está listo y nadie más lo hace."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            c = self._db()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                if self._meta(c, "ready") == "1" and self._meta(c, "version") == INDEX_VERSION:
+                    c.execute("COMMIT")
+                    self.ready = True
+                    return False
+                now = int(time.time() * 1000)
+                heartbeat = int(self._meta(c, "heartbeat") or 0)
+                if self._meta(c, "builder") not in (None, "", str(os.getpid())) and now - heartbeat < BUILD_STALE_MS:
+                    c.execute("COMMIT")
+                    return False
+                for table in ("docs", "postings", "terms", "meta"):
+                    c.execute(f"DELETE FROM {table}")
+                self._set_meta(c, {"builder": os.getpid(), "heartbeat": now, "ready": "0"})
+                c.execute("COMMIT")
+                self._building = True
+                return True
+            except BaseException:
+                c.execute("ROLLBACK")
+                raise
+
+    def invalidate(self):
+        # fuerza la reconstrucción en el próximo claim_rebuild (manage.py rebuild-message-index)
+        with self._lock:
+            self._set_meta(self._db(), {"ready": "0", "builder": ""})
+            self.ready = False
+
+    def rebuild(self, batches) -> int:
+        """Llena el índice desde `batches` (iterable de listas de mensajes); llamar tras claim_rebuild.
+
+        Los mensajes guardados durante la pasada entran por `add` y no se duplican. Si
+        falla, la reconstrucción queda libre para el próximo claim_rebuild (de este u
+        otro proceso) sin esperar BUILD_STALE_MS.
+        """
+        total = 0
+        try:
+            for batch in batches:
+                total += self.add(batch)
+                with self._lock:
+                    if self._closed:
+                        # el proceso se detiene: la reconstrucción se repite en el próximo arranque
+                        return total
+                    self._set_meta(self._db(), {"heartbeat": int(time.time() * 1000)})
+        except BaseException:
+            self._release_build()
+            raise
+        with self._lock:
+            if self._closed:
+                return total
+            c = self._db()
+            self._set_meta(c, {"ready": "1", "version": INDEX_VERSION, "builder": ""})
+            self.ready = True
+            self._building = False
+        return total
+
+    # ---------------- BÚSQUEDA ----------------
+    def search(self, query: str, chat_ids: list[str], limit: int, offset: int = 0) -> tuple[list[dict], bool]:
+        """Mensajes de `chat_ids` que contienen todas las palabras de `query`, los más relevantes primero.
+
+        La última palabra cuenta como prefijo si tiene 3 letras o más y la consulta no
+        termina en espacio ("canci" encuentra "canción"). Se puntúa con BM25 y a igual
+        puntaje va primero el más nuevo. Se consideran los `scan_limit` mensajes más
+        recientes que contienen la palabra menos frecuente. Devuelve (página, hay más).
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words or not chat_ids or limit <= 0:
+            return [], False
+        prefix = words[-1] if len(words[-1]) >= 3 and not query[-1:].isspace() else None
+        marks = ",".join("?" * len(chat_ids))
+        c = self._reader()
+        self.searches += 1
+        # una sola transacción de lectura: los totales, df y docs son de la misma foto
+        c.execute("BEGIN")
+        try:
+            n_docs = int(self._meta(c, "docs") or 0)
+            avg_len = int(self._meta(c, "tokens") or 0) / n_docs if n_docs else 1.0
+            # df de cada palabra; la del prefijo suma todos los términos que empiezan con ella
+            df = {}
+            for word in words:
+                if word == prefix:
+                    row = c.execute(
+                        "SELECT SUM(df) FROM terms WHERE term >= ? AND term < ?", (word, word + "\U0010ffff")
+                    ).fetchone()
+                else:
+                    row = c.execute("SELECT df FROM terms WHERE term = ?", (word,)).fetchone()
+                df[word] = (row[0] or 0) if row else 0
+                if not df[word]:
+                    return [], False
+            rarest = min(words, key=df.__getitem__)
+            term_sql = "term >= ? AND term < ?" if rarest == prefix else "term = ?"
+            term_params = (rarest, rarest + "\U0010ffff") if rarest == prefix else (rarest,)
+            ids = [
+                r[0]
+                for r in c.execute(
+                    f"SELECT DISTINCT id, createdAt FROM postings WHERE {term_sql} AND chatId IN ({marks}) "
+                    "ORDER BY createdAt DESC LIMIT ?",
+                    (*term_params, *chat_ids, self.scan_limit),
+                )
+            ]
+            docs = []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                docs.extend(
+                    c.execute(
+                        "SELECT id, chatId, senderId, kind, content, createdAt, seq, length FROM docs "
+                        f"WHERE id IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                )
+        finally:
+            c.execute("COMMIT")
+
+        idf = {w: math.log(1 + (n_docs - df[w] + 0.5) / (df[w] + 0.5)) for w in words}
+        scored = []
+        for id_, chat_id, sender_id, kind, content, created_at, seq, length in docs:
+            terms = Counter(tokenize(content))
+            score = 0.0
+            for word in words:
+                tf = terms.get(word, 0)
+                if word == prefix:
+                    tf = sum(n for t, n in terms.items() if t.startswith(word))
+                if not tf:
+                    break
+                norm = _K1 * (1 - _B + _B * length / (avg_len or 1.0))
+                score += idf[word] * tf * (_K1 + 1) / (tf + norm)
+            else:
+                scored.append((score, created_at, {
+                    "id": id_, "chatId": chat_id, "senderId": sender_id, "kind": kind,
+                    "content": content, "createdAt": created_at, "seq": seq, "score": round(score, 4),
+                }))
+        scored.sort(key=lambda s: (s[0], s[1]), reverse=True)
+        page = [m for _, _, m in scored[offset:offset + limit]]
+        return page, offset + limit < len(scored)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        c = self._reader()
+        docs = int(self._meta(c, "docs") or 0)
+        building = self._meta(c, "ready") != "1"
+        return {
+            "ready": self.ready,
+            "building": building,
+            "docs": docs,
+            "added": self.added,
+            "searches": self.searches,
+        }
+
+    def _release_build(self):
+        # libera la reconstrucción a medias para que otro proceso no espere BUILD_STALE_MS
+        with self._lock:
+            if self._building and self._conn is not None:
+                try:
+                    self._set_meta(self._conn, {"builder": ""})
+                except sqlite3.Error as e:
+                    print(f"[Search] no se pudo liberar la reconstrucción: {e}")
+            self._building = False
+
+    def close(self):
+        self._closed = True
+        self._release_build()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        with self._readers_lock:
+            for c in self._readers:
+                c.close()
+            self._readers.clear()
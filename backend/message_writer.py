@@ -0,0 +1,186 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from db_async import DBBusyError
+from storage.base import new_message
+
+# (mensaje, meta) -> meta es lo que el servidor necesita para responder (socket, clientId...)
+Item = tuple[dict, Any]
+
+
+class MessageWriter:
+    """Persistencia de mensajes por lotes (group commit).
+
+    `submit` encola el mensaje y vuelve de inmediato. Una sola tarea junta lo que llega
+    durante `max_delay` (o hasta `max_batch`) y lo guarda con `save(batch)` en una
+    transacción. Solo después del commit se llama a `on_commit` con el lote, en orden
+    de llegada; si el lote no se puede guardar tras los reintentos se llama a `on_error`.
+    Nunca se confirma (ack) un mensaje que no esté en la base.
+
+    Un intento fallido pudo haberse confirmado igual (la conexión se corta después del
+    COMMIT): antes de reintentar se consulta `saved(mensajes)` ({id: seq} de los que ya
+    están) y solo se vuelve a insertar el resto. `on_commit` corre en otra tarea, en
+    orden, para que un fan-out lento no retrase el guardado del lote siguiente.
+    """
+
+    def __init__(
+        self,
+        save: Callable[[list[dict]], Awaitable[None]],
+        on_commit: Callable[[list[Item]], Awaitable[None]],
+        on_error: Callable[[list[Item], Exception], Awaitable[None]],
+        saved: Callable[[list[dict]], Awaitable[dict[str, int]]] | None = None,
+        max_batch: int = 200,
+        max_delay: float = 0.005,
+        max_pending: int = 5000,
+        retries: int = 3,
+    ):
+        self._save = save
+        self._on_commit = on_commit
+        self._on_error = on_error
+        self._saved = saved
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.retries = retries
+        self._queue: asyncio.Queue[Item | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        # lotes confirmados pendientes de notificar (on_commit)
+        self._committed: asyncio.Queue[list[Item] | None] = asyncio.Queue()
+        self._notify_task: asyncio.Task | None = None
+        self._closing = False
+        # último createdAt asignado por chat: mantiene el orden de llegada dentro del chat
+        self._last_created: dict[str, int] = {}
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+
+    def submit(self, chat_id: str, sender_id: str, kind: str, content: str, meta: Any = None) -> dict:
+        if self._closing:
+            raise DBBusyError("El servidor se está deteniendo")
+        if self._queue.qsize() >= self.max_pending:
+            raise DBBusyError(f"Cola de escritura llena ({self._queue.qsize()})")
+
+        now = int(time.time() * 1000)
+        created = max(now, self._last_created.get(chat_id, 0) + 1)
+        self._last_created[chat_id] = created
+        if len(self._last_created) > 10000:
+            # solo importan los chats que escribieron en el último milisegundo
+            self._last_created = {k: v for k, v in self._last_created.items() if v >= now}
+
+        msg = new_message(chat_id, sender_id, kind, content, created_ms=created)
+        self._queue.put_nowait((msg, meta))
+        return msg
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+            self._notify_task = asyncio.create_task(self._notify())
+
+    async def close(self):
+        # deja de aceptar mensajes y espera a que se guarde lo pendiente
+        if self._task is None:
+            return
+        self._closing = True
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        # los lotes ya guardados se notifican antes de cerrar
+        self._committed.put_nowait(None)
+        await self._notify_task
+        self._notify_task = None
+
+    async def _run(self):
+        closing = False
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                closing = True
+            elif self._queue.qsize() < self.max_batch - 1:
+                # ventana corta para juntar mensajes concurrentes en el mismo commit
+                await asyncio.sleep(self.max_delay)
+
+            batch = [] if item is None else [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    closing = True
+                else:
+                    batch.append(item)
+            await self._flush(batch)
+
+            if closing and self._queue.empty():
+                return
+
+    async def _flush(self, batch: list[Item]):
+        if not batch:
+            return
+        pending = [msg for msg, _ in batch]
+        error: Exception | None = None
+        # un intento más que los reintentos: solo verifica qué dejó guardado el último
+        for attempt in range(self.retries + 1):
+            try:
+                if attempt and self._saved is not None:
+                    pending = await self._pending_after_failure(pending)
+                    if not pending:
+                        error = None
+                        break
+                if attempt == self.retries:
+                    break
+                await self._save(pending)
+                pending = []
+                error = None
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    await asyncio.sleep(0.05 * (2 ** attempt))
+
+        unsaved = {id(m) for m in pending}
+        committed = [item for item in batch if id(item[0]) not in unsaved]
+        if committed:
+            self.batches += 1
+            self.committed += len(committed)
+            self._committed.put_nowait(committed)
+        if pending:
+            failed = [item for item in batch if id(item[0]) in unsaved]
+            self.failed += len(failed)
+            try:
+                await self._on_error(failed, error)
+            except Exception as e:
+                print(f"[MessageWriter] error notificando fallo: {e}")
+
+    async def _pending_after_failure(self, pending: list[dict]) -> list[dict]:
+        # los que ya están en la base toman el seq con que quedaron guardados
+        saved = await self._saved(pending)
+        for m in pending:
+            if m["id"] in saved:
+                m["seq"] = saved[m["id"]]
+        return [m for m in pending if m["id"] not in saved]
+
+    async def _notify(self):
+        while True:
+            batch = await self._committed.get()
+            if batch is None:
+                return
+            try:
+                await self._on_commit(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # el lote ya está guardado; un fallo al notificar no debe detener el writer
+                print(f"[MessageWriter] error notificando lote: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "notifyPending": self._committed.qsize(),
+            "maxPending": self.max_pending,
+            "batches": self.batches,
+            "committed": self.committed,
+            "failed": self.failed,
+            "avgBatch": round(self.committed / self.batches, 2) if self.batches else None,
+        }
@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+import auth
+
+load_dotenv()
+
+# procesos dedicados a bcrypt (cada hash ocupa un núcleo ~250 ms con costo 12)
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# hashes/verificaciones pendientes antes de responder "intenta de nuevo"
+AUTH_QUEUE_LIMIT = int(os.getenv("AUTH_QUEUE_LIMIT", "64"))
+
+
+class AuthBusyError(Exception):
+    pass
+
+
+def _warm():
+    return os.getpid()
+
+
+class PasswordPool:
+    """Ejecuta bcrypt en un pool de procesos para no bloquear el event loop.
+
+    Igual que DBExecutor, acota lo pendiente: por encima de `queue_limit` se
+    rechaza de inmediato con AuthBusyError en lugar de encolar.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, rounds: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def start(self):
+        # nunca "fork": el proceso ya tiene el event loop y los hilos de DB, y un hijo
+        # copiado podría heredar un lock tomado. "forkserver" parte de un proceso limpio
+        # que solo importa este módulo; sin él (Windows, macOS viejo) se usa "spawn"
+        if self._pool is not None:
+            return
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([__name__])
+        else:
+            ctx = multiprocessing.get_context("spawn")
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        self._pool.submit(_warm).result()
+
+    def _release(self, _fut):
+        # se llama desde el hilo del pool cuando el proceso termina el trabajo
+        with self._lock:
+            self._pending -= 1
+
+    async def _run(self, fn, *args):
+        if self._pool is None:
+            self.start()
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                self.rejected += 1
+                raise AuthBusyError(f"Cola de autenticación llena ({self._pending})")
+            self._pending += 1
+            self.submitted += 1
+        cfut = self._pool.submit(fn, *args)
+        # el cupo se libera cuando el proceso termina, aunque el cliente ya no espere
+        cfut.add_done_callback(self._release)
+        return await asyncio.wrap_future(cfut)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(auth.hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        # (correcta, hash nuevo si hay que guardarlo por cambio de costo)
+        ok, new_hash = await self._run(auth.verify_and_rehash, password, hashed, self.rounds)
+        if new_hash:
+            self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "queueLimit": self.queue_limit,
+            "rounds": self.rounds,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+passwords = PasswordPool(workers=AUTH_WORKERS, queue_limit=AUTH_QUEUE_LIMIT, rounds=auth.BCRYPT_ROUNDS)
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+# (userId, estado) ya anunciados en un mismo ciclo
+Change = tuple[str, str]
+
+
+class PresenceEngine:
+    """Presencia en memoria con anuncios agrupados y escritura diferida a la DB.
+
+    `set` registra el estado nuevo y vuelve de inmediato. Un cambio se anuncia
+    recién cuando lleva `debounce` segundos pendiente: si en ese tiempo el usuario
+    vuelve al estado ya anunciado (p. ej. offline -> online al cambiar de red) no se
+    anuncia ni se escribe nada. Los cambios que vencen en el mismo ciclo se entregan
+    juntos a `broadcast`; la DB se actualiza cada `flush_interval` con `save`, un solo
+    lote con el último estado de cada usuario.
+    """
+
+    def __init__(
+        self,
+        broadcast: Callable[[list[Change]], Awaitable[None]],
+        save: Callable[[dict[str, str]], Awaitable[None]],
+        debounce: float = 1.0,
+        flush_interval: float = 5.0,
+    ):
+        self._broadcast = broadcast
+        self._save = save
+        self.debounce = debounce
+        self.flush_interval = flush_interval
+        # último estado anunciado de usuarios online/ocupados (y offline aún sin guardar)
+        self._announced: dict[str, str] = {}
+        # userId -> [estado, vence]
+        self._pending: dict[str, list] = {}
+        # userId -> estado a escribir en el próximo flush
+        self._dirty: dict[str, str] = {}
+        self._task: asyncio.Task | None = None
+        self._last_flush = 0.0
+        self.announced = 0
+        self.suppressed = 0
+        self.flushes = 0
+        self.written = 0
+
+    def status(self, user_id: str, default: str = "offline") -> str:
+        # lo que ven los demás: el último estado anunciado
+        return self._announced.get(user_id, default)
+
+    def apply(self, user: dict) -> dict:
+        # corrige el estado de un usuario público leído de la DB (puede ir atrasada)
+        status = self._announced.get(user.get("id"))
+        if status is not None and status != user.get("status"):
+            user["status"] = status
+        return user
+
+    def set(self, user_id: str, status: str, delay: float | None = None):
+        # delay: ventana propia para este cambio (p. ej. gracia de reconexión al desconectar)
+        pending = self._pending.get(user_id)
+        if status == self._announced.get(user_id, "offline"):
+            if pending is not None:
+                # volvió al estado anunciado dentro de la ventana: no hay cambio
+                del self._pending[user_id]
+                self.suppressed += 1
+            return
+        if pending is not None:
+            pending[0] = status
+            self.suppressed += 1
+        else:
+            self._pending[user_id] = [status, time.monotonic() + (self.debounce if delay is None else delay)]
+
+    def forget(self, user_id: str):
+        # el usuario pasó a otro proceso: deja de seguirlo sin anunciar nada
+        self._pending.pop(user_id, None)
+        self._announced.pop(user_id, None)
+
+    def start(self):
+        if self._task is None:
+            self._last_flush = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # anuncia lo pendiente y guarda todo antes de cerrar la DB
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self._tick(force=True)
+        except Exception as e:
+            print(f"[Presence] no se pudo guardar la presencia: {e}")
+
+    async def _run(self):
+        interval = min(self.debounce, self.flush_interval) / 2 or 0.05
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # un fallo de la DB no debe detener la presencia
+                print(f"[Presence] {e}")
+
+    async def _tick(self, force: bool = False):
+        now = time.monotonic()
+        due = [uid for uid, (_, deadline) in self._pending.items() if force or deadline <= now]
+        changes: list[Change] = []
+        for uid in due:
+            status = self._pending.pop(uid)[0]
+            self._announced[uid] = status
+            self._dirty[uid] = status
+            changes.append((uid, status))
+        if changes:
+            self.announced += len(changes)
+            await self._broadcast(changes)
+
+        if self._dirty and (force or now - self._last_flush >= self.flush_interval):
+            await self._flush()
+
+    async def _flush(self):
+        dirty, self._dirty = self._dirty, {}
+        self._last_flush = time.monotonic()
+        try:
+            await self._save(dirty)
+        except Exception:
+            # se reintenta en el próximo flush sin pisar cambios más nuevos
+            for uid, status in dirty.items():
+                self._dirty.setdefault(uid, status)
+            raise
+        self.flushes += 1
+        self.written += len(dirty)
+        # los offline ya están en la DB: no hace falta recordarlos
+        for uid, status in dirty.items():
+            if status == "offline" and self._announced.get(uid) == "offline":
+                del self._announced[uid]
+
+    def stats(self) -> dict:
+        return {
+            "online": sum(1 for s in self._announced.values() if s != "offline"),
+            "pending": len(self._pending),
+            "dirty": len(self._dirty),
+            "announced": self.announced,
+            "suppressed": self.suppressed,
+            "flushes": self.flushes,
+            "written": self.written,
+        }
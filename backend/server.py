@@ -1,20 +1,97 @@
 import os
 import ssl
+import json
+import time
+import uuid
+import signal
+import random
 import asyncio
-from typing import Any, Dict, Optional, Set
+from typing import Optional, Set
 
 from dotenv import load_dotenv
 import websockets
 
 import db
+from db_async import adb, executor as db_executor, DBBusyError, DBOutcomeUnknownError, DBTimeoutError
 import auth
+import attachments
 import protocol
+from password_pool import passwords, AuthBusyError
+from bus import BACKENDS as BUS_BACKENDS, create_bus
+from fanout import POLICIES, FanoutMetrics, Outbox
+from sessions import SessionRegistry
+from message_index import BUILD_STALE_MS
+from message_writer import MessageWriter
+from presence import PresenceEngine
+from storage import InvalidIdError, PoolTimeoutError
+from storage.base import chat_sort_key, message_cursor, parse_cursor, parse_sync_cursor, sync_cursor
 
 load_dotenv()
 
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8765"))
 LOG_WS_DISCONNECTS = os.getenv("LOG_WS_DISCONNECTS", "0") == "1"
+# habilita el evento server:stats (contadores internos) para clientes autenticados
+EXPOSE_STATS = os.getenv("EXPOSE_STATS", "0") == "1"
+# tamaño máximo de un frame de texto (JSON); uno más grande se rechaza sin parsearlo
+WS_MAX_TEXT_KB = int(os.getenv("WS_MAX_TEXT_KB", "64"))
+# websockets corta la conexión (1009) ante un frame mayor a esto, antes de leerlo entero; el
+# margen cubre el header de los frames binarios y el cierre del bloque de permessage-deflate
+WS_MAX_FRAME_BYTES = max(WS_MAX_TEXT_KB * 1024, attachments.store.chunk_size) + 1024
+
+# historial de mensajes
+JOIN_HISTORY_LIMIT = int(os.getenv("JOIN_HISTORY_LIMIT", "150"))
+# room:joinMany: chats por solicitud y chats por consulta de historial (cada tramo se envía al llegar)
+JOIN_MANY_MAX = int(os.getenv("JOIN_MANY_MAX", "200"))
+JOIN_MANY_BATCH = int(os.getenv("JOIN_MANY_BATCH", "10"))
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX = 200
+# user:search: resultados por defecto y máximo
+USER_SEARCH_LIMIT = int(os.getenv("USER_SEARCH_LIMIT", "10"))
+USER_SEARCH_MAX = 50
+# message:search: resultados por página por defecto y máximo
+MESSAGE_SEARCH_LIMIT = int(os.getenv("MESSAGE_SEARCH_LIMIT", "20"))
+MESSAGE_SEARCH_MAX = 50
+# adjuntos: transferencias simultáneas por socket
+ATTACHMENT_UPLOADS_PER_SESSION = 4
+ATTACHMENT_DOWNLOADS_PER_SESSION = 4
+# sync: mensajes por respuesta
+SYNC_PAGE_DEFAULT = 200
+SYNC_PAGE_MAX = 500
+
+# escritura de mensajes por lotes (group commit)
+MESSAGE_BATCH_MAX = int(os.getenv("MESSAGE_BATCH_MAX", "200"))
+MESSAGE_BATCH_DELAY_MS = float(os.getenv("MESSAGE_BATCH_DELAY_MS", "5"))
+MESSAGE_QUEUE_MAX = int(os.getenv("MESSAGE_QUEUE_MAX", "5000"))
+
+# colas de salida por conexión
+OUTBOX_MAX_FRAMES = int(os.getenv("OUTBOX_MAX_FRAMES", "256"))
+SLOW_CONSUMER_POLICY = os.getenv("SLOW_CONSUMER_POLICY", "coalesce").strip().lower()
+if SLOW_CONSUMER_POLICY not in POLICIES:
+    raise ValueError(f"SLOW_CONSUMER_POLICY inválida: {SLOW_CONSUMER_POLICY} (usa {', '.join(POLICIES)})")
+
+# presencia: ventana de debounce, escritura a la DB por lotes y tamaño de cada tramo del fan-out
+PRESENCE_DEBOUNCE_MS = float(os.getenv("PRESENCE_DEBOUNCE_MS", "1000"))
+PRESENCE_FLUSH_MS = float(os.getenv("PRESENCE_FLUSH_MS", "5000"))
+PRESENCE_FANOUT_BATCH = int(os.getenv("PRESENCE_FANOUT_BATCH", "500"))
+
+# reconexiones: el offline espera RECONNECT_GRACE_MS y las rooms se pueden retomar durante SESSION_RESUME_MS
+RECONNECT_GRACE_MS = float(os.getenv("RECONNECT_GRACE_MS", "5000"))
+SESSION_RESUME_MS = float(os.getenv("SESSION_RESUME_MS", "60000"))
+
+# cada cuánto se buscan mensajes para archivar (solo con ARCHIVE_AFTER_DAYS > 0)
+ARCHIVE_INTERVAL_S = float(os.getenv("ARCHIVE_INTERVAL_S", "3600"))
+
+# modo multi-proceso: WORKERS procesos en el mismo puerto (SO_REUSEPORT) unidos por un bus
+WORKERS = int(os.getenv("WORKERS", "1"))
+BUS_BACKEND = os.getenv("BUS_BACKEND", "unix" if WORKERS > 1 else "local").strip().lower()
+BUS_SOCKET = os.getenv("BUS_SOCKET", f"/tmp/chat-bus-{PORT}.sock")
+# eventos pendientes por worker en el broker; un worker que se atrasa más se desconecta
+BUS_PEER_QUEUE_MB = float(os.getenv("BUS_PEER_QUEUE_MB", "64"))
+if BUS_BACKEND not in BUS_BACKENDS:
+    raise ValueError(f"BUS_BACKEND inválido: {BUS_BACKEND} (usa {', '.join(BUS_BACKENDS)})")
+if WORKERS > 1 and db.STORAGE_BACKEND == "memory":
+    raise ValueError("STORAGE_BACKEND=memory no se comparte entre procesos: usa WORKERS=1")
 
 # SSL / WSS (mkcert)
 SSL_CERT = os.getenv("SSL_CERT", "").strip()
@@ -26,11 +103,13 @@ if SSL_CERT and SSL_KEY:
     ssl_context.load_cert_chain(SSL_CERT, SSL_KEY)
 
 # --- sesiones ---
-ws_to_user: Dict[websockets.WebSocketServerProtocol, str] = {}
-user_to_ws: Dict[str, Set[websockets.WebSocketServerProtocol]] = {}
+# una Session por socket (usuario, rooms, cola de salida); el registry mantiene
+# los índices por socket, por usuario y por room
+registry = SessionRegistry(resume_grace=SESSION_RESUME_MS / 1000)
+fanout_metrics = FanoutMetrics()
 
-# rooms por chatId (opcional, pero útil)
-rooms: Dict[str, Set[websockets.WebSocketServerProtocol]] = {}
+# eventos hacia sesiones de otros workers; con un solo proceso es LocalBus (no hace nada)
+bus = create_bus(BUS_BACKEND, worker_id=str(os.getpid()), path=BUS_SOCKET)
 
 
 def sanitize_user(u: dict) -> dict:
@@ -43,74 +122,180 @@ def sanitize_user(u: dict) -> dict:
     }
 
 
+def deliver(session, frame: str, key: str | None = None) -> bool:
+    # encola sin esperar; la tarea escritora del socket hace el envío real
+    return session.outbox.put(frame, key)
+
+
 async def send(ws, type_: str, data: dict):
-    await ws.send(protocol.make(type_, data))
+    session = registry.get(ws)
+    if session is not None:
+        deliver(session, protocol.make(type_, data))
 
 
-async def broadcast_to_chat(chat_id: str, type_: str, data: dict):
+def deliver_chat_local(chat_id: str, member_ids, frame: str):
     # intenta por room si hay gente unida
-    targets = rooms.get(chat_id)
+    targets = registry.room(chat_id)
     if targets:
-        msg = protocol.make(type_, data)
-        dead = []
-        for w in list(targets):
-            try:
-                await w.send(msg)
-            except:
-                dead.append(w)
-        for w in dead:
-            targets.discard(w)
+        for s in targets:
+            deliver(s, frame)
         return
-
     # fallback: manda a miembros conectados (aunque no estén "join")
-    member_ids = db.list_user_ids_for_chat(chat_id)
-    msg = protocol.make(type_, data)
     for uid in member_ids:
-        for w in list(user_to_ws.get(uid, set())):
-            try:
-                await w.send(msg)
-            except:
-                pass
+        for s in registry.sessions_of(uid):
+            deliver(s, frame)
+
+
+def deliver_users_local(user_ids, frame: str, key: str | None = None):
+    for uid in user_ids:
+        for s in registry.sessions_of(uid):
+            deliver(s, frame, key)
+
+
+def publish_to_users(user_ids: list[str], frame: str, key: str | None = None):
+    # solo a los workers que tienen sesiones de algún destinatario (directorio del bus)
+    workers = bus.workers_of(user_ids)
+    if workers:
+        bus.publish(workers, {"kind": "users", "users": user_ids, "frame": frame, "key": key})
+
+
+async def broadcast_to_chat(chat_id: str, type_: str, data: dict):
+    await broadcast_frames_to_chat(chat_id, [protocol.make(type_, data)])
+
+
+async def broadcast_frames_to_chat(chat_id: str, frames: list[str]):
+    # varios frames al mismo chat, en orden, resolviendo los miembros una sola vez
+    if not bus.distributed:
+        targets = registry.room(chat_id)
+        member_ids = () if targets else await adb.list_user_ids_for_chat(chat_id)
+        for msg in frames:
+            deliver_chat_local(chat_id, member_ids, msg)
+        return
+
+    member_ids = await adb.list_user_ids_for_chat(chat_id)
+    workers = bus.workers_of(member_ids)
+    for msg in frames:
+        deliver_chat_local(chat_id, member_ids, msg)
+        if workers:
+            # cada worker aplica la misma regla (room local o miembros) con sus sesiones
+            bus.publish(workers, {"kind": "chat", "chatId": chat_id, "users": member_ids, "frame": msg})
 
 
 async def send_to_user(user_id: str, type_: str, data: dict):
     msg = protocol.make(type_, data)
-    for w in list(user_to_ws.get(user_id, set())):
-        try:
-            await w.send(msg)
-        except:
-            pass
+    deliver_users_local((user_id,), msg)
+    if bus.distributed:
+        publish_to_users([user_id], msg)
 
 
 async def broadcast_to_chat_members(chat_id: str, type_: str, data: dict, exclude_user_id: str | None = None):
     msg = protocol.make(type_, data)
-    for uid in db.list_user_ids_for_chat(chat_id):
-        if exclude_user_id and uid == exclude_user_id:
-            continue
-        for w in list(user_to_ws.get(uid, set())):
-            try:
-                await w.send(msg)
-            except:
-                pass
+    user_ids = [uid for uid in await adb.list_user_ids_for_chat(chat_id) if uid != exclude_user_id]
+    deliver_users_local(user_ids, msg)
+    if bus.distributed:
+        publish_to_users(user_ids, msg)
 
 
 def bind_session(ws, user_id: str):
-    ws_to_user[ws] = user_id
-    user_to_ws.setdefault(user_id, set()).add(ws)
-
-
-async def broadcast_presence(user_id: str, status: str):
-    msg = protocol.make("presence:update", {"userId": user_id, "status": status})
-    for uid in db.list_related_user_ids(user_id):
-        for w in list(user_to_ws.get(uid, set())):
-            try:
-                await w.send(msg)
-            except:
-                pass
+    session = registry.get(ws)
+    if session is None:
+        return
+    previous = session.user_id
+    first = not registry.is_online(user_id)
+    registry.bind(session, user_id)
+    # el directorio del bus solo cambia con la primera/última sesión del usuario en este worker
+    if first:
+        bus.announce(user_id, True)
+    if previous and previous != user_id and not registry.is_online(previous):
+        bus.announce(previous, False)
+
+
+def publish_membership(op: str, chat_id: str, user_ids: list[str]):
+    # las cachés de membresía de los otros workers se actualizan igual que la local
+    if bus.distributed:
+        bus.publish(None, {"kind": "membership", "op": op, "chatId": chat_id, "users": user_ids})
+
+
+async def on_bus_event(event: dict):
+    # eventos publicados por otros workers: solo se entregan a sesiones locales
+    kind = event.get("kind")
+    if kind == "chat":
+        deliver_chat_local(event["chatId"], event["users"], event["frame"])
+    elif kind == "users":
+        deliver_users_local(event["users"], event["frame"], event.get("key"))
+    elif kind == "membership":
+        if event["op"] == "created":
+            db.membership.chat_created(event["chatId"], event["users"])
+        else:
+            for uid in event["users"]:
+                db.membership.add_member(event["chatId"], uid)
+    elif kind == "messages":
+        db.recent_messages.add(event["messages"])
+    elif kind == "status":
+        db.cache_users_status(event["statuses"])
+    elif kind == "user":
+        db.user_index.add(event["user"]["id"], event["user"]["username"], event["user"].get("displayName"))
+    elif kind == "resync":
+        # lo emite el propio bus al reconectar: se perdieron eventos de otros workers
+        resync_caches()
+
+
+def resync_caches():
+    # lo cacheado a partir de eventos del bus se descarta y se vuelve a leer de la DB
+    db.recent_messages.clear()
+    db.membership.clear()
+    db.profiles.clear()
+    db.profile_ids.clear()
+    asyncio.create_task(load_user_index())
+
+
+async def broadcast_presence(changes: list[tuple[str, str]]):
+    if bus.distributed:
+        # los perfiles cacheados en los otros workers llevan el estado nuevo
+        bus.publish(None, {"kind": "status", "statuses": dict(changes)})
+    # contactos de todos los usuarios que cambiaron, en una sola llamada (grafo cacheado)
+    contacts = await adb.related_user_ids_many([uid for uid, _ in changes])
+    delivered = 0
+    for user_id, status in changes:
+        msg = protocol.make("presence:update", {"userId": user_id, "status": status})
+        # la presencia es estado: con "coalesce" solo importa la última de cada usuario
+        key = f"presence:{user_id}"
+        user_ids = list(contacts.get(user_id, ()))
+        for uid in user_ids:
+            for s in registry.sessions_of(uid):
+                deliver(s, msg, key)
+                delivered += 1
+                if delivered % PRESENCE_FANOUT_BATCH == 0:
+                    # cede el event loop entre tramos de un fan-out grande
+                    await asyncio.sleep(0)
+        if bus.distributed:
+            publish_to_users(user_ids, msg, key)
+
+
+presence = PresenceEngine(
+    broadcast=broadcast_presence,
+    save=adb.set_users_status,
+    debounce=PRESENCE_DEBOUNCE_MS / 1000,
+    flush_interval=PRESENCE_FLUSH_MS / 1000,
+)
+
+
+def with_presence(chat: dict) -> dict:
+    # la DB recibe los estados por lotes: se corrigen con los de memoria
+    for m in chat.get("members") or ():
+        presence.apply(m)
+    return chat
+
+
+def session_id(ws) -> Optional[str]:
+    # el cliente lo manda como `resumeId` en el próximo `hello` para retomar sus rooms
+    session = registry.get(ws)
+    return session.resume_id if session is not None else None
 
 
 def require_auth(ws) -> Optional[str]:
-    return ws_to_user.get(ws)
+    session = registry.get(ws)
+    return session.user_id if session is not None else None
 
 
 # ---------------- HANDLERS ----------------
@@ -129,11 +314,30 @@ async def handle_hello(ws, data):
 
     # guardar sesión
     bind_session(ws, user_id)
-    db.set_user_status(user_id, "online")
-
-    user_public = db.get_user_public_by_id(user_id)
-    await send(ws, "hello:ok", {"userId": user_id, "user": user_public})
-    await broadcast_presence(user_id, "online")
+    presence.set(user_id, "online")
+    session = registry.get(ws)
+
+    user_public = db.cached_user_public(user_id) or await adb.get_user_public_by_id(user_id)
+    if user_public:
+        user_public["status"] = "online"
+
+    # reconexión: vuelve a unir las rooms de la sesión anterior (si sigue siendo miembro)
+    rooms: list[str] = []
+    resume_id = (data or {}).get("resumeId")
+    if isinstance(resume_id, str) and resume_id and session is not None:
+        previous = registry.resume(session, resume_id)
+        if previous:
+            member_of = set(await adb.list_chat_ids_for_user(user_id))
+            rooms = [chat_id for chat_id in previous if chat_id in member_of]
+            for chat_id in rooms:
+                registry.join(session, chat_id)
+
+    await send(ws, "hello:ok", {
+        "userId": user_id,
+        "user": user_public,
+        "sessionId": session.resume_id if session is not None else None,
+        "rooms": rooms,
+    })
 
 
 async def handle_auth_register(ws, data):
@@ -147,22 +351,29 @@ async def handle_auth_register(ws, data):
         return
 
     # checks
-    if db.get_user_by_username(username):
+    if await adb.get_user_public_by_username(username):
         await send(ws, "auth:error", {"message": "Username ya existe"})
         return
-    if email and db.get_user_by_email(email):
+    if email and await adb.email_in_use(email):
         await send(ws, "auth:error", {"message": "Email ya existe"})
         return
 
-    password_hash = auth.hash_password(password)
-    u = db.create_user(username=username, displayName=displayName, email=email or None, password_hash=password_hash)
+    try:
+        password_hash = await passwords.hash(password)
+    except AuthBusyError:
+        await send(ws, "auth:error", {"message": "Servidor ocupado, intenta de nuevo", "retry": True})
+        return
+    u = await adb.create_user(username=username, displayName=displayName, email=email or None, password_hash=password_hash)
+    if bus.distributed:
+        # el índice de user:search de los otros workers también lo incluye
+        bus.publish(None, {"kind": "user", "user": {"id": u["id"], "username": u["username"], "displayName": u["displayName"]}})
 
     token = auth.create_token(u["id"], u["username"])
     bind_session(ws, u["id"])
-    db.set_user_status(u["id"], "online")
+    presence.set(u["id"], "online")
 
     await send(ws, "auth:ok", {"token": token, "user": sanitize_user({**u, "status": "online"})})
-    await send(ws, "hello:ok", {"userId": u["id"]})
+    await send(ws, "hello:ok", {"userId": u["id"], "sessionId": session_id(ws)})
 
 
 async def handle_auth_login(ws, data):
@@ -175,28 +386,36 @@ async def handle_auth_login(ws, data):
 
     u = None
     if "@" in usernameOrEmail:
-        u = db.get_user_by_email(usernameOrEmail)
+        u = await adb.get_user_by_email(usernameOrEmail)
     if not u:
-        u = db.get_user_by_username(usernameOrEmail)
+        u = await adb.get_user_by_username(usernameOrEmail)
 
     if not u:
         await send(ws, "auth:error", {"message": "Credenciales incorrectas"})
         return
 
-    if not auth.verify_password(password, u["password_hash"]):
+    try:
+        ok, new_hash = await passwords.verify(password, u["password_hash"])
+    except AuthBusyError:
+        await send(ws, "auth:error", {"message": "Servidor ocupado, intenta de nuevo", "retry": True})
+        return
+    if not ok:
         await send(ws, "auth:error", {"message": "Credenciales incorrectas"})
         return
+    if new_hash:
+        # BCRYPT_ROUNDS cambió: se guarda el hash con el costo nuevo
+        await adb.set_user_password_hash(u["id"], new_hash)
 
     token = auth.create_token(u["id"], u["username"])
     bind_session(ws, u["id"])
-    db.set_user_status(u["id"], "online")
+    presence.set(u["id"], "online")
 
     await send(ws, "auth:ok", {"token": token, "user": sanitize_user({**u, "status": "online"})})
-    await send(ws, "hello:ok", {"userId": u["id"]})
+    await send(ws, "hello:ok", {"userId": u["id"], "sessionId": session_id(ws)})
 
 
 async def handle_chat_list(ws, user_id):
-    chats = db.list_chats_for_user(user_id)
+    chats = [with_presence(ch) for ch in await adb.list_chats_for_user(user_id)]
     await send(ws, "chat:list:ok", {"chats": chats})
 
 
@@ -206,12 +425,68 @@ async def handle_user_find_by_username(ws, user_id, data):
         await send(ws, "user:notFound", {"username": ""})
         return
 
-    u = db.get_user_public_by_username(username)
+    u = await adb.get_user_public_by_username(username)
     if not u:
         await send(ws, "user:notFound", {"username": username})
         return
 
-    await send(ws, "user:found", {"user": u})
+    await send(ws, "user:found", {"user": presence.apply(u)})
+
+
+async def handle_user_search(ws, user_id, data):
+    query = str((data or {}).get("query") or "").strip()[:64]
+    try:
+        limit = max(1, min(int((data or {}).get("limit") or USER_SEARCH_LIMIT), USER_SEARCH_MAX))
+    except (TypeError, ValueError):
+        limit = USER_SEARCH_LIMIT
+    session = registry.get(ws)
+    if session is None:
+        return
+    if not db.user_index.ready:
+        await send(ws, "user:search:error", {"query": query, "message": "Búsqueda no disponible todavía", "retry": True})
+        return
+    running = session.search is not None
+    session.search = (query, limit)
+    if not running:
+        # corre aparte del router: las búsquedas que lleguen mientras tanto solo reemplazan
+        # session.search y al terminar se responde únicamente la más nueva
+        task = asyncio.create_task(run_user_search(ws, session, user_id))
+        search_tasks.add(task)
+        task.add_done_callback(search_tasks.discard)
+
+
+search_tasks: Set[asyncio.Task] = set()
+
+
+async def run_user_search(ws, session, user_id):
+    try:
+        while True:
+            request = session.search
+            query, limit = request
+            ids = db.user_index.search(query, limit, exclude=user_id)
+            try:
+                found = await adb.get_users_public_by_ids(ids) if ids else {}
+            except (DBBusyError, DBTimeoutError, PoolTimeoutError) as e:
+                # tarea aparte: nadie más ve la excepción, se responde aquí
+                if session.search is not request:
+                    continue
+                if LOG_WS_DISCONNECTS:
+                    print(f"[DB] {e}")
+                await send(ws, "user:search:error", {"query": query, "message": "Servidor ocupado, intenta de nuevo", "retry": True})
+                return
+            except Exception as e:
+                if session.search is not request:
+                    continue
+                print(f"[Search] error buscando usuarios: {e}")
+                await send(ws, "user:search:error", {"query": query, "message": "No se pudo completar la búsqueda"})
+                return
+            if session.search is not request:
+                continue
+            users = [presence.apply(found[uid]) for uid in ids if uid in found]
+            await send(ws, "user:search:ok", {"query": query, "users": users})
+            return
+    finally:
+        session.search = None
 
 
 async def handle_chat_create_direct(ws, user_id, data):
@@ -224,22 +499,23 @@ async def handle_chat_create_direct(ws, user_id, data):
         return
 
     # existe?
-    existing = db.find_direct_chat_between(user_id, target_id)
+    existing = await adb.find_direct_chat_between(user_id, target_id)
     if existing:
-        await send(ws, "chat:created", {"chat": existing, "autoSelect": True})
+        await send(ws, "chat:created", {"chat": with_presence(existing), "autoSelect": True})
         return
 
-    target = db.get_user_public_by_id(target_id)
+    target = await adb.get_user_public_by_id(target_id)
     if not target:
         await send(ws, "error", {"message": "Usuario destino no existe"})
         return
 
-    chat = db.create_direct_chat(user_id, target_id)
-    await send(ws, "chat:created", {"chat": chat, "autoSelect": True})
+    chat = await adb.create_direct_chat(user_id, target_id)
+    publish_membership("created", chat["id"], [user_id, target_id])
+    await send(ws, "chat:created", {"chat": with_presence(chat), "autoSelect": True})
 
-    target_view = db.get_chat_for_user(chat["id"], target_id)
+    target_view = await adb.get_chat_for_user(chat["id"], target_id)
     if target_view:
-        await send_to_user(target_id, "chat:created", {"chat": target_view, "autoSelect": False})
+        await send_to_user(target_id, "chat:created", {"chat": with_presence(target_view), "autoSelect": False})
 
 
 async def handle_group_create(ws, user_id, data):
@@ -248,8 +524,9 @@ async def handle_group_create(ws, user_id, data):
     if not title:
         await send(ws, "error", {"message": "Falta title"})
         return
-    chat = db.create_group_chat(title=title, description=description, owner_id=user_id)
-    await send(ws, "group:created", {"chat": chat})
+    chat = await adb.create_group_chat(title=title, description=description, owner_id=user_id)
+    publish_membership("created", chat["id"], [user_id])
+    await send(ws, "group:created", {"chat": with_presence(chat)})
 
 
 async def handle_group_invite(ws, user_id, data):
@@ -260,25 +537,214 @@ async def handle_group_invite(ws, user_id, data):
         return
 
     # el invitador debe ser miembro
-    if not db.user_is_member(group_id, user_id):
+    if not await adb.user_is_member(group_id, user_id):
         await send(ws, "error", {"message": "No eres miembro del grupo"})
         return
 
-    db.add_chat_member(group_id, invite_user_id, role="member")
+    await adb.add_chat_member(group_id, invite_user_id, role="member")
+    publish_membership("add", group_id, [invite_user_id])
     await send(ws, "group:invite:ok", {"groupId": group_id, "userId": invite_user_id})
 
 
+async def history_page(chat_id: str, before=None, after=None, limit: int = HISTORY_PAGE_DEFAULT) -> dict:
+    # pide uno de más para saber si quedan mensajes en la dirección de la página
+    messages = await adb.list_messages_page(chat_id, before=before, after=after, limit=limit + 1)
+    return shape_page(chat_id, messages, after, limit)
+
+
+def shape_page(chat_id: str, messages: list[dict], after, limit: int) -> dict:
+    # `messages` trae limit + 1 filas como máximo; la sobrante indica hasMore
+    has_more = len(messages) > limit
+    if has_more:
+        messages = messages[:limit] if after is not None else messages[1:]
+    return {
+        "chatId": chat_id,
+        "messages": messages,
+        "hasMore": has_more,
+        "before": message_cursor(messages[0]) if messages else None,
+        "after": message_cursor(messages[-1]) if messages else None,
+    }
+
+
+def page_size(value, default: int) -> int:
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(n, HISTORY_PAGE_MAX))
+
+
 async def handle_room_join(ws, user_id, data):
     chat_id = (data or {}).get("chatId")
+    since = (data or {}).get("since")
     if not chat_id:
         return
-    if not db.user_is_member(chat_id, user_id):
+    try:
+        after = parse_cursor(since) if since else None
+    except ValueError as e:
+        await send(ws, "error", {"message": str(e)})
+        return
+    if not await adb.user_is_member(chat_id, user_id):
         await send(ws, "error", {"message": "No eres miembro de ese chat"})
         return
-    rooms.setdefault(chat_id, set()).add(ws)
+    registry.join(registry.get(ws), chat_id)
     await send(ws, "room:join:ok", {"chatId": chat_id})
-    messages = db.list_messages(chat_id)
-    await send(ws, "message:list:ok", {"chatId": chat_id, "messages": messages})
+    # con "since" solo se envía lo que el cliente no tiene
+    page = await history_page(chat_id, after=after, limit=JOIN_HISTORY_LIMIT)
+    await send(ws, "message:list:ok", page)
+
+
+async def handle_room_join_many(ws, user_id, data):
+    # chatIds en orden de prioridad (los visibles primero); since: {chatId: cursor} opcional
+    chat_ids = (data or {}).get("chatIds")
+    since = (data or {}).get("since") or {}
+    if not isinstance(chat_ids, list) or not isinstance(since, dict):
+        await send(ws, "error", {"message": "chatIds debe ser una lista"})
+        return
+    chat_ids = list(dict.fromkeys(cid for cid in chat_ids if isinstance(cid, str)))[:JOIN_MANY_MAX]
+    try:
+        after = {cid: parse_cursor(since[cid]) if since.get(cid) else None for cid in chat_ids}
+    except ValueError as e:
+        await send(ws, "error", {"message": str(e)})
+        return
+
+    # una sola consulta de membresía (o ninguna, si está en caché) para todos los chats
+    mine = set(await adb.list_chat_ids_for_user(user_id))
+    joined = [cid for cid in chat_ids if cid in mine]
+    session = registry.get(ws)
+    for cid in joined:
+        registry.join(session, cid)
+    await send(ws, "room:joinMany:ok", {"chatIds": joined, "denied": [cid for cid in chat_ids if cid not in mine]})
+
+    for i in range(0, len(joined), JOIN_MANY_BATCH):
+        batch = joined[i:i + JOIN_MANY_BATCH]
+        pages = await adb.list_messages_many({cid: after[cid] for cid in batch}, JOIN_HISTORY_LIMIT + 1)
+        for cid in batch:
+            await send(ws, "message:list:ok", shape_page(cid, pages.get(cid, []), after[cid], JOIN_HISTORY_LIMIT))
+
+
+async def handle_room_leave(ws, user_id, data):
+    chat_id = (data or {}).get("chatId")
+    if not chat_id:
+        return
+    registry.leave(registry.get(ws), chat_id)
+    await send(ws, "room:leave:ok", {"chatId": chat_id})
+
+
+async def handle_message_history(ws, user_id, data):
+    chat_id = (data or {}).get("chatId")
+    before = (data or {}).get("before")
+    after = (data or {}).get("after")
+    if not chat_id:
+        await send(ws, "error", {"message": "Falta chatId"})
+        return
+    if before and after:
+        await send(ws, "error", {"message": "Usa before o after, no ambos"})
+        return
+    try:
+        before = parse_cursor(before) if before else None
+        after = parse_cursor(after) if after else None
+    except ValueError as e:
+        await send(ws, "error", {"message": str(e)})
+        return
+    if not await adb.user_is_member(chat_id, user_id):
+        await send(ws, "error", {"message": "No eres miembro de ese chat"})
+        return
+
+    limit = page_size((data or {}).get("limit"), HISTORY_PAGE_DEFAULT)
+    page = await history_page(chat_id, before=before, after=after, limit=limit)
+    await send(ws, "message:history:ok", page)
+
+
+async def handle_message_search(ws, user_id, data):
+    data = data or {}
+    query = str(data.get("query") or "").strip()[:128]
+    chat_id = data.get("chatId") or None
+    try:
+        limit = max(1, min(int(data.get("limit") or MESSAGE_SEARCH_LIMIT), MESSAGE_SEARCH_MAX))
+        offset = max(0, int(data.get("cursor") or 0))
+    except (TypeError, ValueError):
+        await send(ws, "message:search:error", {"query": query, "message": "limit o cursor inválido"})
+        return
+    if not query:
+        await send(ws, "message:search:error", {"query": query, "message": "Falta query"})
+        return
+    # ya listo no toca el archivo; mientras no lo esté lo relee (SQLite), fuera del event loop
+    if not (db.message_index.ready or await asyncio.to_thread(db.message_index.check_ready)):
+        await send(ws, "message:search:error", {"query": query, "message": "Búsqueda no disponible todavía", "retry": True})
+        return
+    messages, more = await adb.search_messages(user_id, query, limit, offset, chat_id)
+    await send(ws, "message:search:ok", {
+        "query": query,
+        "chatId": chat_id,
+        "messages": messages,
+        # cursor opaco para la página siguiente; None si no hay más
+        "cursor": str(offset + limit) if more else None,
+    })
+
+
+async def handle_sync(ws, user_id, data):
+    # el cliente manda {chats: {chatId: último seq visto}, since: syncedAt anterior}; para
+    # continuar una respuesta con hasMore repite chats y since junto con el cursor recibido
+    data = data or {}
+    known = data.get("chats") or {}
+    if not isinstance(known, dict):
+        await send(ws, "error", {"message": "chats debe ser {chatId: seq}"})
+        return
+    try:
+        seen = {chat_id: int(seq or 0) for chat_id, seq in known.items()}
+        since = int(data.get("since") or 0)
+    except (TypeError, ValueError):
+        await send(ws, "error", {"message": "Datos de sync inválidos"})
+        return
+    try:
+        resume = parse_sync_cursor(data["cursor"]) if data.get("cursor") else None
+    except ValueError as e:
+        await send(ws, "error", {"message": str(e)})
+        return
+    try:
+        limit = max(1, min(int(data.get("limit") or SYNC_PAGE_DEFAULT), SYNC_PAGE_MAX))
+    except (TypeError, ValueError):
+        limit = SYNC_PAGE_DEFAULT
+
+    # se toma antes de leer: lo que cambie mientras tanto entra en el próximo sync
+    synced_at = since if resume else int(time.time() * 1000)
+    state = await adb.list_chat_sync_state(user_id)
+
+    # chats nuevos para el cliente o con metadata/miembros cambiados: solo en el primer tramo
+    chats = []
+    if resume is None:
+        changed = {s["id"] for s in state if s["id"] not in seen or (s["updatedAt"] or 0) > since}
+        if changed:
+            chats = [with_presence(ch) for ch in await adb.list_chats_for_user(user_id) if ch["id"] in changed]
+
+    # mensajes faltantes solo de chats que el cliente ya tiene; los nuevos llegan con lastMessage
+    after = {s["id"]: seen[s["id"]] for s in state if s["id"] in seen and (s["lastSeq"] or 0) > seen[s["id"]]}
+    if resume is not None:
+        # el cursor es el último (chat, seq) entregado; list_messages_after_seq ordena por
+        # chat_sort_key, así que se retoma desde ese chat y se saltan los anteriores (el orden
+        # del dict no importa: lo fija el ORDER BY)
+        resume_chat, resume_seq = resume
+        start = chat_sort_key(resume_chat)
+        after = {cid: seq for cid, seq in after.items() if chat_sort_key(cid) >= start}
+        if resume_chat in after:
+            after[resume_chat] = max(after[resume_chat], resume_seq)
+
+    messages = await adb.list_messages_after_seq(after, limit + 1) if after else []
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    seqs: dict[str, int] = {}
+    for m in messages:
+        seqs[m["chatId"]] = m["seq"]
+
+    await send(ws, "sync:ok", {
+        "chats": chats,
+        "messages": messages,
+        "seqs": seqs,
+        "hasMore": has_more,
+        "cursor": sync_cursor(messages[-1]["chatId"], messages[-1]["seq"]) if has_more else None,
+        "syncedAt": synced_at,
+    })
 
 
 async def handle_presence_update(ws, user_id, data):
@@ -286,8 +752,7 @@ async def handle_presence_update(ws, user_id, data):
     if status not in {"online", "offline", "busy"}:
         await send(ws, "error", {"message": "Estado inválido"})
         return
-    db.set_user_status(user_id, status)
-    await broadcast_presence(user_id, status)
+    presence.set(user_id, status)
 
 
 async def handle_rtc_signal(ws, user_id, data):
@@ -303,7 +768,7 @@ async def handle_rtc_signal(ws, user_id, data):
     if not chat_id:
         await send(ws, "error", {"message": "Falta chatId"})
         return
-    if not db.user_is_member(chat_id, user_id):
+    if not await adb.user_is_member(chat_id, user_id):
         await send(ws, "error", {"message": "No eres miembro de ese chat"})
         return
 
@@ -317,7 +782,7 @@ async def handle_rtc_signal(ws, user_id, data):
     }
 
     if to_user_id:
-        if not db.user_is_member(chat_id, to_user_id):
+        if not await adb.user_is_member(chat_id, to_user_id):
             await send(ws, "error", {"message": "Destino RTC inválido"})
             return
         await send_to_user(to_user_id, "rtc:signal", out)
@@ -330,16 +795,290 @@ async def handle_message_send(ws, user_id, data):
     chat_id = (data or {}).get("chatId")
     kind = (data or {}).get("kind", "text")
     content = (data or {}).get("content", "")
+    if kind == "attachment":
+        # los bytes ya subieron con attachment:begin; el mensaje lleva solo la referencia
+        content = await _attachment_content(chat_id, (data or {}).get("attachment"))
+        if content is None:
+            await send(ws, "error", {"message": "Adjunto inválido"})
+            return
 
     if not chat_id or not content:
         await send(ws, "error", {"message": "Faltan campos"})
         return
-    if not db.user_is_member(chat_id, user_id):
+    if not await adb.user_is_member(chat_id, user_id):
         await send(ws, "error", {"message": "No eres miembro de ese chat"})
         return
 
-    msg = db.save_message(chat_id=chat_id, sender_id=user_id, kind=kind, content=content)
-    await broadcast_to_chat(chat_id, "message:receive", msg)
+    # se confirma (message:ack) y se reenvía al chat cuando el lote hace commit
+    message_writer.submit(chat_id, user_id, kind, content, meta=(ws, (data or {}).get("clientId")))
+
+
+async def on_messages_committed(batch):
+    if bus.distributed and db.recent_messages.enabled:
+        # los cachés de mensajes recientes de los otros workers se mantienen igual que el local
+        bus.publish(None, {"kind": "messages", "messages": [msg for msg, _ in batch]})
+    # un solo lookup de destinatarios por chat del lote, no uno por mensaje
+    frames: dict[str, list[str]] = {}
+    for msg, (ws, client_id) in batch:
+        try:
+            await send(ws, "message:ack", {"chatId": msg["chatId"], "clientId": client_id, "message": msg})
+        except Exception:
+            pass
+        frames.setdefault(msg["chatId"], []).append(protocol.make("message:receive", msg))
+    for chat_id, chat_frames in frames.items():
+        await broadcast_frames_to_chat(chat_id, chat_frames)
+
+
+async def on_messages_failed(batch, error):
+    if LOG_WS_DISCONNECTS:
+        print(f"[DB] no se pudo guardar un lote de {len(batch)} mensajes: {error}")
+    for msg, (ws, client_id) in batch:
+        try:
+            await send(ws, "message:error", {
+                "chatId": msg["chatId"],
+                "clientId": client_id,
+                "message": "No se pudo guardar el mensaje",
+                "retry": True,
+            })
+        except Exception:
+            pass
+
+
+message_writer = MessageWriter(
+    # sin tiempo límite: el resultado de una escritura se tiene que conocer (ver DBExecutor.run)
+    save=lambda messages: adb.save_messages(messages, timeout=0),
+    saved=adb.saved_message_seqs,
+    on_commit=on_messages_committed,
+    on_error=on_messages_failed,
+    max_batch=MESSAGE_BATCH_MAX,
+    max_delay=MESSAGE_BATCH_DELAY_MS / 1000,
+    max_pending=MESSAGE_QUEUE_MAX,
+)
+
+
+# ---------------- ADJUNTOS ----------------
+async def _attachment_content(chat_id: str, ref) -> str | None:
+    # el mensaje guarda solo la referencia; la firma prueba que el objeto se subió para este chat.
+    # El tamaño sale del objeto guardado y el tipo y el nombre se validan otra vez: el cliente
+    # puede mandar una referencia distinta a la que recibió en attachment:upload:ok
+    if not isinstance(ref, dict) or not attachments.store.verify(chat_id, ref.get("id"), ref.get("sig")):
+        return None
+    try:
+        mime = attachments.store.check_mime(ref.get("mime"))
+    except attachments.AttachmentError:
+        return None
+    size = await asyncio.to_thread(attachments.store.size_of, ref["id"])
+    if size is None:
+        return None
+    return json.dumps({
+        "id": ref["id"],
+        "name": attachments.clean_name(ref.get("name")),
+        "mime": mime,
+        "size": size,
+        "sig": ref["sig"],
+    }, ensure_ascii=False)
+
+
+async def handle_attachment_begin(ws, user_id, data):
+    data = data or {}
+    client_id = data.get("clientId")
+    chat_id = data.get("chatId")
+    if not attachments.store.enabled:
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "Adjuntos desactivados"})
+        return
+    try:
+        size = int(data.get("size") or 0)
+    except (TypeError, ValueError):
+        size = 0
+    if not chat_id or not size:
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "Faltan campos"})
+        return
+    session = registry.get(ws)
+    if session is None:
+        return
+    if len(session.uploads or ()) >= ATTACHMENT_UPLOADS_PER_SESSION:
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "Demasiadas subidas en curso", "retry": True})
+        return
+    if not await adb.user_is_member(chat_id, user_id):
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "No eres miembro de ese chat"})
+        return
+    try:
+        upload = await asyncio.to_thread(attachments.store.begin, chat_id, size, data.get("mime"), data.get("name"))
+    except (attachments.AttachmentError, OSError) as e:
+        await send(ws, "attachment:error", {"clientId": client_id, "message": str(e)})
+        return
+    if session.uploads is None:
+        session.uploads = {}
+    session.uploads[upload.id] = upload
+    await send(ws, "attachment:begin:ok", {
+        "clientId": client_id,
+        "uploadId": upload.transfer_id,
+        "chunkSize": attachments.store.chunk_size,
+    })
+
+
+async def handle_attachment_chunk(ws, frame: bytes):
+    # frame binario: HEADER (uploadId, offset) + datos; los tramos llegan en orden por el socket
+    session = registry.get(ws)
+    if session is None or not session.user_id:
+        await send(ws, "error", {"message": "No autenticado"})
+        return
+    try:
+        transfer_id, offset, chunk = attachments.parse_frame(frame)
+    except attachments.AttachmentError as e:
+        await send(ws, "attachment:error", {"message": str(e)})
+        return
+    upload = (session.uploads or {}).get(transfer_id)
+    if upload is None:
+        await send(ws, "attachment:error", {"uploadId": str(uuid.UUID(bytes=transfer_id)), "message": "Subida desconocida"})
+        return
+    if offset != upload.received:
+        # no se descarta lo recibido: el cliente sigue desde `received`
+        await send(ws, "attachment:error", {
+            "uploadId": upload.transfer_id,
+            "message": "Offset inesperado",
+            "received": upload.received,
+        })
+        return
+    if not chunk or len(chunk) > attachments.store.chunk_size or upload.received + len(chunk) > upload.size:
+        await _abort_upload(session, upload, "Tramo inválido")
+        return
+    try:
+        # escribir y hashear fuera del event loop; el siguiente frame se lee al terminar
+        done = await asyncio.to_thread(upload.write, chunk)
+        if not done:
+            return
+        del session.uploads[transfer_id]
+        ref = await asyncio.to_thread(attachments.store.finish, upload)
+    except OSError as e:
+        if LOG_WS_DISCONNECTS:
+            print(f"[Attachments] error guardando la subida {upload.transfer_id}: {e}")
+        await _abort_upload(session, upload, "No se pudo guardar el adjunto")
+        return
+    await send(ws, "attachment:upload:ok", {"uploadId": upload.transfer_id, "attachment": ref})
+
+
+async def _abort_upload(session, upload, message: str):
+    (session.uploads or {}).pop(upload.id, None)
+    await asyncio.to_thread(attachments.store.abort, upload)
+    await send(session.ws, "attachment:error", {"uploadId": upload.transfer_id, "message": message})
+
+
+async def handle_attachment_get(ws, user_id, data):
+    data = data or {}
+    chat_id = data.get("chatId")
+    digest = str(data.get("id") or "")
+    client_id = data.get("clientId")
+    session = registry.get(ws)
+    if session is None:
+        return
+    if not chat_id or not attachments.store.verify(chat_id, digest, data.get("sig")):
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "Adjunto inválido"})
+        return
+    if not await adb.user_is_member(chat_id, user_id):
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "No eres miembro de ese chat"})
+        return
+    if len(session.downloads or ()) >= ATTACHMENT_DOWNLOADS_PER_SESSION:
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "Demasiadas descargas en curso", "retry": True})
+        return
+    size = await asyncio.to_thread(attachments.store.size_of, digest)
+    if size is None:
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "Adjunto no encontrado"})
+        return
+    try:
+        offset = int(data.get("offset") or 0)
+        length = int(data.get("length") or size - offset)
+    except (TypeError, ValueError):
+        offset, length = -1, 0
+    if not 0 <= offset < size or length <= 0:
+        await send(ws, "attachment:error", {"clientId": client_id, "message": "Rango inválido", "size": size})
+        return
+    length = min(length, size - offset)
+
+    transfer_id = uuid.uuid4().bytes
+    reply = {
+        "clientId": client_id,
+        "transferId": str(uuid.UUID(bytes=transfer_id)),
+        "id": digest,
+        "size": size,
+        "offset": offset,
+        "length": length,
+        "chunkSize": attachments.store.chunk_size,
+    }
+    if session.downloads is None:
+        session.downloads = {}
+    session.downloads[transfer_id] = asyncio.create_task(stream_attachment(session, transfer_id, digest, offset, length, reply))
+
+
+async def stream_attachment(session, transfer_id: bytes, digest: str, offset: int, length: int, reply: dict):
+    ws = session.ws
+    attachments.store.downloads += 1
+    try:
+        # la respuesta va por el mismo camino que los tramos, así llega antes que ellos;
+        # ws.send espera a que el socket drene: la descarga avanza al ritmo del cliente
+        # sin ocupar la cola de salida
+        await ws.send(protocol.make("attachment:get:ok", reply))
+        end = offset + length
+        while offset < end:
+            chunk = await asyncio.to_thread(attachments.store.read, digest, offset, min(attachments.store.chunk_size, end - offset))
+            if not chunk:
+                break
+            await ws.send(attachments.make_frame(transfer_id, offset, chunk))
+            offset += len(chunk)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # socket cerrado o archivo ilegible: el cliente vuelve a pedir el rango que le falte
+        if LOG_WS_DISCONNECTS:
+            print(f"[Attachments] descarga {reply['transferId']} interrumpida: {e}")
+    finally:
+        if session.downloads:
+            session.downloads.pop(transfer_id, None)
+
+
+async def handle_attachment_cancel(ws, data):
+    session = registry.get(ws)
+    try:
+        transfer_id = uuid.UUID(str((data or {}).get("transferId"))).bytes
+    except ValueError:
+        return
+    upload = (session.uploads or {}).pop(transfer_id, None) if session else None
+    if upload is not None:
+        await asyncio.to_thread(attachments.store.abort, upload)
+    task = (session.downloads or {}).get(transfer_id) if session else None
+    if task is not None:
+        task.cancel()
+
+
+async def handle_server_stats(ws, user_id):
+    if not EXPOSE_STATS:
+        await send(ws, "error", {"message": "Evento no soportado: server:stats"})
+        return
+    # lee el archivo SQLite del índice: fuera del event loop
+    message_index_stats = await asyncio.to_thread(db.message_index.stats)
+    await send(ws, "server:stats:ok", {
+        "db": db_executor.stats(),
+        "storage": db.get_storage().stats(),
+        "auth": passwords.stats(),
+        "messageWriter": message_writer.stats(),
+        "fanout": {
+            **fanout_metrics.stats(),
+            "connections": len(registry),
+            "deepestQueue": max((len(s.outbox) for s in registry.sessions()), default=0),
+            "policy": SLOW_CONSUMER_POLICY,
+        },
+        "membership": db.membership.stats(),
+        "profiles": db.profiles.stats(),
+        "profileIds": db.profile_ids.stats(),
+        "userIndex": db.user_index.stats(),
+        "messageIndex": message_index_stats,
+        "attachments": attachments.store.stats(),
+        "messageCache": db.recent_messages.stats(),
+        "tokens": auth.verified_tokens.stats(),
+        "presence": presence.stats(),
+        "sessions": registry.stats(),
+        "bus": bus.stats(),
+    })
 
 
 # ---------------- ROUTER ----------------
@@ -374,25 +1113,59 @@ async def router(ws, msg: dict):
     # user lookup
     if t == "user:findByUsername":
         return await handle_user_find_by_username(ws, user_id, d)
+    if t == "user:search":
+        return await handle_user_search(ws, user_id, d)
 
     # room join
     if t == "room:join":
         return await handle_room_join(ws, user_id, d)
+    if t == "room:joinMany":
+        return await handle_room_join_many(ws, user_id, d)
+    if t == "room:leave":
+        return await handle_room_leave(ws, user_id, d)
 
     # messages / presence / rtc
     if t == "message:send":
         return await handle_message_send(ws, user_id, d)
+    if t == "message:history":
+        return await handle_message_history(ws, user_id, d)
+    if t == "message:search":
+        return await handle_message_search(ws, user_id, d)
+    if t == "sync":
+        return await handle_sync(ws, user_id, d)
+    if t == "attachment:begin":
+        return await handle_attachment_begin(ws, user_id, d)
+    if t == "attachment:get":
+        return await handle_attachment_get(ws, user_id, d)
+    if t == "attachment:cancel":
+        return await handle_attachment_cancel(ws, d)
     if t == "presence:update":
         return await handle_presence_update(ws, user_id, d)
     if t == "rtc:signal":
         return await handle_rtc_signal(ws, user_id, d)
 
+    # diagnóstico
+    if t == "server:stats":
+        return await handle_server_stats(ws, user_id)
+
     await send(ws, "error", {"message": f"Evento no soportado: {t}"})
 
 
 async def handler(ws):
+    session = registry.open(ws, Outbox(ws, OUTBOX_MAX_FRAMES, SLOW_CONSUMER_POLICY, fanout_metrics))
     try:
         async for raw in ws:
+            session.received += 1
+            if isinstance(raw, bytes):
+                # tramo de un adjunto: no pasa por el parser JSON
+                await handle_attachment_chunk(ws, raw)
+                continue
+            # el límite es en bytes (UTF-8): solo se codifica si los caracteres no alcanzan a decidir
+            if len(raw) > WS_MAX_TEXT_KB * 1024 or (
+                len(raw) * 4 > WS_MAX_TEXT_KB * 1024 and len(raw.encode()) > WS_MAX_TEXT_KB * 1024
+            ):
+                await send(ws, "error", {"message": "Mensaje demasiado grande"})
+                continue
             try:
                 msg = protocol.parse(raw)
             except Exception as e:
@@ -404,7 +1177,21 @@ async def handler(ws):
                 if not closed:
                     await send(ws, "error", {"message": str(e)})
                 continue
-            await router(ws, msg)
+            try:
+                await router(ws, msg)
+            except DBOutcomeUnknownError as e:
+                # la operación puede completarse igual: el cliente no debe repetirla a ciegas
+                if LOG_WS_DISCONNECTS:
+                    print(f"[DB] {e}")
+                await send(ws, "error", {"message": "La operación tardó demasiado; revisa si se completó"})
+            except (DBBusyError, DBTimeoutError, PoolTimeoutError) as e:
+                # DB saturada: se responde rápido en lugar de bloquear al resto
+                if LOG_WS_DISCONNECTS:
+                    print(f"[DB] {e}")
+                await send(ws, "error", {"message": "Servidor ocupado, intenta de nuevo", "retry": True})
+            except InvalidIdError as e:
+                # un chatId/userId/cursor inventado por el cliente (MySQL guarda los ids como BINARY(16))
+                await send(ws, "error", {"message": str(e)})
     except websockets.exceptions.ConnectionClosedOK:
         # cierre normal del cliente
         pass
@@ -414,34 +1201,143 @@ async def handler(ws):
             print(f"[WS] conexión cerrada abruptamente: {e}")
     finally:
         # cleanup
-        uid = ws_to_user.pop(ws, None)
-        if uid:
-            sockets = user_to_ws.get(uid)
-            if sockets:
-                sockets.discard(ws)
-                if not sockets:
-                    user_to_ws.pop(uid, None)
-                    db.set_user_status(uid, "offline")
-                    await broadcast_presence(uid, "offline")
-        # saca de rooms
-        for s in rooms.values():
-            s.discard(ws)
+        # saca la sesión de sus rooms (las vacías se eliminan) y de su usuario
+        session, was_last = registry.close(ws)
+        session.outbox.close()
+        for task in (session.downloads or {}).values():
+            task.cancel()
+        # cerrar y borrar los .part toca disco: fuera del event loop, sin esperar
+        loop = asyncio.get_running_loop()
+        for upload in (session.uploads or {}).values():
+            loop.run_in_executor(None, attachments.store.abort, upload)
+        uid = session.user_id
+        if uid and was_last:
+            bus.announce(uid, False)
+            if bus.distributed and bus.workers_of((uid,)):
+                # sigue conectado en otro worker: ese worker maneja su presencia
+                presence.forget(uid)
+            else:
+                # se anuncia tras la gracia de reconexión; si vuelve antes, no se anuncia nada
+                presence.set(uid, "offline", delay=RECONNECT_GRACE_MS / 1000)
 
 
 async def main():
     scheme = "wss" if ssl_context else "ws"
-    print(f"WS server: {scheme}://{HOST}:{PORT}")
-
+    index_task = archive_task = message_index_task = None
+    # todo el arranque va dentro del try: una señal o un error a mitad de camino igual
+    # pasa por el cierre de abajo (cada close tolera lo que no llegó a arrancar)
     try:
-        async with websockets.serve(handler, HOST, PORT, ssl=ssl_context):
+        try:
+            # SIGTERM (supervisor, systemd, docker) detiene igual que Ctrl+C: se guarda lo pendiente
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            # Windows: sin señales en el event loop
+            pass
+
+        passwords.start()
+        storage = db.get_storage()
+        worker = f", worker {bus.worker_id}" if bus.distributed else ""
+        print(f"WS server: {scheme}://{HOST}:{PORT} (storage: {storage.name}{worker})")
+
+        await bus.start(on_bus_event, local_users=registry.users)
+        message_writer.start()
+        presence.start()
+        # el índice de user:search se carga de fondo; los registros que lleguen mientras tanto se suman
+        index_task = asyncio.create_task(load_user_index())
+        archive_task = asyncio.create_task(archive_loop()) if db.ARCHIVE_AFTER_DAYS > 0 else None
+        # el índice de message:search se reconstruye de fondo solo si falta o cambió de versión
+        message_index_task = asyncio.create_task(build_message_index()) if db.message_index.enabled else None
+        async with websockets.serve(
+            handler, HOST, PORT, ssl=ssl_context, reuse_port=WORKERS > 1, max_size=WS_MAX_FRAME_BYTES
+        ):
             await asyncio.Future()  # run forever
     except asyncio.CancelledError:
         # salida limpia al detener el proceso
         pass
+    finally:
+        # guarda (y confirma) los mensajes que quedaban en cola antes de cerrar la DB
+        await message_writer.close()
+        await presence.close()
+        for task in (index_task, archive_task, message_index_task):
+            if task is not None:
+                task.cancel()
+        await bus.close()
+        db_executor.shutdown()
+        db.message_index.close()
+        db.close_storage()
+        passwords.shutdown()
+
+
+async def load_user_index():
+    try:
+        # fuera del pool de DB: la carga puede durar más que DB_CALL_TIMEOUT
+        count = await asyncio.to_thread(db.load_user_index)
+        print(f"[Search] índice de usuarios listo: {count}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[Search] no se pudo cargar el índice de usuarios: {e}")
+
+
+async def build_message_index():
+    # hasta que quede listo: si la pasada falla se reintenta con espera creciente, y si la
+    # tiene otro worker se vuelve a mirar tras BUILD_STALE_MS (si ese worker murió, se reclama)
+    delay = 5.0
+    while not await asyncio.to_thread(db.message_index.check_ready):
+        try:
+            count = await asyncio.to_thread(db.rebuild_message_index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Search] no se pudo reconstruir el índice de mensajes: {e}; reintento en {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 600.0)
+            continue
+        if count is not None:
+            print(f"[Search] índice de mensajes reconstruido: {count}")
+        else:
+            await asyncio.sleep(BUILD_STALE_MS / 1000)
+
+
+async def archive_loop():
+    # cada worker corre su ciclo; el candado por chat evita que dos archiven lo mismo y el
+    # arranque escalonado reparte las corridas entre workers
+    if bus.distributed:
+        await asyncio.sleep(random.uniform(0, ARCHIVE_INTERVAL_S))
+    while True:
+        try:
+            started = time.monotonic()
+            moved = await asyncio.to_thread(db.archive_old_messages)
+            if moved:
+                print(f"[Archive] {moved} mensajes archivados en {time.monotonic() - started:.1f}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Archive] error archivando mensajes: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_S)
+
+
+def run_worker():
+    # Ctrl+C llega a todo el grupo de procesos: la salida la coordina el supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(main())
 
 
 if __name__ == "__main__":
+    if db.DB_MIGRATE:
+        # una sola vez, antes de levantar los workers
+        applied = db.migrate()
+        if applied:
+            print(f"[DB] migraciones aplicadas: {applied}")
+    # subidas a medias que dejó un proceso anterior
+    attachments.store.cleanup()
     try:
-        asyncio.run(main())
+        if WORKERS > 1:
+            from workers import run_workers
+
+            print(f"Modo multi-proceso: {WORKERS} workers (bus: {BUS_SOCKET})")
+            run_workers(WORKERS, run_worker, BUS_SOCKET, peer_queue_bytes=int(BUS_PEER_QUEUE_MB * 2**20))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("WS server detenido")
@@ -0,0 +1,202 @@
+import secrets
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable
+
+_EMPTY: tuple = ()
+
+
+class Session:
+    """Estado de una conexión. Con __slots__ una sesión ociosa cuesta un solo objeto pequeño."""
+
+    __slots__ = ("ws", "user_id", "rooms", "connected_at", "received", "outbox", "resume_id", "search", "uploads", "downloads")
+
+    def __init__(self, ws, outbox=None):
+        self.ws = ws
+        self.user_id: str | None = None
+        # None hasta que se une a la primera room (la mayoría de sockets ociosos no tienen)
+        self.rooms: set[str] | None = None
+        self.connected_at = time.time()
+        self.received = 0
+        self.outbox = outbox
+        # id que el cliente devuelve en `hello` al reconectar para recuperar sus rooms:
+        # aleatorio (no se adivina ni se repite entre workers) y además solo vale junto
+        # con un token válido del mismo usuario
+        self.resume_id: str | None = None
+        # última user:search pendiente mientras hay una en curso (solo corre la más nueva)
+        self.search: tuple | None = None
+        # adjuntos en curso (id de transferencia -> Upload / tarea de descarga); None si no hay
+        self.uploads: dict | None = None
+        self.downloads: dict | None = None
+
+    def __repr__(self):
+        return f"<Session user={self.user_id} rooms={len(self.rooms or ())}>"
+
+
+# Índices clave -> sesiones. Con una sola sesión se guarda el objeto directamente;
+# el set aparece solo cuando hay dos o más (usuario con varias pestañas, room compartida).
+def _index_add(index: dict, key: str, session: Session):
+    current = index.get(key)
+    if current is None:
+        index[key] = session
+    elif isinstance(current, set):
+        current.add(session)
+    elif current is not session:
+        index[key] = {current, session}
+
+
+def _index_discard(index: dict, key: str, session: Session) -> bool:
+    # True si la clave quedó sin sesiones (y se eliminó del índice)
+    current = index.get(key)
+    if current is None:
+        return False
+    if isinstance(current, set):
+        current.discard(session)
+        if len(current) > 1:
+            return False
+        if current:
+            index[key] = next(iter(current))
+            return False
+    elif current is not session:
+        return False
+    del index[key]
+    return True
+
+
+def _index_get(index: dict, key: str) -> Iterable[Session]:
+    current = index.get(key)
+    if current is None:
+        return _EMPTY
+    if isinstance(current, set):
+        return current
+    return (current,)
+
+
+class SessionRegistry:
+    """Dueño de todos los índices de sesiones: por socket, por usuario y por room.
+
+    Cada sesión guarda sus propias rooms, así desconectar cuesta O(rooms del socket)
+    y cada room se elimina en cuanto queda vacía.
+    """
+
+    def __init__(self, resume_grace: float = 30.0, resume_max: int = 10000):
+        self._by_ws: dict[Hashable, Session] = {}
+        self._by_user: dict[str, Session | set[Session]] = {}
+        self._by_room: dict[str, Session | set[Session]] = {}
+        # sesiones cerradas que aún se pueden retomar: resume_id -> (userId, rooms, vence)
+        self.resume_grace = resume_grace
+        self.resume_max = resume_max
+        self._parked: OrderedDict[str, tuple[str, frozenset, float]] = OrderedDict()
+        self.resumed = 0
+
+    def __len__(self):
+        return len(self._by_ws)
+
+    def open(self, ws, outbox=None) -> Session:
+        session = Session(ws, outbox)
+        self._by_ws[ws] = session
+        return session
+
+    def get(self, ws) -> Session | None:
+        return self._by_ws.get(ws)
+
+    def sessions(self) -> Iterable[Session]:
+        return self._by_ws.values()
+
+    # ---------------- usuarios ----------------
+    def bind(self, session: Session, user_id: str):
+        if session.user_id == user_id:
+            return
+        if session.user_id is not None:
+            # otro usuario en el mismo socket: no hereda las rooms del anterior
+            _index_discard(self._by_user, session.user_id, session)
+            for chat_id in session.rooms or _EMPTY:
+                _index_discard(self._by_room, chat_id, session)
+            session.rooms = None
+        session.user_id = user_id
+        session.resume_id = secrets.token_urlsafe(16)
+        _index_add(self._by_user, user_id, session)
+
+    def sessions_of(self, user_id: str) -> Iterable[Session]:
+        return _index_get(self._by_user, user_id)
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self._by_user
+
+    def users(self) -> Iterable[str]:
+        return list(self._by_user)
+
+    # ---------------- rooms ----------------
+    def join(self, session: Session, chat_id: str):
+        if session.rooms is None:
+            session.rooms = set()
+        session.rooms.add(chat_id)
+        _index_add(self._by_room, chat_id, session)
+
+    def leave(self, session: Session, chat_id: str) -> bool:
+        if not session.rooms or chat_id not in session.rooms:
+            return False
+        session.rooms.discard(chat_id)
+        if not session.rooms:
+            session.rooms = None
+        _index_discard(self._by_room, chat_id, session)
+        return True
+
+    def room(self, chat_id: str) -> Iterable[Session]:
+        return _index_get(self._by_room, chat_id)
+
+    # ---------------- desconexión ----------------
+    def close(self, ws) -> tuple[Session | None, bool]:
+        """Quita la sesión de todos los índices.
+
+        Devuelve (sesión, era_la_última_sesión_del_usuario).
+        """
+        session = self._by_ws.pop(ws, None)
+        if session is None:
+            return None, False
+        if session.rooms and session.resume_id is not None:
+            self._park(session)
+        for chat_id in session.rooms or _EMPTY:
+            _index_discard(self._by_room, chat_id, session)
+        session.rooms = None
+        if session.user_id is None:
+            return session, False
+        return session, _index_discard(self._by_user, session.user_id, session)
+
+    # ---------------- reanudación ----------------
+    def _park(self, session: Session):
+        now = time.monotonic()
+        self._expire(now)
+        self._parked[session.resume_id] = (session.user_id, frozenset(session.rooms), now + self.resume_grace)
+        while len(self._parked) > self.resume_max:
+            self._parked.popitem(last=False)
+
+    def _expire(self, now: float):
+        # se estacionan en orden de cierre: las vencidas están al principio
+        while self._parked:
+            _, (_, _, expires) = next(iter(self._parked.items()))
+            if expires > now:
+                return
+            self._parked.popitem(last=False)
+
+    def resume(self, session: Session, resume_id: str) -> frozenset:
+        """Rooms de la sesión cerrada `resume_id` si es del mismo usuario y no venció.
+
+        Si el id es de otro usuario no se consume: su dueño aún puede retomarla.
+        """
+        self._expire(time.monotonic())
+        parked = self._parked.get(resume_id)
+        if parked is None or parked[0] != session.user_id:
+            return frozenset()
+        del self._parked[resume_id]
+        self.resumed += 1
+        return parked[1]
+
+    def stats(self) -> dict:
+        return {
+            "sockets": len(self._by_ws),
+            "users": len(self._by_user),
+            "rooms": len(self._by_room),
+            "resumable": len(self._parked),
+            "resumed": self.resumed,
+        }
@@ -0,0 +1,41 @@
+import os
+
+from .base import Storage, to_public_user
+from .ids import InvalidIdError
+from .pool import PoolTimeoutError
+
+BACKENDS = ("mysql", "sqlite", "memory")
+
+
+def create_storage(kind: str, pool_size: int = 10) -> Storage:
+    kind = (kind or "mysql").strip().lower()
+
+    if kind == "mysql":
+        # import diferido: sqlite/memory no requieren mysql-connector
+        from .mysql import MySQLStorage
+
+        return MySQLStorage(
+            host=os.getenv("MYSQL_HOST", "127.0.0.1"),
+            port=int(os.getenv("MYSQL_PORT", "3306")),
+            user=os.getenv("MYSQL_USER", "root"),
+            password=os.getenv("MYSQL_PASSWORD", ""),
+            database=os.getenv("MYSQL_DB", "chatapp"),
+            pool_size=pool_size,
+            pool_min=int(os.getenv("MYSQL_POOL_MIN", "2")),
+            pool_timeout=float(os.getenv("MYSQL_POOL_TIMEOUT_S", "5")),
+            pool_idle=float(os.getenv("MYSQL_POOL_IDLE_S", "60")),
+            pool_check=float(os.getenv("MYSQL_POOL_CHECK_S", "30")),
+        )
+    if kind == "sqlite":
+        from .sqlite import SQLiteStorage
+
+        return SQLiteStorage(os.getenv("SQLITE_PATH", "chatapp.sqlite3"), pool_size=pool_size)
+    if kind == "memory":
+        from .memory import MemoryStorage
+
+        return MemoryStorage(pool_size=pool_size)
+
+    raise ValueError(f"STORAGE_BACKEND desconocido: {kind} (usa {', '.join(BACKENDS)})")
+
+
+__all__ = ["BACKENDS", "InvalidIdError", "PoolTimeoutError", "Storage", "create_storage", "to_public_user"]
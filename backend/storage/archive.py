@@ -0,0 +1,42 @@
+"""Formato de los segmentos de mensajes archivados.
+
+Un segmento es un bloque inmutable de mensajes consecutivos de un chat, en orden
+(createdAt, id), guardado como JSON comprimido con zlib en una fila de
+message_segments. La fila lleva además la posición del primer y último mensaje y
+el seq máximo, para elegir qué segmentos leer sin descomprimirlos.
+"""
+import json
+import zlib
+
+# orden de los campos en cada fila del JSON; chatId va en la fila del segmento
+_FIELDS = ("id", "senderId", "kind", "content", "createdAt", "seq")
+
+
+def pack(messages: list[dict]) -> bytes:
+    rows = [[m[f] for f in _FIELDS] for m in messages]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack(chat_id: str, data: bytes) -> list[dict]:
+    out = []
+    for row in json.loads(zlib.decompress(data)):
+        m = dict(zip(_FIELDS, row))
+        m["chatId"] = chat_id
+        out.append(m)
+    return out
+
+
+def segment_row(chat_id: str, segment: int, messages: list[dict]) -> dict:
+    first, last = messages[0], messages[-1]
+    seqs = [m["seq"] for m in messages if m["seq"] is not None]
+    return {
+        "chatId": chat_id,
+        "segment": segment,
+        "firstCreatedAt": first["createdAt"],
+        "firstId": first["id"],
+        "lastCreatedAt": last["createdAt"],
+        "lastId": last["id"],
+        "maxSeq": max(seqs) if seqs else None,
+        "count": len(messages),
+        "data": pack(messages),
+    }
@@ -0,0 +1,278 @@
+import time
+from abc import ABC, abstractmethod
+
+from .ids import new_id
+
+
+def new_message(chat_id: str, sender_id: str, kind: str, content: str, created_ms: int | None = None) -> dict:
+    return {
+        "id": new_id(),
+        "chatId": chat_id,
+        "senderId": sender_id,
+        "kind": kind,
+        "content": content,
+        "createdAt": created_ms if created_ms is not None else int(time.time() * 1000),
+        # número de secuencia dentro del chat; lo asigna save_messages
+        "seq": None,
+    }
+
+
+def message_cursor(msg: dict) -> str:
+    # cursor opaco para el cliente: posición (createdAt, id) de un mensaje
+    return f"{msg['createdAt']}:{msg['id']}"
+
+
+def parse_cursor(cursor: str) -> tuple[int, str]:
+    created_at, sep, msg_id = str(cursor).partition(":")
+    if not sep or not msg_id or not created_at.isdigit():
+        raise ValueError("Cursor inválido")
+    return int(created_at), msg_id
+
+
+def sync_cursor(chat_id: str, seq: int) -> str:
+    # continuación de `sync`: último (chat, seq) entregado
+    return f"{seq}:{chat_id}"
+
+
+def chat_sort_key(chat_id: str) -> str:
+    """Orden de los chats en `sync`: el filtro del cursor en handle_sync tiene que
+    coincidir con el ORDER BY chatId de list_messages_after_seq.
+
+    Vale porque todo chatId sale de new_id (UUID canónico en minúsculas): su orden como
+    texto es el de sus 16 bytes, el mismo en MySQL (BINARY(16) o CHAR) y en SQLite. La
+    memoria y la mezcla con los segmentos archivados ordenan con esta función.
+    """
+    return str(chat_id).lower()
+
+
+def parse_sync_cursor(cursor: str) -> tuple[str, int]:
+    seq, sep, chat_id = str(cursor).partition(":")
+    if not sep or not chat_id or not seq.isdigit():
+        raise ValueError("Cursor inválido")
+    return chat_id, int(seq)
+
+
+def to_public_user(row: dict) -> dict:
+    return {
+        "id": row["id"],
+        "username": row["username"],
+        "displayName": row.get("displayName"),
+        "avatarUrl": row.get("avatarUrl"),
+        "status": row.get("status", "offline"),
+    }
+
+
+class Storage(ABC):
+    """Operaciones de persistencia que usa server.py (users, chats, chat_members, messages)."""
+
+    name = "base"
+    # ARCHIVE_AFTER_DAYS > 0: algún worker puede mover mensajes a segmentos en cualquier momento
+    archive_enabled = False
+
+    # ---------------- USERS ----------------
+    @abstractmethod
+    def create_user(self, username: str, displayName: str, email: str | None, password_hash: str) -> dict: ...
+
+    @abstractmethod
+    def get_user_by_username(self, username: str) -> dict | None: ...
+
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> dict | None: ...
+
+    @abstractmethod
+    def get_user_by_id(self, user_id: str) -> dict | None: ...
+
+    @abstractmethod
+    def set_user_status(self, user_id: str, status: str): ...
+
+    @abstractmethod
+    def set_user_password_hash(self, user_id: str, password_hash: str): ...
+
+    def set_users_status(self, statuses: dict[str, str]):
+        # userId -> estado; los motores SQL lo hacen en una transacción
+        for user_id, status in statuses.items():
+            self.set_user_status(user_id, status)
+
+    # Alias legacy
+    def find_user_by_username(self, username: str) -> dict | None:
+        return self.get_user_by_username(username)
+
+    def get_user_public_by_username(self, username: str) -> dict | None:
+        u = self.get_user_by_username(username)
+        return to_public_user(u) if u else None
+
+    def get_user_public_by_id(self, user_id: str) -> dict | None:
+        u = self.get_user_by_id(user_id)
+        return to_public_user(u) if u else None
+
+    def get_users_public_by_ids(self, user_ids: list[str]) -> dict[str, dict]:
+        # userId -> usuario público (los inexistentes no aparecen); SQL: una consulta
+        found = {}
+        for user_id in user_ids:
+            u = self.get_user_public_by_id(user_id)
+            if u:
+                found[user_id] = u
+        return found
+
+    def email_in_use(self, email: str) -> bool:
+        return self.get_user_by_email(email) is not None
+
+    @abstractmethod
+    def list_users_brief(self, after_id: str = "", limit: int = 1000) -> list[dict]:
+        """{id, username, displayName} de los usuarios con id > after_id, ordenados por id."""
+
+    # ---------------- CHATS ----------------
+    @abstractmethod
+    def _get_last_message_for_chat(self, chat_id: str) -> dict | None: ...
+
+    @abstractmethod
+    def list_members_for_chat(self, chat_id: str) -> list[dict]: ...
+
+    @abstractmethod
+    def list_chats_for_user(self, user_id: str) -> list[dict]: ...
+
+    @abstractmethod
+    def get_chat_for_user(self, chat_id: str, user_id: str) -> dict | None: ...
+
+    @abstractmethod
+    def user_is_member(self, chat_id: str, user_id: str) -> bool: ...
+
+    @abstractmethod
+    def list_related_user_ids(self, user_id: str) -> list[str]: ...
+
+    @abstractmethod
+    def list_user_ids_for_chat(self, chat_id: str) -> list[str]: ...
+
+    @abstractmethod
+    def list_chat_ids_for_user(self, user_id: str) -> list[str]: ...
+
+    @abstractmethod
+    def add_chat_member(self, chat_id: str, user_id: str, role: str = "member"): ...
+
+    @abstractmethod
+    def create_group_chat(self, title: str, description: str | None, owner_id: str) -> dict: ...
+
+    @abstractmethod
+    def find_direct_chat_between(self, a: str, b: str) -> dict | None: ...
+
+    @abstractmethod
+    def create_direct_chat(self, a: str, b: str) -> dict: ...
+
+    @staticmethod
+    def _assemble_chat(base_chat: dict, members: list[dict], last_message: dict | None, user_id: str) -> dict:
+        chat = {
+            "id": base_chat["id"],
+            "type": base_chat["type"],
+            "title": base_chat["title"],
+            "description": base_chat.get("description"),
+            "members": members,
+        }
+
+        if chat["type"] == "direct":
+            other = next((m for m in members if m["id"] != user_id), None)
+            if other:
+                chat["title"] = other.get("displayName") or other.get("username") or chat["title"]
+
+        if last_message:
+            chat["lastMessage"] = last_message
+
+        return chat
+
+    def _hydrate_chat_for_user(self, base_chat: dict, user_id: str) -> dict:
+        members = self.list_members_for_chat(base_chat["id"])
+        last_message = self._get_last_message_for_chat(base_chat["id"])
+        return self._assemble_chat(base_chat, members, last_message, user_id)
+
+    # ---------------- MESSAGES ----------------
+    def save_message(self, chat_id: str, sender_id: str, kind: str, content: str) -> dict:
+        msg = new_message(chat_id, sender_id, kind, content)
+        self.save_messages([msg])
+        return msg
+
+    @abstractmethod
+    def save_messages(self, messages: list[dict]):
+        """Inserta un lote ya construido (ver new_message) en una sola transacción.
+
+        Asigna `seq` a cada mensaje (consecutivo por chat, en orden (createdAt, id)
+        dentro del lote) y avanza chats.lastSeq/lastMessageId/lastMessageAt.
+        """
+
+    @abstractmethod
+    def saved_message_seqs(self, messages: list[dict]) -> dict[str, int]:
+        """{id: seq} de los mensajes del lote que ya están guardados (reintentos de save_messages)."""
+
+    @abstractmethod
+    def list_messages_page(
+        self,
+        chat_id: str,
+        before: tuple[int, str] | None = None,
+        after: tuple[int, str] | None = None,
+        limit: int = 50,
+    ) -> list[dict]:
+        """Página por keyset sobre (createdAt, id), en orden ascendente.
+
+        `before`: los `limit` mensajes inmediatamente anteriores a esa posición.
+        `after`: los `limit` mensajes inmediatamente posteriores.
+        Sin cursor: los `limit` más recientes.
+        """
+
+    def list_messages(self, chat_id: str, limit: int = 150) -> list[dict]:
+        return self.list_messages_page(chat_id, limit=limit)
+
+    def list_messages_many(self, pages: dict[str, tuple[int, str] | None], limit: int) -> dict[str, list[dict]]:
+        """list_messages_page de varios chats: {chatId: after o None} -> {chatId: mensajes}.
+
+        Los motores SQL lo resuelven en una sola consulta.
+        """
+        return {chat_id: self.list_messages_page(chat_id, after=after, limit=limit) for chat_id, after in pages.items()}
+
+    @abstractmethod
+    def list_messages_after_seq(self, after: dict[str, int], limit: int) -> list[dict]:
+        """Mensajes con seq mayor al indicado por chat, ordenados por (chatId, seq)."""
+
+    @abstractmethod
+    def scan_messages(self, after_id: str = "", limit: int = 1000) -> list[dict]:
+        """Mensajes de la tabla con id > after_id, ordenados por id (para recorrerla por lotes)."""
+
+    def scan_archived(self, after: tuple[str, int] | None = None, limit: int = 100) -> list[dict]:
+        """Segmentos archivados posteriores a (chatId, segment): [{chatId, segment, messages}]."""
+        return []
+
+    @abstractmethod
+    def list_chat_sync_state(self, user_id: str) -> list[dict]:
+        """{id, lastSeq, updatedAt} de cada chat del usuario."""
+
+    @abstractmethod
+    def backfill_last_message(self, batch_size: int = 500) -> int:
+        """Recalcula chats.lastMessageId/lastMessageAt a partir de messages."""
+
+    @abstractmethod
+    def backfill_seq(self, batch_size: int = 500) -> int:
+        """Numera los mensajes guardados antes de que existiera `seq` y fija chats.lastSeq."""
+
+    def archive_messages(self, older_than_ms: int, segment_size: int = 500, batch_size: int = 100) -> int:
+        """Mueve a segmentos comprimidos los mensajes anteriores a `older_than_ms`; devuelve cuántos.
+
+        Las lecturas de historial y `sync` siguen viéndolos. Sin persistencia no hay
+        nada que ganar: por defecto no hace nada.
+        """
+        return 0
+
+    def migrate(self) -> list[int]:
+        # solo MySQL versiona su esquema; SQLite y memoria lo crean al construirse
+        return []
+
+    def full_scans(self, sql: str, params: tuple = ()) -> list[str]:
+        """Tablas que `sql` recorre completas según el plan del motor (vacía si no aplica)."""
+        return []
+
+    def hot_queries(self) -> list[tuple[str, str, tuple]]:
+        """(nombre, sql, parámetros) de las consultas por evento que revisa `check_plans`."""
+        return []
+
+    def stats(self) -> dict:
+        # contadores propios del motor (p. ej. el pool de MySQL) para server:stats
+        return {}
+
+    def close(self):
+        pass
@@ -0,0 +1,259 @@
+import bisect
+import itertools
+import threading
+import time
+
+from .base import Storage, chat_sort_key, to_public_user
+from .ids import new_id
+
+
+def _position(msg: dict) -> tuple[int, str]:
+    return msg["createdAt"], msg["id"]
+
+
+class MemoryStorage(Storage):
+    """Almacenamiento en proceso, sin persistencia. Pensado para benchmarks y soak tests."""
+
+    name = "memory"
+
+    def __init__(self, pool_size: int = 4):
+        self.pool_size = pool_size
+        self._lock = threading.RLock()
+        self._seq = itertools.count()
+        self._users: dict[str, dict] = {}
+        self._users_by_username: dict[str, str] = {}
+        self._users_by_email: dict[str, str] = {}
+        self._chats: dict[str, dict] = {}
+        # chatId -> {userId: role}
+        self._members: dict[str, dict[str, str]] = {}
+        # userId -> {chatId}
+        self._user_chats: dict[str, set[str]] = {}
+        # chatId -> mensajes ordenados por (createdAt, id)
+        self._messages: dict[str, list[dict]] = {}
+        # chatId -> los mismos mensajes en orden de seq (seq N en la posición N-1)
+        self._by_seq: dict[str, list[dict]] = {}
+
+    # ---------------- USERS ----------------
+    def create_user(self, username: str, displayName: str, email: str | None, password_hash: str) -> dict:
+        user_id = new_id()
+        row = {
+            "id": user_id,
+            "username": username,
+            "email": email,
+            "displayName": displayName,
+            "password_hash": password_hash,
+            "avatarUrl": None,
+            "status": "offline",
+        }
+        with self._lock:
+            if username in self._users_by_username or (email and email in self._users_by_email):
+                raise ValueError("Usuario duplicado")
+            self._users[user_id] = row
+            self._users_by_username[username] = user_id
+            if email:
+                self._users_by_email[email] = user_id
+        return {k: v for k, v in row.items() if k != "password_hash"}
+
+    def get_user_by_username(self, username: str) -> dict | None:
+        with self._lock:
+            user_id = self._users_by_username.get(username)
+            return dict(self._users[user_id]) if user_id else None
+
+    def get_user_by_email(self, email: str) -> dict | None:
+        with self._lock:
+            user_id = self._users_by_email.get(email)
+            return dict(self._users[user_id]) if user_id else None
+
+    def get_user_by_id(self, user_id: str) -> dict | None:
+        with self._lock:
+            u = self._users.get(user_id)
+            return dict(u) if u else None
+
+    def set_user_status(self, user_id: str, status: str):
+        with self._lock:
+            u = self._users.get(user_id)
+            if u:
+                u["status"] = status
+
+    def list_users_brief(self, after_id: str = "", limit: int = 1000) -> list[dict]:
+        with self._lock:
+            ids = sorted(uid for uid in self._users if uid > after_id)[:limit]
+            return [
+                {"id": uid, "username": self._users[uid]["username"], "displayName": self._users[uid]["displayName"]}
+                for uid in ids
+            ]
+
+    def set_user_password_hash(self, user_id: str, password_hash: str):
+        with self._lock:
+            u = self._users.get(user_id)
+            if u:
+                u["password_hash"] = password_hash
+
+    # ---------------- CHATS ----------------
+    def _get_last_message_for_chat(self, chat_id: str) -> dict | None:
+        with self._lock:
+            msgs = self._messages.get(chat_id)
+            return dict(msgs[-1]) if msgs else None
+
+    def list_members_for_chat(self, chat_id: str) -> list[dict]:
+        with self._lock:
+            return [
+                to_public_user(self._users[uid])
+                for uid in self._members.get(chat_id, {})
+                if uid in self._users
+            ]
+
+    def list_chats_for_user(self, user_id: str) -> list[dict]:
+        with self._lock:
+            rows = [dict(self._chats[cid]) for cid in self._user_chats.get(user_id, ())]
+        rows.sort(key=lambda ch: (ch["lastMessageAt"] or 0, ch["_seq"]), reverse=True)
+        return [self._hydrate_chat_for_user(row, user_id) for row in rows]
+
+    def get_chat_for_user(self, chat_id: str, user_id: str) -> dict | None:
+        with self._lock:
+            if user_id not in self._members.get(chat_id, {}):
+                return None
+            row = dict(self._chats[chat_id])
+        return self._hydrate_chat_for_user(row, user_id)
+
+    def user_is_member(self, chat_id: str, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._members.get(chat_id, {})
+
+    def list_related_user_ids(self, user_id: str) -> list[str]:
+        with self._lock:
+            related = set()
+            for cid in self._user_chats.get(user_id, ()):
+                related.update(self._members.get(cid, {}))
+            return list(related)
+
+    def list_user_ids_for_chat(self, chat_id: str) -> list[str]:
+        with self._lock:
+            return list(self._members.get(chat_id, {}))
+
+    def list_chat_ids_for_user(self, user_id: str) -> list[str]:
+        with self._lock:
+            return list(self._user_chats.get(user_id, ()))
+
+    def add_chat_member(self, chat_id: str, user_id: str, role: str = "member"):
+        with self._lock:
+            members = self._members.setdefault(chat_id, {})
+            if user_id in members:
+                return
+            members[user_id] = role
+            self._user_chats.setdefault(user_id, set()).add(chat_id)
+            chat = self._chats.get(chat_id)
+            if chat:
+                chat["updatedAt"] = int(time.time() * 1000)
+
+    def _insert_chat(self, type_: str, title: str, description: str | None, members: dict[str, str]) -> str:
+        chat_id = new_id()
+        with self._lock:
+            self._chats[chat_id] = {
+                "id": chat_id,
+                "type": type_,
+                "title": title,
+                "description": description,
+                "lastMessageAt": None,
+                "lastSeq": 0,
+                "updatedAt": int(time.time() * 1000),
+                "_seq": next(self._seq),
+            }
+            self._members[chat_id] = {}
+            for uid, role in members.items():
+                self.add_chat_member(chat_id, uid, role)
+        return chat_id
+
+    def create_group_chat(self, title: str, description: str | None, owner_id: str) -> dict:
+        chat_id = self._insert_chat("group", title, description, {owner_id: "owner"})
+        return self.get_chat_for_user(chat_id, owner_id)
+
+    def find_direct_chat_between(self, a: str, b: str) -> dict | None:
+        with self._lock:
+            common = self._user_chats.get(a, set()) & self._user_chats.get(b, set())
+            row = next((dict(self._chats[cid]) for cid in common if self._chats[cid]["type"] == "direct"), None)
+        return self._hydrate_chat_for_user(row, a) if row else None
+
+    def create_direct_chat(self, a: str, b: str) -> dict:
+        chat_id = self._insert_chat("direct", "", None, {a: "member", b: "member"})
+        return self.get_chat_for_user(chat_id, a)
+
+    # ---------------- MESSAGES ----------------
+    def save_messages(self, messages: list[dict]):
+        with self._lock:
+            for m in sorted(messages, key=_position):
+                by_seq = self._by_seq.setdefault(m["chatId"], [])
+                m["seq"] = len(by_seq) + 1
+                row = dict(m)
+                by_seq.append(row)
+                msgs = self._messages.setdefault(m["chatId"], [])
+                bisect.insort(msgs, row, key=_position)
+                chat = self._chats.get(m["chatId"])
+                if chat:
+                    chat["lastMessageAt"] = msgs[-1]["createdAt"]
+                    chat["lastSeq"] = m["seq"]
+
+    def saved_message_seqs(self, messages: list[dict]) -> dict[str, int]:
+        ids = {m["id"] for m in messages}
+        with self._lock:
+            return {
+                row["id"]: row["seq"]
+                for chat_id in {m["chatId"] for m in messages}
+                for row in self._by_seq.get(chat_id, ())
+                if row["id"] in ids
+            }
+
+    def list_messages_page(
+        self,
+        chat_id: str,
+        before: tuple[int, str] | None = None,
+        after: tuple[int, str] | None = None,
+        limit: int = 50,
+    ) -> list[dict]:
+        if limit <= 0:
+            return []
+        with self._lock:
+            msgs = self._messages.get(chat_id, [])
+            if after is not None:
+                start = bisect.bisect_right(msgs, after, key=_position)
+                page = msgs[start:start + limit]
+            else:
+                end = bisect.bisect_left(msgs, before, key=_position) if before is not None else len(msgs)
+                page = msgs[max(0, end - limit):end]
+            return [dict(m) for m in page]
+
+    def list_messages_after_seq(self, after: dict[str, int], limit: int) -> list[dict]:
+        out: list[dict] = []
+        with self._lock:
+            for chat_id in sorted(after, key=chat_sort_key):
+                if len(out) >= limit:
+                    break
+                start = max(0, after[chat_id])
+                page = self._by_seq.get(chat_id, [])[start:start + limit - len(out)]
+                out.extend(dict(m) for m in page)
+        return out
+
+    def scan_messages(self, after_id: str = "", limit: int = 1000) -> list[dict]:
+        with self._lock:
+            found = [m for msgs in self._messages.values() for m in msgs if m["id"] > after_id]
+        found.sort(key=lambda m: m["id"])
+        return [dict(m) for m in found[:limit]]
+
+    def list_chat_sync_state(self, user_id: str) -> list[dict]:
+        with self._lock:
+            return [
+                {"id": cid, "lastSeq": self._chats[cid]["lastSeq"], "updatedAt": self._chats[cid]["updatedAt"]}
+                for cid in self._user_chats.get(user_id, ())
+                if cid in self._chats
+            ]
+
+    def backfill_last_message(self, batch_size: int = 500) -> int:
+        with self._lock:
+            for chat_id, chat in self._chats.items():
+                msgs = self._messages.get(chat_id)
+                chat["lastMessageAt"] = msgs[-1]["createdAt"] if msgs else None
+            return len(self._chats)
+
+    def backfill_seq(self, batch_size: int = 500) -> int:
+        # los mensajes en memoria siempre tienen seq
+        return 0
@@ -0,0 +1,223 @@
+"""Esquema versionado de MySQL y verificación de planes de las consultas calientes.
+
+Cada migración es (versión, nombre, pasos). Un paso es una sentencia SQL o una
+función que recibe el cursor; los de add_column/add_index revisan
+information_schema antes de tocar la tabla, así una base creada a mano (o con
+los ALTER de versiones anteriores del README) se pone al día sin errores. Las
+versiones aplicadas quedan en schema_migrations.
+"""
+import time
+from typing import Callable
+
+Step = str | Callable
+
+
+def _index_columns(cur, table: str) -> list[tuple[list[str], bool]]:
+    # [(columnas en orden, única)] de cada índice de la tabla, incluida la PK
+    cur.execute(
+        """
+        SELECT INDEX_NAME, COLUMN_NAME, NON_UNIQUE
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+        """,
+        (table,),
+    )
+    indexes: dict[str, tuple[list[str], bool]] = {}
+    for row in cur.fetchall():
+        cols, unique = indexes.setdefault(row["INDEX_NAME"], ([], not row["NON_UNIQUE"]))
+        cols.append(row["COLUMN_NAME"])
+    return list(indexes.values())
+
+
+def add_column(table: str, column: str, definition: str) -> Callable:
+    def step(cur):
+        cur.execute(
+            "SELECT 1 AS found FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (table, column),
+        )
+        if cur.fetchone() is None:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    return step
+
+
+def add_index(table: str, name: str, columns: list[str], unique: bool = False) -> Callable:
+    def step(cur):
+        # cualquier índice que ya empiece con esas columnas sirve (p. ej. uno creado con otro nombre)
+        for cols, is_unique in _index_columns(cur, table):
+            if cols[:len(columns)] == columns and (is_unique or not unique):
+                return
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        cur.execute(f"ALTER TABLE {table} ADD {kind} {name} ({', '.join(columns)})")
+
+    return step
+
+
+def binary_id(table: str, column: str, nullable: bool = False) -> Callable:
+    # CHAR(36) -> BINARY(16) sin perder los índices: primero VARBINARY(36) (mismos bytes),
+    # luego UNHEX de cada valor y por último el tipo final
+    null = "NULL" if nullable else "NOT NULL"
+
+    def step(cur):
+        cur.execute(
+            "SELECT DATA_TYPE AS type FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (table, column),
+        )
+        row = cur.fetchone()
+        kind = row["type"] if row else None
+        if kind == "char":
+            cur.execute(f"ALTER TABLE {table} MODIFY {column} VARBINARY(36) {null}")
+            kind = "varbinary"
+        if kind == "varbinary":
+            cur.execute(
+                f"UPDATE {table} SET {column} = UNHEX(REPLACE({column}, '-', '')) WHERE LENGTH({column}) = 36"
+            )
+            cur.execute(f"ALTER TABLE {table} MODIFY {column} BINARY(16) {null}")
+
+    return step
+
+
+MIGRATIONS: list[tuple[int, str, list[Step]]] = [
+    (1, "tablas base", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id CHAR(36) NOT NULL PRIMARY KEY,
+            username VARCHAR(64) NOT NULL,
+            email VARCHAR(255) NULL,
+            displayName VARCHAR(100) NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            avatarUrl VARCHAR(512) NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'offline'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chats (
+            id CHAR(36) NOT NULL PRIMARY KEY,
+            type VARCHAR(16) NOT NULL,
+            title VARCHAR(255) NOT NULL DEFAULT '',
+            description TEXT NULL,
+            created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chat_members (
+            chatId CHAR(36) NOT NULL,
+            userId CHAR(36) NOT NULL,
+            role VARCHAR(16) NOT NULL DEFAULT 'member',
+            PRIMARY KEY (chatId, userId)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id CHAR(36) NOT NULL PRIMARY KEY,
+            chatId CHAR(36) NOT NULL,
+            senderId CHAR(36) NOT NULL,
+            kind VARCHAR(16) NOT NULL DEFAULT 'text',
+            content TEXT NOT NULL,
+            createdAt BIGINT NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (2, "índices de búsqueda y membresía", [
+        # login/registro y user:findByUsername
+        add_index("users", "uq_users_username", ["username"], unique=True),
+        add_index("users", "uq_users_email", ["email"], unique=True),
+        # chats de un usuario (lista de chats, membresía, contactos de presencia)
+        add_index("chat_members", "idx_chat_members_user", ["userId", "chatId"]),
+        # historial por keyset (createdAt, id)
+        add_index("messages", "idx_messages_chat_created", ["chatId", "createdAt", "id"]),
+    ]),
+    (3, "puntero al último mensaje", [
+        add_column("chats", "lastMessageId", "CHAR(36) NULL"),
+        add_column("chats", "lastMessageAt", "BIGINT NULL"),
+        add_index("chats", "idx_chats_last_message", ["lastMessageAt"]),
+    ]),
+    (4, "seq por chat para sync", [
+        add_column("messages", "seq", "BIGINT NULL"),
+        add_column("chats", "lastSeq", "BIGINT NOT NULL DEFAULT 0"),
+        add_column("chats", "updatedAt", "BIGINT NULL"),
+        add_index("messages", "idx_messages_chat_seq", ["chatId", "seq"]),
+    ]),
+    # reescribe todas las filas: en tablas grandes conviene correrla con `manage.py migrate`
+    # en una ventana de mantenimiento
+    (5, "ids BINARY(16)", [
+        binary_id("users", "id"),
+        binary_id("chats", "id"),
+        binary_id("chats", "lastMessageId", nullable=True),
+        binary_id("chat_members", "chatId"),
+        binary_id("chat_members", "userId"),
+        binary_id("messages", "id"),
+        binary_id("messages", "chatId"),
+        binary_id("messages", "senderId"),
+    ]),
+    (6, "segmentos de mensajes archivados", [
+        """
+        CREATE TABLE IF NOT EXISTS message_segments (
+            chatId BINARY(16) NOT NULL,
+            segment INT NOT NULL,
+            firstCreatedAt BIGINT NOT NULL,
+            firstId BINARY(16) NOT NULL,
+            lastCreatedAt BIGINT NOT NULL,
+            lastId BINARY(16) NOT NULL,
+            maxSeq BIGINT NULL,
+            count INT NOT NULL,
+            data MEDIUMBLOB NOT NULL,
+            createdAt BIGINT NOT NULL,
+            PRIMARY KEY (chatId, segment)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (7, "marca de archivo por chat", [
+        add_column("chats", "archivedAt", "BIGINT NOT NULL DEFAULT 0"),
+        add_column("chats", "archivedSeq", "BIGINT NOT NULL DEFAULT 0"),
+        # chats archivados antes de la columna; repetirlo deja los mismos valores
+        """
+        UPDATE chats SET
+            archivedAt = COALESCE((SELECT MAX(s.lastCreatedAt) FROM message_segments s WHERE s.chatId = chats.id), 0),
+            archivedSeq = COALESCE((SELECT MAX(s.maxSeq) FROM message_segments s WHERE s.chatId = chats.id), 0)
+        """,
+    ]),
+]
+
+
+def apply(cur) -> list[int]:
+    """Aplica las migraciones pendientes en orden y devuelve las versiones aplicadas."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at BIGINT NOT NULL
+        )
+        """
+    )
+    cur.execute("SELECT version FROM schema_migrations")
+    done = {r["version"] for r in cur.fetchall()}
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if version in done:
+            continue
+        # el DDL de MySQL confirma solo: cada paso es idempotente por si se corta a la mitad
+        for step in steps:
+            if callable(step):
+                step(cur)
+            else:
+                cur.execute(step)
+        cur.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s,%s,%s)",
+            (version, name, int(time.time() * 1000)),
+        )
+        applied.append(version)
+    return applied
+
+
+def check_plans(storage) -> list[str]:
+    """Corre EXPLAIN sobre `storage.hot_queries()`; una línea por tabla recorrida completa."""
+    problems = []
+    for name, sql, params in storage.hot_queries():
+        for table in storage.full_scans(sql, params):
+            problems.append(f"{name}: recorre {table} completa")
+    return problems
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors
+
+from . import migrations
+from .ids import id_from_bytes, id_to_bytes
+from .pool import ConnectionPool
+from .sql import SQLStorage
+
+
+# columnas (y alias) que son ids BINARY(16); cualquier otro BLOB (p. ej. message_segments.data)
+# sale tal cual aunque mida 16 bytes
+ID_COLUMNS = frozenset((
+    "id", "chatId", "senderId", "userId", "lastMessageId", "lastId", "lastSenderId", "firstId",
+))
+
+
+def _decode(row: dict) -> dict:
+    # los ids vuelven a ser texto antes de salir del storage
+    for key in ID_COLUMNS.intersection(row):
+        value = row[key]
+        if isinstance(value, (bytes, bytearray)):
+            row[key] = id_from_bytes(value)
+    return row
+
+
+class _Cursor:
+    """Cursor de diccionarios que devuelve los ids BINARY(16) como texto."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, sql: str, params=()):
+        self._cur.execute(sql, params)
+
+    def executemany(self, sql: str, seq):
+        self._cur.executemany(sql, seq)
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return _decode(row) if row else row
+
+    def fetchall(self):
+        return [_decode(r) for r in self._cur.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+
+class MySQLStorage(SQLStorage):
+    name = "mysql"
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        database: str,
+        pool_size: int = 10,
+        pool_min: int = 2,
+        pool_timeout: float = 5.0,
+        pool_idle: float = 60.0,
+        pool_check: float = 30.0,
+    ):
+        self.pool_size = pool_size
+        config = dict(host=host, port=port, user=user, password=password, database=database, autocommit=True)
+        self._pool = ConnectionPool(
+            connect=lambda: mysql.connector.connect(**config),
+            ping=lambda c: c.is_connected(),
+            min_size=pool_min,
+            max_size=pool_size,
+            timeout=pool_timeout,
+            idle_timeout=pool_idle,
+            check_interval=pool_check,
+        )
+        self._pool.start()
+        self._binary_ids = self._detect_binary_ids()
+
+    def _detect_binary_ids(self) -> bool:
+        # hasta la migración 5 los ids son CHAR(36): se siguen pasando como texto
+        row = self._query_one(
+            "SELECT DATA_TYPE AS type FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'messages' AND COLUMN_NAME = 'id'"
+        )
+        return row is not None and row["type"] == "binary"
+
+    def _id(self, value: str):
+        # "" es el cursor inicial de los recorridos por lotes: va antes de cualquier id.
+        # Cualquier otro texto que no sea uuid levanta InvalidIdError
+        if not self._binary_ids or value is None:
+            return value
+        return id_to_bytes(value) if value else b""
+
+    @contextmanager
+    def _conn(self):
+        entry = self._pool.acquire()
+        broken = False
+        try:
+            yield entry.raw
+        except (errors.InterfaceError, errors.OperationalError):
+            # conexión perdida (servidor reiniciado, wait_timeout): no vuelve al pool
+            broken = True
+            raise
+        finally:
+            self._pool.release(entry, broken=broken)
+
+    def _cursor(self, c):
+        return _Cursor(c.cursor(dictionary=True))
+
+    def _begin(self, c):
+        c.start_transaction()
+
+    def migrate(self) -> list[int]:
+        with self._conn() as c:
+            cur = self._cursor(c)
+            # varios procesos pueden arrancar a la vez: solo uno migra, el resto espera
+            cur.execute("SELECT GET_LOCK('chat_migrations', 60) AS locked")
+            if not cur.fetchone()["locked"]:
+                raise RuntimeError("No se obtuvo el candado de migraciones")
+            try:
+                applied = migrations.apply(cur)
+            finally:
+                cur.execute("SELECT RELEASE_LOCK('chat_migrations') AS released")
+                cur.fetchall()
+        self._binary_ids = self._detect_binary_ids()
+        return applied
+
+    def full_scans(self, sql: str, params: tuple = ()) -> list[str]:
+        rows = self._query("EXPLAIN " + sql, params)
+        # todo type=ALL cuenta, aunque haya possible_keys: el optimizador las descartó.
+        # Las tablas derivadas (<derivedN>, <unionN>) no cuentan: su consulta interna tiene su fila
+        return [r["table"] for r in rows if r.get("type") == "ALL" and not str(r.get("table")).startswith("<")]
+
+    def stats(self) -> dict:
+        return {"pool": self._pool.stats()}
+
+    def close(self):
+        self._pool.close()
@@ -0,0 +1,256 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class _Entry:
+    __slots__ = ("raw", "last_used", "checked")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.last_used = time.monotonic()
+        # último uso o verificación: una conexión usada hace poco no necesita ping
+        self.checked = self.last_used
+
+
+# permiso para abrir una conexión nueva en lugar de recibir una existente
+_CREATE = object()
+
+
+class ConnectionPool:
+    """Pool de conexiones DB-API con cola de espera justa y tamaño adaptativo.
+
+    Arranca con `min_size` conexiones abiertas y crece bajo demanda hasta
+    `max_size`. Sin conexiones libres, `acquire` espera en orden de llegada (FIFO)
+    hasta `timeout` segundos y luego lanza PoolTimeoutError. Un hilo de
+    mantenimiento cierra las conexiones que sobran sobre el mínimo tras
+    `idle_timeout` ociosas, verifica con `ping` las que llevan `check_interval` sin
+    usarse y repone el mínimo.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        ping: Callable[[Any], bool],
+        min_size: int,
+        max_size: int,
+        timeout: float,
+        idle_timeout: float = 60.0,
+        check_interval: float = 30.0,
+    ):
+        self._connect = connect
+        self._ping = ping
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # libres, la más recién usada al final: las del principio envejecen y se cierran
+        self._idle: deque[_Entry] = deque()
+        # [evento, entrada entregada o _CREATE]
+        self._waiters: deque[list] = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # latencias de checkout recientes (segundos) para los percentiles
+        self._latencies: deque[float] = deque(maxlen=1024)
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.created = 0
+        self.closed = 0
+        self.failed_checks = 0
+        self.max_waiting = 0
+        self.max_checkout = 0.0
+
+    def start(self):
+        # pre-calienta el mínimo antes de aceptar tráfico
+        self._fill()
+        if self._thread is None and self.check_interval > 0:
+            self._thread = threading.Thread(target=self._maintain, name="db-pool", daemon=True)
+            self._thread.start()
+
+    def _open(self) -> _Entry:
+        # el cupo (_size) ya está reservado; si falla se devuelve
+        try:
+            entry = _Entry(self._connect())
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            self._hand_off_slot()
+            raise
+        with self._lock:
+            self.created += 1
+        return entry
+
+    def _discard(self, entry: _Entry):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+        with self._lock:
+            self.closed += 1
+
+    def acquire(self) -> _Entry:
+        started = time.monotonic()
+        waiter = None
+        with self._lock:
+            if self._closed:
+                raise PoolTimeoutError("Pool cerrado")
+            if self._idle and not self._waiters:
+                entry = self._idle.pop()
+            elif self._size < self.max_size:
+                self._size += 1
+                entry = _CREATE
+            else:
+                entry = None
+                waiter = [threading.Event(), None]
+                self._waiters.append(waiter)
+                self.waits += 1
+                self.max_waiting = max(self.max_waiting, len(self._waiters))
+
+        if waiter is not None:
+            waiter[0].wait(self.timeout)
+            with self._lock:
+                entry = waiter[1]
+                if entry is None:
+                    self._waiters.remove(waiter)
+                    self.timeouts += 1
+                    raise PoolTimeoutError(f"Sin conexión libre tras {self.timeout:g}s ({self._in_use} en uso)")
+
+        if entry is _CREATE:
+            entry = self._open()
+        elif time.monotonic() - entry.checked > self.check_interval and not self._alive(entry):
+            # ociosa demasiado tiempo y el servidor la cerró: se reemplaza
+            self._discard(entry)
+            entry = self._open()
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+            self.checkouts += 1
+            self._latencies.append(elapsed)
+            self.max_checkout = max(self.max_checkout, elapsed)
+        return entry
+
+    def release(self, entry: _Entry, broken: bool = False, used: bool = True):
+        entry.checked = time.monotonic()
+        if used:
+            entry.last_used = entry.checked
+        with self._lock:
+            self._in_use -= 1
+            if not broken and not self._closed:
+                if self._waiters:
+                    # se entrega directo al que espera hace más tiempo (FIFO)
+                    waiter = self._waiters.popleft()
+                    waiter[1] = entry
+                    waiter[0].set()
+                else:
+                    self._idle.append(entry)
+                return
+            self._size -= 1
+        self._discard(entry)
+        self._hand_off_slot()
+
+    def _hand_off_slot(self):
+        # se liberó un cupo: el primero en la cola abre su propia conexión
+        with self._lock:
+            if self._waiters and self._size < self.max_size and not self._closed:
+                self._size += 1
+                waiter = self._waiters.popleft()
+                waiter[1] = _CREATE
+                waiter[0].set()
+
+    def _alive(self, entry: _Entry) -> bool:
+        try:
+            ok = bool(self._ping(entry.raw))
+        except Exception:
+            ok = False
+        if not ok:
+            with self._lock:
+                self.failed_checks += 1
+        return ok
+
+    def _fill(self):
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._open()
+            except Exception as e:
+                print(f"[DBPool] no se pudo abrir una conexión: {e}")
+                return
+            with self._lock:
+                self._in_use += 1
+            self.release(entry)
+
+    def _maintain(self):
+        while not self._stop.wait(self.check_interval):
+            now = time.monotonic()
+            expired, stale = [], []
+            with self._lock:
+                keep = deque()
+                for entry in self._idle:
+                    idle = now - entry.last_used
+                    if idle > self.idle_timeout and self._size > self.min_size:
+                        self._size -= 1
+                        expired.append(entry)
+                    elif now - entry.checked > self.check_interval:
+                        stale.append(entry)
+                    else:
+                        keep.append(entry)
+                self._idle = keep
+                # las que se van a verificar cuentan como en uso mientras tanto
+                self._in_use += len(stale)
+            for entry in expired:
+                self._discard(entry)
+            for entry in stale:
+                self.release(entry, broken=not self._alive(entry), used=False)
+            self._fill()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "size": self._size,
+                "minSize": self.min_size,
+                "maxSize": self.max_size,
+                "inUse": self._in_use,
+                "idle": len(self._idle),
+                "waiting": len(self._waiters),
+                "maxWaiting": self.max_waiting,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "created": self.created,
+                "closed": self.closed,
+                "failedChecks": self.failed_checks,
+            }
+        if latencies:
+            stats["checkoutMs"] = {
+                "p50": round(latencies[len(latencies) // 2] * 1000, 3),
+                "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+                "max": round(self.max_checkout * 1000, 3),
+            }
+        return stats
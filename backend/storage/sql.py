@@ -0,0 +1,760 @@
+import time
+from abc import abstractmethod
+from contextlib import contextmanager
+
+from . import archive
+from .base import Storage, chat_sort_key, to_public_user
+from .ids import new_id
+
+_USER_COLUMNS = "id, username, email, displayName, password_hash, avatarUrl, status"
+_PUBLIC_COLUMNS = "id, username, displayName, avatarUrl, status"
+_MESSAGE_COLUMNS = "id, chatId, senderId, kind, content, createdAt, seq"
+
+# consultas que corren en cada evento; `hot_queries()` las revisa con EXPLAIN tal cual
+_SQL_PUBLIC_BY_USERNAME = f"SELECT {_PUBLIC_COLUMNS} FROM users WHERE username=%s LIMIT 1"
+_SQL_EMAIL_IN_USE = "SELECT 1 AS found FROM users WHERE email=%s LIMIT 1"
+_SQL_PUBLIC_BY_IDS = f"SELECT {_PUBLIC_COLUMNS} FROM users WHERE id IN ({{marks}})"
+_SQL_CHAT_LIST = """
+    SELECT ch.id, ch.type, ch.title, ch.description,
+           m.id AS lastId, m.senderId AS lastSenderId, m.kind AS lastKind,
+           m.content AS lastContent, m.createdAt AS lastCreatedAt, m.seq AS lastSeq
+    FROM chat_members cm
+    JOIN chats ch ON ch.id = cm.chatId
+    LEFT JOIN messages m ON m.id = ch.lastMessageId
+    WHERE cm.userId = %s
+    ORDER BY COALESCE(ch.lastMessageAt, 0) DESC, ch.created_at DESC
+"""
+_SQL_CHAT_LIST_MEMBERS = """
+    SELECT cm.chatId, u.id, u.username, u.displayName, u.avatarUrl, u.status
+    FROM chat_members mine
+    JOIN chat_members cm ON cm.chatId = mine.chatId
+    JOIN users u ON u.id = cm.userId
+    WHERE mine.userId = %s
+"""
+_SQL_IS_MEMBER = "SELECT 1 AS ok FROM chat_members WHERE chatId=%s AND userId=%s LIMIT 1"
+_SQL_RELATED_USERS = """
+    SELECT DISTINCT cm2.userId
+    FROM chat_members cm1
+    JOIN chat_members cm2 ON cm2.chatId = cm1.chatId
+    WHERE cm1.userId = %s
+"""
+_SQL_CHAT_USER_IDS = "SELECT userId FROM chat_members WHERE chatId=%s"
+_SQL_USER_CHAT_IDS = "SELECT chatId FROM chat_members WHERE userId=%s"
+_SQL_DIRECT_CHAT = """
+    SELECT ch.id, ch.type, ch.title, ch.description
+    FROM chats ch
+    JOIN chat_members cm1 ON cm1.chatId = ch.id AND cm1.userId = %s
+    JOIN chat_members cm2 ON cm2.chatId = ch.id AND cm2.userId = %s
+    WHERE ch.type='direct'
+    LIMIT 1
+"""
+_SQL_PAGE_LATEST = f"""
+    SELECT {_MESSAGE_COLUMNS}
+    FROM messages
+    WHERE chatId=%s
+    ORDER BY createdAt DESC, id DESC
+    LIMIT %s
+"""
+_SQL_PAGE_BEFORE = f"""
+    SELECT {_MESSAGE_COLUMNS}
+    FROM messages
+    WHERE chatId=%s AND (createdAt < %s OR (createdAt = %s AND id < %s))
+    ORDER BY createdAt DESC, id DESC
+    LIMIT %s
+"""
+_SQL_PAGE_AFTER = f"""
+    SELECT {_MESSAGE_COLUMNS}
+    FROM messages
+    WHERE chatId=%s AND (createdAt > %s OR (createdAt = %s AND id > %s))
+    ORDER BY createdAt ASC, id ASC
+    LIMIT %s
+"""
+# ramas del UNION ALL de list_messages_many
+_SQL_MANY_LATEST = (
+    f"SELECT * FROM (SELECT {_MESSAGE_COLUMNS} FROM messages "
+    "WHERE chatId=%s ORDER BY createdAt DESC, id DESC LIMIT %s) AS t"
+)
+_SQL_MANY_AFTER = (
+    f"SELECT * FROM (SELECT {_MESSAGE_COLUMNS} FROM messages "
+    "WHERE chatId=%s AND (createdAt > %s OR (createdAt = %s AND id > %s)) "
+    "ORDER BY createdAt ASC, id ASC LIMIT %s) AS t"
+)
+_SQL_AFTER_SEQ = f"""
+    SELECT {_MESSAGE_COLUMNS}
+    FROM messages
+    WHERE {{where}}
+    ORDER BY chatId ASC, seq ASC
+    LIMIT %s
+"""
+_SQL_AFTER_SEQ_WHERE = "(chatId=%s AND seq > %s)"
+_SQL_SEGMENTS_AFTER_SEQ = """
+    SELECT chatId, data FROM message_segments
+    WHERE {where}
+    ORDER BY chatId ASC, segment ASC
+    LIMIT %s
+"""
+_SQL_SEGMENTS_AFTER_SEQ_WHERE = "(chatId=%s AND maxSeq > %s)"
+_SQL_SYNC_STATE = """
+    SELECT ch.id, ch.lastSeq, ch.updatedAt
+    FROM chat_members cm
+    JOIN chats ch ON ch.id = cm.chatId
+    WHERE cm.userId=%s
+"""
+_SQL_SEGMENTS_PAGE = (
+    "SELECT segment, data FROM message_segments WHERE chatId=%s AND {where}{extra} "
+    "ORDER BY segment {order} LIMIT 4"
+)
+_SEGMENTS_AFTER = "(lastCreatedAt > %s OR (lastCreatedAt = %s AND lastId > %s))"
+_SEGMENTS_BEFORE = "(firstCreatedAt < %s OR (firstCreatedAt = %s AND firstId < %s))"
+# (createdAt, seq) del mensaje archivado más nuevo de cada chat; 0 = sin segmentos
+_SQL_ARCHIVE_MARKS = "SELECT id, archivedAt, archivedSeq FROM chats WHERE id IN ({marks}) AND archivedAt > 0"
+
+# id con el formato real para armar los parámetros de EXPLAIN
+_SAMPLE_ID = "00000000-0000-0000-0000-000000000000"
+
+# con el archivo apagado, cada cuánto se vuelve a mirar si alguien (p. ej. `manage.py archive`)
+# escribió segmentos
+_SEGMENTS_RECHECK_S = 60.0
+
+
+class SQLStorage(Storage):
+    """Consultas comunes a MySQL y SQLite, escritas con placeholders `%s`.
+
+    Cada motor implementa `_conn()` (context manager que entrega una conexión
+    DB-API), `_cursor(c)` (cursor que devuelve filas como dict) y `_begin(c)`.
+    """
+
+    @abstractmethod
+    def _conn(self): ...
+
+    @abstractmethod
+    def _cursor(self, c): ...
+
+    @abstractmethod
+    def _begin(self, c): ...
+
+    def _query(self, sql: str, params: tuple = ()) -> list[dict]:
+        with self._conn() as c:
+            cur = self._cursor(c)
+            cur.execute(sql, params)
+            return cur.fetchall() or []
+
+    def _query_one(self, sql: str, params: tuple = ()) -> dict | None:
+        with self._conn() as c:
+            cur = self._cursor(c)
+            cur.execute(sql, params)
+            return cur.fetchone()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._conn() as c:
+            cur = self._cursor(c)
+            cur.execute(sql, params)
+
+    def _id(self, value: str):
+        # parámetro que es un id; MySQL lo pasa a BINARY(16), SQLite lo deja como texto
+        return value
+
+    def _ids(self, values) -> tuple:
+        return tuple(self._id(v) for v in values)
+
+    @contextmanager
+    def _transaction(self):
+        with self._conn() as c:
+            self._begin(c)
+            try:
+                yield self._cursor(c)
+                c.commit()
+            except BaseException:
+                c.rollback()
+                raise
+
+    # ---------------- USERS ----------------
+    def create_user(self, username: str, displayName: str, email: str | None, password_hash: str) -> dict:
+        user_id = new_id()
+        self._execute(
+            "INSERT INTO users (id, username, email, displayName, password_hash, status) "
+            "VALUES (%s,%s,%s,%s,%s,'offline')",
+            (self._id(user_id), username, email, displayName, password_hash),
+        )
+        return {
+            "id": user_id,
+            "username": username,
+            "displayName": displayName,
+            "email": email,
+            "avatarUrl": None,
+            "status": "offline",
+        }
+
+    def get_user_by_username(self, username: str) -> dict | None:
+        return self._query_one(f"SELECT {_USER_COLUMNS} FROM users WHERE username=%s LIMIT 1", (username,))
+
+    def get_user_by_email(self, email: str) -> dict | None:
+        return self._query_one(f"SELECT {_USER_COLUMNS} FROM users WHERE email=%s LIMIT 1", (email,))
+
+    def get_user_by_id(self, user_id: str) -> dict | None:
+        return self._query_one(f"SELECT {_USER_COLUMNS} FROM users WHERE id=%s LIMIT 1", (self._id(user_id),))
+
+    # rutas públicas: solo las columnas de to_public_user (nunca password_hash)
+    def get_user_public_by_username(self, username: str) -> dict | None:
+        row = self._query_one(_SQL_PUBLIC_BY_USERNAME, (username,))
+        return to_public_user(row) if row else None
+
+    def get_user_public_by_id(self, user_id: str) -> dict | None:
+        row = self._query_one(f"SELECT {_PUBLIC_COLUMNS} FROM users WHERE id=%s LIMIT 1", (self._id(user_id),))
+        return to_public_user(row) if row else None
+
+    def get_users_public_by_ids(self, user_ids: list[str]) -> dict[str, dict]:
+        found = {}
+        ids = list(dict.fromkeys(user_ids))
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ",".join(["%s"] * len(chunk))
+            for row in self._query(_SQL_PUBLIC_BY_IDS.format(marks=marks), self._ids(chunk)):
+                found[row["id"]] = to_public_user(row)
+        return found
+
+    def list_users_brief(self, after_id: str = "", limit: int = 1000) -> list[dict]:
+        return self._query(
+            "SELECT id, username, displayName FROM users WHERE id > %s ORDER BY id LIMIT %s",
+            (self._id(after_id), limit),
+        )
+
+    def email_in_use(self, email: str) -> bool:
+        return self._query_one(_SQL_EMAIL_IN_USE, (email,)) is not None
+
+    def set_user_status(self, user_id: str, status: str):
+        self._execute("UPDATE users SET status=%s WHERE id=%s", (status, self._id(user_id)))
+
+    def set_user_password_hash(self, user_id: str, password_hash: str):
+        self._execute("UPDATE users SET password_hash=%s WHERE id=%s", (password_hash, self._id(user_id)))
+
+    def set_users_status(self, statuses: dict[str, str]):
+        if not statuses:
+            return
+        # un UPDATE por estado distinto (online/offline/busy), no uno por usuario
+        by_status: dict[str, list[str]] = {}
+        for user_id, status in statuses.items():
+            by_status.setdefault(status, []).append(user_id)
+        with self._transaction() as cur:
+            for status, user_ids in by_status.items():
+                for i in range(0, len(user_ids), 500):
+                    chunk = user_ids[i:i + 500]
+                    marks = ",".join(["%s"] * len(chunk))
+                    cur.execute(f"UPDATE users SET status=%s WHERE id IN ({marks})", (status, *self._ids(chunk)))
+
+    # ---------------- CHATS ----------------
+    def _get_last_message_for_chat(self, chat_id: str) -> dict | None:
+        # chats.lastMessageId lo mantiene save_message; lectura por PK
+        return self._query_one(
+            """
+            SELECT m.id, m.chatId, m.senderId, m.kind, m.content, m.createdAt, m.seq
+            FROM chats ch
+            JOIN messages m ON m.id = ch.lastMessageId
+            WHERE ch.id=%s
+            """,
+            (self._id(chat_id),),
+        )
+
+    def list_members_for_chat(self, chat_id: str) -> list[dict]:
+        rows = self._query(
+            """
+            SELECT u.id, u.username, u.displayName, u.avatarUrl, u.status
+            FROM chat_members cm
+            JOIN users u ON u.id = cm.userId
+            WHERE cm.chatId=%s
+            """,
+            (self._id(chat_id),),
+        )
+        return [to_public_user(r) for r in rows]
+
+    def list_chats_for_user(self, user_id: str) -> list[dict]:
+        # 2 consultas sin importar cuántos chats tenga el usuario:
+        # chats ordenados por el puntero lastMessageAt (+ preview por PK) y todos los miembros
+        rows = self._query(_SQL_CHAT_LIST, (self._id(user_id),))
+        if not rows:
+            return []
+
+        members_by_chat: dict[str, list[dict]] = {}
+        for r in self._query(_SQL_CHAT_LIST_MEMBERS, (self._id(user_id),)):
+            members_by_chat.setdefault(r["chatId"], []).append(to_public_user(r))
+
+        chats = []
+        for row in rows:
+            last_message = None
+            if row["lastId"] is not None:
+                last_message = {
+                    "id": row["lastId"],
+                    "chatId": row["id"],
+                    "senderId": row["lastSenderId"],
+                    "kind": row["lastKind"],
+                    "content": row["lastContent"],
+                    "createdAt": row["lastCreatedAt"],
+                    "seq": row["lastSeq"],
+                }
+            chats.append(self._assemble_chat(row, members_by_chat.get(row["id"], []), last_message, user_id))
+        return chats
+
+    def get_chat_for_user(self, chat_id: str, user_id: str) -> dict | None:
+        row = self._query_one(
+            """
+            SELECT ch.id, ch.type, ch.title, ch.description
+            FROM chats ch
+            JOIN chat_members cm ON cm.chatId = ch.id
+            WHERE ch.id=%s AND cm.userId=%s
+            LIMIT 1
+            """,
+            (self._id(chat_id), self._id(user_id)),
+        )
+        return self._hydrate_chat_for_user(row, user_id) if row else None
+
+    def user_is_member(self, chat_id: str, user_id: str) -> bool:
+        row = self._query_one(_SQL_IS_MEMBER, (self._id(chat_id), self._id(user_id)))
+        return row is not None
+
+    def list_related_user_ids(self, user_id: str) -> list[str]:
+        rows = self._query(_SQL_RELATED_USERS, (self._id(user_id),))
+        return [r["userId"] for r in rows]
+
+    def list_user_ids_for_chat(self, chat_id: str) -> list[str]:
+        rows = self._query(_SQL_CHAT_USER_IDS, (self._id(chat_id),))
+        return [r["userId"] for r in rows]
+
+    def list_chat_ids_for_user(self, user_id: str) -> list[str]:
+        rows = self._query(_SQL_USER_CHAT_IDS, (self._id(user_id),))
+        return [r["chatId"] for r in rows]
+
+    def add_chat_member(self, chat_id: str, user_id: str, role: str = "member"):
+        with self._transaction() as cur:
+            cur.execute(
+                "INSERT IGNORE INTO chat_members (chatId, userId, role) VALUES (%s,%s,%s)",
+                (self._id(chat_id), self._id(user_id), role),
+            )
+            if cur.rowcount:
+                # cambió la metadata del chat (miembros): `sync` lo reporta
+                cur.execute(
+                    "UPDATE chats SET updatedAt=%s WHERE id=%s",
+                    (int(time.time() * 1000), self._id(chat_id)),
+                )
+
+    def create_group_chat(self, title: str, description: str | None, owner_id: str) -> dict:
+        chat_id = new_id()
+        with self._transaction() as cur:
+            cur.execute(
+                "INSERT INTO chats (id, type, title, description, updatedAt) VALUES (%s,'group',%s,%s,%s)",
+                (self._id(chat_id), title, description, int(time.time() * 1000)),
+            )
+            cur.execute(
+                "INSERT INTO chat_members (chatId, userId, role) VALUES (%s,%s,'owner')",
+                (self._id(chat_id), self._id(owner_id)),
+            )
+        return self.get_chat_for_user(chat_id, owner_id)
+
+    def find_direct_chat_between(self, a: str, b: str) -> dict | None:
+        row = self._query_one(_SQL_DIRECT_CHAT, (self._id(a), self._id(b)))
+        return self._hydrate_chat_for_user(row, a) if row else None
+
+    def create_direct_chat(self, a: str, b: str) -> dict:
+        chat_id = new_id()
+        with self._transaction() as cur:
+            cur.execute(
+                "INSERT INTO chats (id, type, title, description, updatedAt) VALUES (%s,'direct','',NULL,%s)",
+                (self._id(chat_id), int(time.time() * 1000)),
+            )
+            for user_id in (a, b):
+                cur.execute(
+                    "INSERT INTO chat_members (chatId, userId, role) VALUES (%s,%s,'member')",
+                    (self._id(chat_id), self._id(user_id)),
+                )
+        return self.get_chat_for_user(chat_id, a)
+
+    # ---------------- MESSAGES ----------------
+    def save_messages(self, messages: list[dict]):
+        if not messages:
+            return
+        by_chat: dict[str, list[dict]] = {}
+        for m in messages:
+            by_chat.setdefault(m["chatId"], []).append(m)
+        for msgs in by_chat.values():
+            msgs.sort(key=lambda m: (m["createdAt"], m["id"]))
+
+        marks = ",".join(["%s"] * len(by_chat))
+        values = ",".join(["(%s,%s,%s,%s,%s,%s,%s)"] * len(messages))
+        with self._transaction() as cur:
+            # FOR UPDATE: otro proceso no puede tomar los mismos seq del chat
+            cur.execute(f"SELECT id, lastSeq FROM chats WHERE id IN ({marks}) FOR UPDATE", self._ids(by_chat))
+            last_seq = {r["id"]: r["lastSeq"] or 0 for r in cur.fetchall()}
+
+            params = []
+            for chat_id, msgs in by_chat.items():
+                seq = last_seq.get(chat_id, 0)
+                for m in msgs:
+                    seq += 1
+                    m["seq"] = seq
+                    params.extend((
+                        self._id(m["id"]), self._id(chat_id), self._id(m["senderId"]),
+                        m["kind"], m["content"], m["createdAt"], seq,
+                    ))
+            cur.execute(
+                f"INSERT INTO messages (id, chatId, senderId, kind, content, createdAt, seq) VALUES {values}",
+                tuple(params),
+            )
+            for chat_id, msgs in by_chat.items():
+                m = msgs[-1]
+                # lastMessageId se asigna antes que lastMessageAt: MySQL evalúa en orden
+                cur.execute(
+                    """
+                    UPDATE chats SET
+                        lastSeq = %s,
+                        lastMessageId = CASE WHEN lastMessageAt IS NULL OR lastMessageAt <= %s
+                                             THEN %s ELSE lastMessageId END,
+                        lastMessageAt = CASE WHEN lastMessageAt IS NULL OR lastMessageAt <= %s
+                                             THEN %s ELSE lastMessageAt END
+                    WHERE id = %s
+                    """,
+                    (m["seq"], m["createdAt"], self._id(m["id"]), m["createdAt"], m["createdAt"], self._id(chat_id)),
+                )
+
+    def saved_message_seqs(self, messages: list[dict]) -> dict[str, int]:
+        if not messages:
+            return {}
+        marks = ",".join(["%s"] * len(messages))
+        rows = self._query(f"SELECT id, seq FROM messages WHERE id IN ({marks})", self._ids(m["id"] for m in messages))
+        return {r["id"]: r["seq"] for r in rows}
+
+    def list_messages_page(
+        self,
+        chat_id: str,
+        before: tuple[int, str] | None = None,
+        after: tuple[int, str] | None = None,
+        limit: int = 50,
+    ) -> list[dict]:
+        # comparación (createdAt, id) expandida para que MySQL use el rango del índice
+        # messages(chatId, createdAt, id) en lugar de OFFSET. Los archivados son siempre
+        # más antiguos que los de la tabla: van antes (after) o completan la página (before)
+        if after is not None:
+            mark = self._archive_marks([chat_id]).get(chat_id)
+            # un cursor posterior al último archivado no necesita los segmentos
+            archived = self._archived_page(chat_id, after=after, limit=limit) if mark and after[0] <= mark[0] else []
+            if archived:
+                after = (archived[-1]["createdAt"], archived[-1]["id"])
+                if len(archived) >= limit:
+                    return archived
+            return archived + self._query(
+                _SQL_PAGE_AFTER,
+                (self._id(chat_id), after[0], after[0], self._id(after[1]), limit - len(archived)),
+            )
+
+        if before is not None:
+            rows = self._query(
+                _SQL_PAGE_BEFORE, (self._id(chat_id), before[0], before[0], self._id(before[1]), limit)
+            )
+        else:
+            rows = self._query(_SQL_PAGE_LATEST, (self._id(chat_id), limit))
+        rows.reverse()
+        if len(rows) < limit and self._archive_marks([chat_id]):
+            older = (rows[0]["createdAt"], rows[0]["id"]) if rows else before
+            rows[:0] = self._archived_page(chat_id, before=older, limit=limit - len(rows))
+        return rows
+
+    def list_messages_many(self, pages: dict[str, tuple[int, str] | None], limit: int) -> dict[str, list[dict]]:
+        if not pages:
+            return {}
+        # un UNION ALL con un rango del índice messages(chatId, createdAt, id) por chat: cada
+        # rama lee solo `limit` filas (una ventana ROW_NUMBER recorrería el chat completo)
+        arms, params = [], []
+        for chat_id, after in pages.items():
+            if after is None:
+                arms.append(_SQL_MANY_LATEST)
+                params.extend((self._id(chat_id), limit))
+            else:
+                arms.append(_SQL_MANY_AFTER)
+                params.extend((self._id(chat_id), after[0], after[0], self._id(after[1]), limit))
+        out: dict[str, list[dict]] = {chat_id: [] for chat_id in pages}
+        for row in self._query(" UNION ALL ".join(arms), tuple(params)):
+            out[row["chatId"]].append(row)
+        for msgs in out.values():
+            msgs.sort(key=lambda m: (m["createdAt"], m["id"]))
+        # páginas que pueden tocar el archivo: las que siguen a un cursor y las que quedaron cortas
+        pending = [cid for cid, after in pages.items() if after is not None or len(out[cid]) < limit]
+        for chat_id, (archived_at, _) in self._archive_marks(pending).items():
+            after = pages[chat_id]
+            if after is None or after[0] <= archived_at:
+                out[chat_id] = self.list_messages_page(chat_id, after=after, limit=limit)
+        return out
+
+    def list_messages_after_seq(self, after: dict[str, int], limit: int) -> list[dict]:
+        if not after or limit <= 0:
+            return []
+        # un rango del índice messages(chatId, seq) por chat
+        where = " OR ".join([_SQL_AFTER_SEQ_WHERE] * len(after))
+        params = [v for chat_id, seq in after.items() for v in (self._id(chat_id), seq)]
+        rows = self._query(_SQL_AFTER_SEQ.format(where=where), (*params, limit))
+        # solo los chats con archivados posteriores al seq del cliente
+        behind = [cid for cid, (_, seq) in self._archive_marks(list(after)).items() if after[cid] < seq]
+        if not behind:
+            return rows
+        # cada segmento con maxSeq > seq aporta al menos un mensaje: `limit` segmentos alcanzan
+        segments = self._query(
+            _SQL_SEGMENTS_AFTER_SEQ.format(where=" OR ".join([_SQL_SEGMENTS_AFTER_SEQ_WHERE] * len(behind))),
+            (*[v for chat_id in behind for v in (self._id(chat_id), after[chat_id])], limit),
+        )
+        if not segments:
+            return rows
+        for s in segments:
+            seq = after[s["chatId"]]
+            rows.extend(m for m in archive.unpack(s["chatId"], s["data"]) if m["seq"] is not None and m["seq"] > seq)
+        rows.sort(key=lambda m: (chat_sort_key(m["chatId"]), m["seq"]))
+        return rows[:limit]
+
+    def list_chat_sync_state(self, user_id: str) -> list[dict]:
+        return self._query(_SQL_SYNC_STATE, (self._id(user_id),))
+
+    def scan_messages(self, after_id: str = "", limit: int = 1000) -> list[dict]:
+        return self._query(
+            """
+            SELECT id, chatId, senderId, kind, content, createdAt, seq
+            FROM messages
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (self._id(after_id), limit),
+        )
+
+    # ---------------- ARCHIVO ----------------
+    # None: todavía no se miró; False se vuelve a mirar cada _SEGMENTS_RECHECK_S
+    _has_segments: bool | None = None
+    _segments_checked_at = 0.0
+
+    def _segments_possible(self) -> bool:
+        if self.archive_enabled or self._has_segments:
+            return True
+        now = time.monotonic()
+        if self._has_segments is None or now - self._segments_checked_at >= _SEGMENTS_RECHECK_S:
+            self._segments_checked_at = now
+            self._has_segments = self._query_one("SELECT 1 AS found FROM message_segments LIMIT 1") is not None
+        return self._has_segments
+
+    def _archive_marks(self, chat_ids: list[str]) -> dict[str, tuple[int, int]]:
+        # {chatId: (archivedAt, archivedSeq)} de los chats con segmentos; sin archivo, ni una consulta
+        if not chat_ids or not self._segments_possible():
+            return {}
+        marks = ",".join(["%s"] * len(chat_ids))
+        rows = self._query(_SQL_ARCHIVE_MARKS.format(marks=marks), self._ids(chat_ids))
+        return {r["id"]: (r["archivedAt"], r["archivedSeq"]) for r in rows}
+
+    def _archived_page(
+        self,
+        chat_id: str,
+        before: tuple[int, str] | None = None,
+        after: tuple[int, str] | None = None,
+        limit: int = 50,
+    ) -> list[dict]:
+        # solo se descomprimen los segmentos que tocan la página, de a unos pocos por consulta
+        if after is not None:
+            where, order, step = _SEGMENTS_AFTER, "ASC", ">"
+            bound = (after[0], after[0], self._id(after[1]))
+        elif before is not None:
+            where, order, step = _SEGMENTS_BEFORE, "DESC", "<"
+            bound = (before[0], before[0], self._id(before[1]))
+        else:
+            where, order, step, bound = "1=1", "DESC", "<", ()
+        out: list[dict] = []
+        segment = None
+        while len(out) < limit:
+            extra = f" AND segment {step} %s" if segment is not None else ""
+            rows = self._query(
+                _SQL_SEGMENTS_PAGE.format(where=where, extra=extra, order=order),
+                (self._id(chat_id), *bound, *(() if segment is None else (segment,))),
+            )
+            if not rows:
+                break
+            for r in rows:
+                msgs = archive.unpack(chat_id, r["data"])
+                if after is not None:
+                    out.extend(m for m in msgs if (m["createdAt"], m["id"]) > after)
+                else:
+                    out[:0] = [m for m in msgs if before is None or (m["createdAt"], m["id"]) < before]
+            segment = rows[-1]["segment"]
+        return out[:limit] if after is not None else out[max(0, len(out) - limit):]
+
+    def scan_archived(self, after: tuple[str, int] | None = None, limit: int = 100) -> list[dict]:
+        chat_id, segment = after or ("", 0)
+        rows = self._query(
+            """
+            SELECT chatId, segment, data FROM message_segments
+            WHERE chatId > %s OR (chatId = %s AND segment > %s)
+            ORDER BY chatId, segment
+            LIMIT %s
+            """,
+            (self._id(chat_id), self._id(chat_id), segment, limit),
+        )
+        return [
+            {"chatId": r["chatId"], "segment": r["segment"], "messages": archive.unpack(r["chatId"], r["data"])}
+            for r in rows
+        ]
+
+    def archive_messages(self, older_than_ms: int, segment_size: int = 500, batch_size: int = 100) -> int:
+        # chats con mensajes viejos, en lotes por id; cada chat se archiva con su fila bloqueada
+        # (igual que save_messages), así dos procesos no escriben el mismo segmento
+        archived = 0
+        last_id = ""
+        while True:
+            ids = [
+                r["chatId"]
+                for r in self._query(
+                    "SELECT DISTINCT chatId FROM messages WHERE chatId > %s AND createdAt < %s "
+                    "ORDER BY chatId LIMIT %s",
+                    (self._id(last_id), older_than_ms, batch_size),
+                )
+            ]
+            if not ids:
+                return archived
+            for chat_id in ids:
+                while True:
+                    moved = self._archive_chat(chat_id, older_than_ms, segment_size)
+                    archived += moved
+                    if moved < segment_size:
+                        break
+            last_id = ids[-1]
+
+    def _archive_chat(self, chat_id: str, older_than_ms: int, segment_size: int) -> int:
+        # un segmento por llamada; el último mensaje del chat queda en la tabla (lo usa chat:list)
+        with self._transaction() as cur:
+            cur.execute("SELECT lastMessageId FROM chats WHERE id=%s FOR UPDATE", (self._id(chat_id),))
+            chat = cur.fetchone()
+            cur.execute(
+                """
+                SELECT id, chatId, senderId, kind, content, createdAt, seq
+                FROM messages
+                WHERE chatId=%s AND createdAt < %s
+                ORDER BY createdAt ASC, id ASC
+                LIMIT %s
+                """,
+                (self._id(chat_id), older_than_ms, segment_size + 1),
+            )
+            rows = [m for m in cur.fetchall() if chat is None or m["id"] != chat["lastMessageId"]][:segment_size]
+            if not rows:
+                return 0
+            cur.execute(
+                "SELECT COALESCE(MAX(segment), 0) AS last FROM message_segments WHERE chatId=%s",
+                (self._id(chat_id),),
+            )
+            seg = archive.segment_row(chat_id, cur.fetchone()["last"] + 1, rows)
+            cur.execute(
+                """
+                INSERT INTO message_segments
+                    (chatId, segment, firstCreatedAt, firstId, lastCreatedAt, lastId, maxSeq, count, data, createdAt)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                """,
+                (
+                    self._id(chat_id), seg["segment"], seg["firstCreatedAt"], self._id(seg["firstId"]),
+                    seg["lastCreatedAt"], self._id(seg["lastId"]), seg["maxSeq"], seg["count"], seg["data"],
+                    int(time.time() * 1000),
+                ),
+            )
+            # los segmentos van en orden: el último fija hasta dónde llega el archivo del chat
+            cur.execute(
+                "UPDATE chats SET archivedAt=%s, archivedSeq=CASE WHEN %s > archivedSeq THEN %s ELSE archivedSeq END "
+                "WHERE id=%s",
+                (seg["lastCreatedAt"], seg["maxSeq"] or 0, seg["maxSeq"] or 0, self._id(chat_id)),
+            )
+            marks = ",".join(["%s"] * len(rows))
+            cur.execute(f"DELETE FROM messages WHERE id IN ({marks})", self._ids(m["id"] for m in rows))
+        self._has_segments = True
+        return len(rows)
+
+    def backfill_last_message(self, batch_size: int = 500) -> int:
+        # recorre chats por id en lotes para no bloquear la tabla completa
+        updated = 0
+        last_id = ""
+        while True:
+            ids = [
+                r["id"]
+                for r in self._query(
+                    "SELECT id FROM chats WHERE id > %s ORDER BY id LIMIT %s",
+                    (self._id(last_id), batch_size),
+                )
+            ]
+            if not ids:
+                return updated
+            marks = ",".join(["%s"] * len(ids))
+            with self._transaction() as cur:
+                cur.execute(
+                    f"""
+                    UPDATE chats SET
+                        lastMessageId = (
+                            SELECT m.id FROM messages m WHERE m.chatId = chats.id
+                            ORDER BY m.createdAt DESC, m.id DESC LIMIT 1
+                        ),
+                        lastMessageAt = (SELECT MAX(m.createdAt) FROM messages m WHERE m.chatId = chats.id)
+                    WHERE id IN ({marks})
+                    """,
+                    self._ids(ids),
+                )
+            updated += len(ids)
+            last_id = ids[-1]
+
+    def backfill_seq(self, batch_size: int = 500) -> int:
+        # solo chats con mensajes sin numerar; se renumera el chat completo en orden
+        # (createdAt, id) con la fila del chat bloqueada, igual que en save_messages
+        updated = 0
+        last_id = ""
+        while True:
+            ids = [
+                r["chatId"]
+                for r in self._query(
+                    "SELECT DISTINCT chatId FROM messages WHERE seq IS NULL AND chatId > %s ORDER BY chatId LIMIT %s",
+                    (self._id(last_id), batch_size),
+                )
+            ]
+            if not ids:
+                return updated
+            for chat_id in ids:
+                with self._transaction() as cur:
+                    cur.execute("SELECT id FROM chats WHERE id=%s FOR UPDATE", (self._id(chat_id),))
+                    cur.fetchall()
+                    cur.execute(
+                        "SELECT id FROM messages WHERE chatId=%s ORDER BY createdAt ASC, id ASC",
+                        (self._id(chat_id),),
+                    )
+                    rows = cur.fetchall()
+                    cur.executemany(
+                        "UPDATE messages SET seq=%s WHERE id=%s",
+                        [(i, self._id(r["id"])) for i, r in enumerate(rows, 1)],
+                    )
+                    cur.execute("UPDATE chats SET lastSeq=%s WHERE id=%s", (len(rows), self._id(chat_id)))
+            updated += len(ids)
+            last_id = ids[-1]
+
+    # ---------------- PLANES ----------------
+    def hot_queries(self) -> list[tuple[str, str, tuple]]:
+        # las mismas constantes y la misma conversión de ids que usan los métodos de arriba
+        i = self._id(_SAMPLE_ID)
+        two = ",".join(["%s"] * 2)
+        return [
+            ("usuario por username", _SQL_PUBLIC_BY_USERNAME, ("ana",)),
+            ("email en uso", _SQL_EMAIL_IN_USE, ("ana@example.com",)),
+            ("usuarios por ids", _SQL_PUBLIC_BY_IDS.format(marks=two), (i, i)),
+            ("lista de chats", _SQL_CHAT_LIST, (i,)),
+            ("miembros de los chats del usuario", _SQL_CHAT_LIST_MEMBERS, (i,)),
+            ("membresía", _SQL_IS_MEMBER, (i, i)),
+            ("miembros de un chat", _SQL_CHAT_USER_IDS, (i,)),
+            ("chats de un usuario", _SQL_USER_CHAT_IDS, (i,)),
+            ("contactos", _SQL_RELATED_USERS, (i,)),
+            ("chat directo entre dos usuarios", _SQL_DIRECT_CHAT, (i, i)),
+            ("página más reciente", _SQL_PAGE_LATEST, (i, 50)),
+            ("página anterior", _SQL_PAGE_BEFORE, (i, 0, 0, i, 50)),
+            ("página siguiente", _SQL_PAGE_AFTER, (i, 0, 0, i, 50)),
+            ("room:joinMany", " UNION ALL ".join([_SQL_MANY_LATEST, _SQL_MANY_AFTER]), (i, 50, i, 0, 0, i, 50)),
+            ("mensajes después de un seq",
+             _SQL_AFTER_SEQ.format(where=" OR ".join([_SQL_AFTER_SEQ_WHERE] * 2)), (i, 0, i, 0, 200)),
+            ("segmentos después de un seq",
+             _SQL_SEGMENTS_AFTER_SEQ.format(where=" OR ".join([_SQL_SEGMENTS_AFTER_SEQ_WHERE] * 2)), (i, 0, i, 0, 200)),
+            ("segmentos anteriores", _SQL_SEGMENTS_PAGE.format(where=_SEGMENTS_BEFORE, extra="", order="DESC"),
+             (i, 0, 0, i)),
+            ("segmentos siguientes", _SQL_SEGMENTS_PAGE.format(where=_SEGMENTS_AFTER, extra="", order="ASC"),
+             (i, 0, 0, i)),
+            ("marcas de archivo", _SQL_ARCHIVE_MARKS.format(marks=two), (i, i)),
+            ("estado de sync", _SQL_SYNC_STATE, (i,)),
+        ]
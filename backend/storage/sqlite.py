@@ -0,0 +1,172 @@
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from .sql import SQLStorage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT UNIQUE,
+    displayName TEXT,
+    password_hash TEXT NOT NULL,
+    avatarUrl TEXT,
+    status TEXT NOT NULL DEFAULT 'offline'
+);
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    description TEXT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    lastMessageId TEXT,
+    lastMessageAt INTEGER,
+    lastSeq INTEGER NOT NULL DEFAULT 0,
+    updatedAt INTEGER,
+    archivedAt INTEGER NOT NULL DEFAULT 0,
+    archivedSeq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chats_last_message ON chats (lastMessageAt);
+CREATE TABLE IF NOT EXISTS chat_members (
+    chatId TEXT NOT NULL,
+    userId TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'member',
+    PRIMARY KEY (chatId, userId)
+);
+CREATE INDEX IF NOT EXISTS idx_chat_members_user ON chat_members (userId, chatId);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    chatId TEXT NOT NULL,
+    senderId TEXT NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'text',
+    content TEXT NOT NULL,
+    createdAt INTEGER NOT NULL,
+    seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_created ON messages (chatId, createdAt, id);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_seq ON messages (chatId, seq);
+CREATE TABLE IF NOT EXISTS message_segments (
+    chatId TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    firstCreatedAt INTEGER NOT NULL,
+    firstId TEXT NOT NULL,
+    lastCreatedAt INTEGER NOT NULL,
+    lastId TEXT NOT NULL,
+    maxSeq INTEGER,
+    count INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    createdAt INTEGER NOT NULL,
+    PRIMARY KEY (chatId, segment)
+);
+"""
+
+# columnas agregadas después de la primera versión del esquema: (tabla, columna, tipo)
+_ADDED_COLUMNS = [
+    ("chats", "lastMessageId", "TEXT"),
+    ("chats", "lastMessageAt", "INTEGER"),
+    ("chats", "lastSeq", "INTEGER NOT NULL DEFAULT 0"),
+    ("chats", "updatedAt", "INTEGER"),
+    ("messages", "seq", "INTEGER"),
+    ("chats", "archivedAt", "INTEGER NOT NULL DEFAULT 0"),
+    ("chats", "archivedSeq", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# marca de archivo de los chats que ya tenían segmentos antes de esas columnas
+_BACKFILL_ARCHIVED = """
+UPDATE chats SET
+    archivedAt = COALESCE((SELECT MAX(s.lastCreatedAt) FROM message_segments s WHERE s.chatId = chats.id), 0),
+    archivedSeq = COALESCE((SELECT MAX(s.maxSeq) FROM message_segments s WHERE s.chatId = chats.id), 0)
+"""
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+def _dict_row(cursor, row):
+    return {col[0]: row[i] for i, col in enumerate(cursor.description)}
+
+
+class _Cursor:
+    """Traduce el dialecto MySQL de SQLStorage (`%s`, INSERT IGNORE, FOR UPDATE) a SQLite."""
+
+    def __init__(self, cur: sqlite3.Cursor):
+        self._cur = cur
+
+    @staticmethod
+    def _sql(sql: str) -> str:
+        # BEGIN IMMEDIATE ya toma el candado de escritura: FOR UPDATE sobra
+        sql = sql.replace("INSERT IGNORE", "INSERT OR IGNORE").replace(" FOR UPDATE", "")
+        return _PLACEHOLDER.sub("?", sql)
+
+    def execute(self, sql: str, params=()):
+        self._cur.execute(self._sql(sql), params)
+
+    def executemany(self, sql: str, seq):
+        self._cur.executemany(self._sql(sql), seq)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+
+class SQLiteStorage(SQLStorage):
+    name = "sqlite"
+
+    def __init__(self, path: str, pool_size: int = 4):
+        # una conexión por hilo del executor; WAL permite lectores concurrentes
+        self.path = path
+        self.pool_size = pool_size
+        self._local = threading.local()
+        with self._conn() as c:
+            self._upgrade(c)
+            c.executescript(SCHEMA)
+
+    @staticmethod
+    def _upgrade(c: sqlite3.Connection):
+        # archivos creados con un esquema anterior: agrega columnas faltantes
+        added = set()
+        for table, column, type_ in _ADDED_COLUMNS:
+            cols = {r["name"] for r in c.execute(f"PRAGMA table_info({table})").fetchall()}
+            if cols and column not in cols:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {type_}")
+                added.add(column)
+        if "archivedAt" in added and c.execute("PRAGMA table_info(message_segments)").fetchall():
+            c.execute(_BACKFILL_ARCHIVED)
+
+    def _connect(self) -> sqlite3.Connection:
+        c = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+        c.row_factory = _dict_row
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        c.execute("PRAGMA foreign_keys=OFF")
+        return c
+
+    @contextmanager
+    def _conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = self._local.conn = self._connect()
+        yield c
+
+    def _cursor(self, c):
+        return _Cursor(c.cursor())
+
+    def _begin(self, c):
+        c.execute("BEGIN IMMEDIATE")
+
+    def full_scans(self, sql: str, params: tuple = ()) -> list[str]:
+        rows = self._query("EXPLAIN QUERY PLAN " + sql, params)
+        # "SCAN t" recorre la tabla; "SCAN t USING [COVERING] INDEX" recorre un índice.
+        # Las subconsultas (CO-ROUTINE/MATERIALIZE t) tienen su propia fila: leerlas no cuenta
+        derived = {r["detail"].split(" ", 1)[1] for r in rows if r["detail"].startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+        return [
+            r["detail"][5:] for r in rows
+            if r["detail"].startswith("SCAN ") and " USING " not in r["detail"] and r["detail"][5:] not in derived
+        ]
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# los módulos leen el entorno al importarse: nada de archivos en el directorio actual
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("MESSAGE_INDEX_PATH", "")
+os.environ.setdefault("ATTACHMENT_DIR", "")
+
+from storage import create_storage  # noqa: E402
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def storage(request, tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "chat.sqlite3"))
+    s = create_storage(request.param, pool_size=2)
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def chat(storage):
+    # (chatId, userId) de un grupo con un solo miembro
+    user = storage.create_user("ana", "Ana", None, "x")
+    return storage.create_group_chat("G", None, user["id"])["id"], user["id"]
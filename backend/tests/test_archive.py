@@ -0,0 +1,92 @@
+import time
+
+from storage import create_storage
+from storage.base import new_message
+
+DAY_MS = 86400 * 1000
+
+
+def fill(storage, chat, n=30):
+    # n mensajes de hace 10 días, uno por segundo
+    chat_id, user_id = chat
+    start = int(time.time() * 1000) - 10 * DAY_MS
+    storage.save_messages([new_message(chat_id, user_id, "text", f"m{i}", start + i * 1000) for i in range(n)])
+
+
+def contents(messages):
+    return [m["content"] for m in messages]
+
+
+def snapshot(storage, chat_id):
+    first = storage.list_messages_page(chat_id, limit=10)
+    return {
+        "latest": contents(first),
+        "before": contents(storage.list_messages_page(chat_id, before=(first[0]["createdAt"], first[0]["id"]), limit=10)),
+        "after": contents(storage.list_messages_page(chat_id, after=(0, ""), limit=10)),
+        "many": {k: contents(v) for k, v in storage.list_messages_many({chat_id: (0, "")}, 10).items()},
+        "seq": contents(storage.list_messages_after_seq({chat_id: 5}, 10)),
+    }
+
+
+def record_sql(storage, monkeypatch):
+    queries = []
+    query = storage._query
+
+    def spy(sql, params=()):
+        queries.append(sql)
+        return query(sql, params)
+
+    monkeypatch.setattr(storage, "_query", spy)
+    return queries
+
+
+def test_reads_are_the_same_after_archiving(storage, chat):
+    fill(storage, chat)
+    chat_id = chat[0]
+    before = snapshot(storage, chat_id)
+    storage.archive_enabled = True
+    moved = storage.archive_messages(int(time.time() * 1000) - DAY_MS, segment_size=7)
+    if storage.name == "sqlite":
+        # todo menos el último mensaje, que sigue en la tabla para chat:list
+        assert moved == 29
+    assert snapshot(storage, chat_id) == before
+    assert before["latest"] == [f"m{i}" for i in range(20, 30)]
+    assert before["seq"] == [f"m{i}" for i in range(5, 15)]
+
+
+def test_no_segment_queries_without_archive(storage, chat, monkeypatch):
+    fill(storage, chat, 5)
+    if storage.name != "sqlite":
+        return
+    queries = record_sql(storage, monkeypatch)
+    snapshot(storage, chat[0])
+    # ni los segmentos ni la marca del chat: el archivo nunca se usó
+    assert not [q for q in queries if "message_segments" in q or "archivedAt" in q]
+
+
+def test_cursor_past_archive_skips_segments(storage, chat, monkeypatch):
+    fill(storage, chat)
+    chat_id = chat[0]
+    storage.archive_enabled = True
+    storage.archive_messages(int(time.time() * 1000) - DAY_MS, segment_size=10)
+    if storage.name != "sqlite":
+        return
+    last = storage.list_messages_page(chat_id, limit=1)[0]
+    queries = record_sql(storage, monkeypatch)
+    assert storage.list_messages_page(chat_id, after=(last["createdAt"], last["id"]), limit=10) == []
+    assert storage.list_messages_after_seq({chat_id: last["seq"]}, 10) == []
+    assert not [q for q in queries if "message_segments" in q]
+
+
+def test_segments_from_another_process_are_seen(storage, chat, tmp_path):
+    if storage.name != "sqlite":
+        return
+    fill(storage, chat)
+    chat_id = chat[0]
+    assert len(storage.list_messages_page(chat_id, limit=50)) == 30
+    # otro proceso (p. ej. `manage.py archive`) archiva con este storage ya en marcha
+    other = create_storage("sqlite", pool_size=1)
+    other.archive_messages(int(time.time() * 1000) - DAY_MS)
+    other.close()
+    storage._segments_checked_at -= 3600
+    assert len(storage.list_messages_page(chat_id, limit=50)) == 30
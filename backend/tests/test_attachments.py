@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+import pytest
+
+from attachments import AttachmentError, AttachmentStore, clean_name, make_frame, parse_frame
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AttachmentStore(str(tmp_path), max_bytes=1024, chunk_size=16, secret="s", mime_types="image/png,text/plain")
+
+
+def upload(store, data: bytes, chat_id="c1", mime="image/png", name="foto.png", size=None):
+    up = store.begin(chat_id, len(data) if size is None else size, mime, name)
+    for i in range(0, len(data), store.chunk_size):
+        up.write(data[i:i + store.chunk_size])
+    return store.finish(up)
+
+
+def test_finish_stores_by_hash_and_dedups(store):
+    data = b"x" * 40
+    ref = upload(store, data)
+    digest = hashlib.sha256(data).hexdigest()
+    assert ref["id"] == digest and ref["size"] == 40
+    assert store.size_of(digest) == 40
+    again = upload(store, data, name="otra.png")
+    assert again["id"] == digest and store.dedup_hits == 1
+    assert os.listdir(os.path.join(store.root, "tmp")) == []
+
+
+def test_read_range(store):
+    ref = upload(store, bytes(range(50)))
+    assert store.read(ref["id"], 10, 5) == bytes(range(10, 15))
+    assert store.read(ref["id"], 48, 16) == bytes([48, 49])
+
+
+def test_signature_is_bound_to_the_chat(store):
+    ref = upload(store, b"hola", chat_id="c1")
+    assert store.verify("c1", ref["id"], ref["sig"])
+    assert not store.verify("c2", ref["id"], ref["sig"])
+    assert not store.verify("c1", ref["id"], None)
+
+
+def test_mime_allowlist(store):
+    assert store.check_mime("IMAGE/PNG; charset=binary") == "image/png"
+    for mime in ("text/html", "image/svg+xml", None):
+        with pytest.raises(AttachmentError):
+            store.check_mime(mime)
+    with pytest.raises(AttachmentError):
+        store.begin("c1", 10, "text/html", "x.html")
+
+
+def test_names_are_cleaned():
+    assert clean_name("../../etc/passwd") == "passwd"
+    assert clean_name("C:\\fotos\\playa.png") == "playa.png"
+    assert clean_name("fac\u202etxt.exe\n") == "factxt.exe"
+    assert clean_name("") == "archivo"
+    assert len(clean_name("a" * 1000)) == 255
+
+
+def test_size_limits(store):
+    for size in (0, 2048):
+        with pytest.raises(AttachmentError):
+            store.begin("c1", size, "image/png", "x.png")
+
+
+def test_abort_removes_partial_upload(store):
+    up = store.begin("c1", 100, "text/plain", "notas.txt")
+    up.write(b"a" * 10)
+    store.abort(up)
+    assert not os.path.exists(up.path)
+    store.abort(up)
+
+
+def test_frames_roundtrip():
+    frame = make_frame(b"\x01" * 16, 42, b"datos")
+    transfer_id, offset, data = parse_frame(frame)
+    assert (transfer_id, offset, bytes(data)) == (b"\x01" * 16, 42, b"datos")
+    with pytest.raises(AttachmentError):
+        parse_frame(b"corto")
@@ -0,0 +1,94 @@
+import asyncio
+
+from bus.unix import Broker, UnixSocketBus
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def start_bus(path, worker_id, events, users=()):
+    bus = UnixSocketBus(path, worker_id)
+
+    async def on_event(event):
+        events.append(event)
+
+    await bus.start(on_event, local_users=lambda: users)
+    return bus
+
+
+async def until(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < end, "timeout"
+        await asyncio.sleep(0.01)
+
+
+def test_publish_and_directory(tmp_path):
+    async def main():
+        broker = Broker(str(tmp_path / "bus.sock"))
+        await broker.start()
+        a_events, b_events = [], []
+        a = await start_bus(broker.path, "a", a_events)
+        b = await start_bus(broker.path, "b", b_events)
+        b.announce("u1", True)
+        await until(lambda: a.workers_of(["u1"]) == {"b"})
+
+        a.publish(a.workers_of(["u1"]), {"kind": "users", "users": ["u1"], "frame": "x"})
+        a.publish(None, {"kind": "status", "statuses": {"u1": "busy"}})
+        await until(lambda: len(b_events) == 2)
+        assert [e["kind"] for e in b_events] == ["users", "status"]
+        assert a_events == []
+
+        # al cerrarse b sus usuarios salen del directorio de a
+        await b.close()
+        await until(lambda: not a.workers_of(["u1"]))
+        await a.close()
+        await broker.close()
+
+    run(main())
+
+
+def test_slow_worker_is_disconnected(tmp_path):
+    async def main():
+        broker = Broker(str(tmp_path / "bus.sock"), max_queue_bytes=64 * 1024)
+        await broker.start()
+        # un worker que se presenta y nunca lee
+        reader, writer = await asyncio.open_unix_connection(broker.path)
+        writer.write(b'{"op":"hello","worker":"slow"}\n')
+        await until(lambda: "slow" in broker._peers)
+        a = await start_bus(broker.path, "a", [])
+        frame = "x" * 32 * 1024
+        for _ in range(200):
+            a.publish(["slow"], {"kind": "users", "users": [], "frame": frame})
+            await asyncio.sleep(0)
+        await until(lambda: broker.overflows >= 1 and "slow" not in broker._peers)
+        # la memoria del broker no crece por el worker lento
+        assert all(p.queued <= broker.max_queue_bytes for p in broker._peers.values())
+        writer.close()
+        await a.close()
+        await broker.close()
+
+    run(main())
+
+
+def test_reconnect_emits_resync(tmp_path):
+    async def main():
+        broker = Broker(str(tmp_path / "bus.sock"))
+        await broker.start()
+        events = []
+        a = await start_bus(broker.path, "a", events, users=("u1",))
+        b = await start_bus(broker.path, "b", [])
+        await until(lambda: b.workers_of(["u1"]) == {"a"})
+        # el broker corta a `a` (p. ej. por lento): al volver descarta sus cachés
+        broker._peers["a"].writer.close()
+        await until(lambda: {"kind": "resync"} in events, timeout=5)
+        assert a.reconnects == 1
+        # y vuelve a anunciar sus usuarios
+        await until(lambda: b.workers_of(["u1"]) == {"a"})
+        await a.close()
+        await b.close()
+        await broker.close()
+
+    run(main())
@@ -0,0 +1,97 @@
+import asyncio
+
+from fanout import FanoutMetrics, Outbox
+
+
+class FakeSocket:
+    """Socket que no envía nada hasta que se abre `gate`."""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.sent = []
+        self.closed_with = None
+
+    async def send(self, frame):
+        await self.gate.wait()
+        self.sent.append(frame)
+
+    async def close(self, code=None, reason=""):
+        self.closed_with = code
+
+
+def run(policy, scenario, max_frames=3):
+    async def main():
+        ws = FakeSocket()
+        metrics = FanoutMetrics()
+        outbox = Outbox(ws, max_frames, policy, metrics)
+        await scenario(ws, outbox, metrics)
+        return ws, outbox, metrics
+
+    return asyncio.run(main())
+
+
+def test_frames_are_sent_in_order_and_queue_is_released():
+    async def scenario(ws, outbox, metrics):
+        for i in range(3):
+            assert outbox.put(f"m{i}")
+        ws.gate.set()
+        await asyncio.sleep(0.01)
+
+    ws, outbox, metrics = run("coalesce", scenario)
+    assert ws.sent == ["m0", "m1", "m2"]
+    assert len(outbox) == 0 and outbox._task is None and outbox._frames is None
+    assert metrics.depth == 0 and metrics.sent == 3
+
+
+def test_coalesce_replaces_pending_state():
+    async def scenario(ws, outbox, metrics):
+        outbox.put("m0")
+        outbox.put("ana:online", key="ana")
+        outbox.put("ana:away", key="ana")
+        ws.gate.set()
+        await asyncio.sleep(0.01)
+
+    ws, _, metrics = run("coalesce", scenario)
+    assert ws.sent == ["m0", "ana:away"]
+    assert metrics.coalesced == 1
+
+
+def test_coalesce_drops_only_keyed_frames_when_full():
+    async def scenario(ws, outbox, metrics):
+        for i in range(3):
+            outbox.put(f"m{i}")
+        assert not outbox.put("bob:online", key="bob")
+        assert not outbox.closed
+        # un mensaje no se pierde en silencio: se corta para que el cliente haga sync
+        assert not outbox.put("m3")
+        await asyncio.sleep(0)
+
+    ws, outbox, metrics = run("coalesce", scenario)
+    assert outbox.closed and ws.closed_with == 1013
+    assert metrics.dropped == 1 and metrics.disconnected == 1
+    assert outbox._closer.done()
+
+
+def test_drop_policy_discards_new_frames():
+    async def scenario(ws, outbox, metrics):
+        for i in range(5):
+            outbox.put(f"m{i}")
+        ws.gate.set()
+        await asyncio.sleep(0.01)
+
+    ws, outbox, metrics = run("drop", scenario)
+    assert ws.sent == ["m0", "m1", "m2"]
+    assert metrics.dropped == 2 and not outbox.closed
+
+
+def test_disconnect_policy_closes_on_any_overflow():
+    async def scenario(ws, outbox, metrics):
+        for i in range(3):
+            outbox.put(f"p{i}", key=f"u{i}")
+        assert not outbox.put("p3", key="u3")
+        await asyncio.sleep(0)
+        assert not outbox.put("m0")
+
+    ws, outbox, metrics = run("disconnect", scenario)
+    assert ws.closed_with == 1013 and metrics.disconnected == 1
+    assert metrics.depth == 0
@@ -0,0 +1,37 @@
+import uuid
+
+import pytest
+
+from storage.ids import IdGenerator, InvalidIdError, id_from_bytes, id_to_bytes
+from storage.mysql import _decode
+
+
+def test_ids_are_increasing_uuid7():
+    gen = IdGenerator()
+    ids = [gen.new() for _ in range(5000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(uuid.UUID(i).version == 7 for i in ids)
+    # el orden del texto es el mismo que el de los bytes (el de la PK en MySQL)
+    assert sorted(ids, key=id_to_bytes) == ids
+
+
+def test_bytes_roundtrip():
+    value = IdGenerator().new()
+    raw = id_to_bytes(value)
+    assert len(raw) == 16
+    assert id_from_bytes(raw) == value
+
+
+@pytest.mark.parametrize("value", ["abc", "1234567890abcdef", "", None, 42])
+def test_non_uuid_is_rejected(value):
+    with pytest.raises(InvalidIdError):
+        id_to_bytes(value)
+    assert issubclass(InvalidIdError, ValueError)
+
+
+def test_decode_only_touches_id_columns():
+    value = IdGenerator().new()
+    blob = b"0123456789abcdef"
+    row = _decode({"id": id_to_bytes(value), "lastId": id_to_bytes(value), "data": blob, "segment": 3})
+    assert row == {"id": value, "lastId": value, "data": blob, "segment": 3}
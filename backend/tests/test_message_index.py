@@ -0,0 +1,136 @@
+import threading
+
+import pytest
+
+import db
+from message_index import MessageIndex
+from storage.base import new_message
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = MessageIndex(str(tmp_path / "index.sqlite3"))
+    yield idx
+    idx.close()
+
+
+def message(chat_id, content, created, kind="text"):
+    m = new_message(chat_id, "u1", kind, content, created)
+    m["seq"] = created
+    return m
+
+
+def build(index, batches):
+    assert index.claim_rebuild()
+    return index.rebuild(batches)
+
+
+def contents(found):
+    return [m["content"] for m in found[0]]
+
+
+def test_search_folds_accents_and_matches_prefix(index):
+    build(index, [[
+        message("c1", "La Canción del verano", 1),
+        message("c1", "otra cancion", 2),
+        message("c1", "nada que ver", 3),
+        message("c1", "foto", 4, kind="image"),
+    ]])
+    assert index.check_ready()
+    assert sorted(contents(index.search("CANCIÓN", ["c1"], 10))) == ["La Canción del verano", "otra cancion"]
+    assert contents(index.search("canci", ["c1"], 10)) != []
+    # con espacio al final la última palabra ya no es prefijo
+    assert contents(index.search("canci ", ["c1"], 10)) == []
+    assert contents(index.search("foto", ["c1"], 10)) == []
+
+
+def test_search_is_scoped_and_paginated(index):
+    build(index, [[message("c1", f"hola {i}", i) for i in range(5)] + [message("c2", "hola secreto", 10)]])
+    page, more = index.search("hola", ["c1"], 2)
+    assert len(page) == 2 and more
+    assert all(m["chatId"] == "c1" for m in page)
+    rest, more = index.search("hola", ["c1"], 10, offset=2)
+    assert len(rest) == 3 and not more
+    assert {m["id"] for m in page}.isdisjoint(m["id"] for m in rest)
+
+
+def test_rebuild_from_storage(storage, chat, tmp_path):
+    chat_id, user_id = chat
+    storage.save_messages([new_message(chat_id, user_id, "text", f"mensaje {i}", 1000 + i) for i in range(25)])
+    index = MessageIndex(str(tmp_path / "index.sqlite3"))
+    try:
+        # en lotes, como db.rebuild_message_index
+        batches = [storage.scan_messages(limit=50)]
+        assert build(index, batches) == 25
+        # add de lo que ya estaba no duplica
+        assert index.add(batches[0]) == 0
+        page, _ = index.search("mensaje", [chat_id], 50)
+        assert len(page) == 25
+    finally:
+        index.close()
+
+
+def test_failed_rebuild_can_be_claimed_again(index):
+    def batches():
+        yield [message("c1", "hola", 1)]
+        raise RuntimeError("la DB se cayó")
+
+    assert index.claim_rebuild()
+    with pytest.raises(RuntimeError):
+        index.rebuild(batches())
+    assert not index.check_ready()
+    # sin esperar BUILD_STALE_MS: otro proceso (aquí otro objeto) la reclama
+    other = MessageIndex(index.path)
+    try:
+        assert other.claim_rebuild()
+    finally:
+        other.close()
+
+
+def test_search_does_not_wait_for_writers(index):
+    build(index, [[message("c1", "hola mundo", 1)]])
+    found = []
+    # un escritor con el candado tomado (un lote o la reconstrucción en curso)
+    with index._lock:
+        t = threading.Thread(target=lambda: found.append(index.search("hola", ["c1"], 10)))
+        t.start()
+        t.join(timeout=5)
+        assert not t.is_alive()
+    assert contents(found[0]) == ["hola mundo"]
+
+
+def test_concurrent_search_during_writes(index):
+    build(index, [[]])
+    errors = []
+
+    def writer():
+        for i in range(300):
+            index.add([message("c1", f"palabra {i}", i)])
+
+    def reader():
+        try:
+            for _ in range(50):
+                page, _ = index.search("palabra", ["c1"], 5)
+                assert all(m["content"].startswith("palabra") for m in page)
+        except Exception as e:
+            errors.append(e)
+
+    w = threading.Thread(target=writer)
+    w.start()
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for r in readers:
+        r.start()
+    for r in readers:
+        r.join()
+    w.join()
+    assert not errors
+    assert len(index.search("palabra", ["c1"], 500)[0]) == 300
+
+
+def test_index_failure_does_not_reach_the_writer(monkeypatch, capsys):
+    def broken(messages):
+        raise RuntimeError("disco lleno")
+
+    monkeypatch.setattr(db.message_index, "add", broken)
+    db._index_messages([message("c1", "hola", 1)])
+    assert "disco lleno" in capsys.readouterr().out
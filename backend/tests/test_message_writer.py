@@ -0,0 +1,172 @@
+import asyncio
+
+from message_writer import MessageWriter
+
+
+def run_writer(storage, save, submit, on_commit=None, **kwargs):
+    """Corre un MessageWriter con `save`, llama a submit(writer) y lo cierra.
+
+    Devuelve (lotes notificados, (lote, error) fallidos).
+    """
+    committed, failed = [], []
+
+    async def notify(batch):
+        if on_commit is not None:
+            await on_commit(batch)
+        committed.append(batch)
+
+    async def on_error(batch, error):
+        failed.append((batch, error))
+
+    async def saved(messages):
+        return storage.saved_message_seqs(messages)
+
+    async def main():
+        writer = MessageWriter(save, notify, on_error, saved=saved, max_delay=0.001, **kwargs)
+        writer.start()
+        await submit(writer)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(main())
+    return committed, failed, writer
+
+
+def test_group_commit_keeps_order(storage, chat):
+    chat_id, user_id = chat
+
+    async def save(messages):
+        storage.save_messages(messages)
+
+    async def submit(writer):
+        for i in range(20):
+            writer.submit(chat_id, user_id, "text", f"m{i}")
+
+    committed, failed, writer = run_writer(storage, save, submit)
+    assert not failed
+    notified = [msg for batch in committed for msg, _ in batch]
+    assert [m["content"] for m in notified] == [f"m{i}" for i in range(20)]
+    assert [m["seq"] for m in notified] == list(range(1, 21))
+    stored = storage.list_messages_page(chat_id, limit=50)
+    assert [m["content"] for m in stored] == [f"m{i}" for i in range(20)]
+    assert writer.committed == 20
+
+
+def test_retry_after_commit_does_not_duplicate(storage, chat):
+    # el primer intento se confirma pero el llamador recibe un error (conexión cortada tras el COMMIT)
+    chat_id, user_id = chat
+    calls = []
+
+    async def save(messages):
+        calls.append(len(messages))
+        storage.save_messages(messages)
+        if len(calls) == 1:
+            raise ConnectionError("se perdió la respuesta del COMMIT")
+
+    async def submit(writer):
+        for i in range(3):
+            writer.submit(chat_id, user_id, "text", f"m{i}")
+
+    committed, failed, _ = run_writer(storage, save, submit)
+    assert calls == [3]
+    assert not failed
+    notified = [msg for batch in committed for msg, _ in batch]
+    assert [m["seq"] for m in notified] == [1, 2, 3]
+    assert len(storage.list_messages_page(chat_id, limit=50)) == 3
+
+
+def test_failed_batch_is_reported(storage, chat):
+    chat_id, user_id = chat
+
+    async def save(messages):
+        raise RuntimeError("DB caída")
+
+    async def submit(writer):
+        writer.submit(chat_id, user_id, "text", "hola")
+
+    committed, failed, writer = run_writer(storage, save, submit, retries=2)
+    assert not committed
+    assert len(failed) == 1 and isinstance(failed[0][1], RuntimeError)
+    assert writer.failed == 1
+    assert storage.list_messages_page(chat_id, limit=50) == []
+
+
+def test_slow_fanout_does_not_block_next_batch(storage, chat):
+    chat_id, user_id = chat
+    saved_at = []
+
+    async def save(messages):
+        storage.save_messages(messages)
+        saved_at.append(asyncio.get_running_loop().time())
+
+    async def slow_commit(batch):
+        await asyncio.sleep(0.2)
+
+    async def submit(writer):
+        writer.submit(chat_id, user_id, "text", "a")
+        await asyncio.sleep(0.02)
+        writer.submit(chat_id, user_id, "text", "b")
+        await asyncio.sleep(0.02)
+
+    committed, failed, _ = run_writer(storage, save, submit, on_commit=slow_commit)
+    assert len(saved_at) == 2
+    # el segundo lote se guarda mientras el primero todavía se está notificando
+    assert saved_at[1] - saved_at[0] < 0.15
+    assert [msg["content"] for batch in committed for msg, _ in batch] == ["a", "b"]
+
+
+def test_recovered_messages_reach_cache_and_index(monkeypatch, tmp_path):
+    # db.save_messages falla después del COMMIT: el reintento los encuentra guardados y
+    # tienen que llegar igual a la caché de mensajes recientes y al índice de búsqueda
+    import db
+    from message_index import MessageIndex
+
+    storage = db.get_storage()
+    user = storage.create_user("recupera", "Recupera", None, "x")
+    chat_id = storage.create_group_chat("R", None, user["id"])["id"]
+    db.recent_messages.load([chat_id], db._load_recent)
+    index = MessageIndex(str(tmp_path / "index.sqlite3"))
+    assert index.claim_rebuild()
+    index.rebuild([])
+    monkeypatch.setattr(db, "message_index", index)
+
+    calls = []
+    save_messages = storage.save_messages
+
+    def commit_then_fail(messages):
+        calls.append(len(messages))
+        save_messages(messages)
+        if len(calls) == 1:
+            raise ConnectionError("se perdió la respuesta del COMMIT")
+
+    monkeypatch.setattr(storage, "save_messages", commit_then_fail)
+
+    async def save(messages):
+        await asyncio.to_thread(db.save_messages, messages)
+
+    async def saved(messages):
+        return await asyncio.to_thread(db.saved_message_seqs, messages)
+
+    committed = []
+
+    async def on_commit(batch):
+        committed.append(batch)
+
+    async def on_error(batch, error):
+        raise AssertionError(error)
+
+    async def main():
+        writer = MessageWriter(save, on_commit, on_error, saved=saved, max_delay=0.001)
+        writer.start()
+        for i in range(3):
+            writer.submit(chat_id, user["id"], "text", f"recuperado {i}")
+        await writer.close()
+
+    try:
+        asyncio.run(main())
+        assert calls == [3]
+        cached = db.recent_messages.page(chat_id, limit=10)
+        assert [(m["content"], m["seq"]) for m in cached] == [(f"recuperado {i}", i + 1) for i in range(3)]
+        assert len(index.search("recuperado", [chat_id], 10)[0]) == 3
+    finally:
+        index.close()
@@ -0,0 +1,14 @@
+from storage.migrations import check_plans
+
+
+def test_hot_queries_use_indexes(storage):
+    names = [name for name, _, _ in storage.hot_queries()]
+    if names:
+        assert "room:joinMany" in names and "página siguiente" in names
+    assert check_plans(storage) == []
+
+
+def test_full_scan_is_reported(storage):
+    if not storage.hot_queries():
+        return
+    assert storage.full_scans("SELECT id FROM messages WHERE content=%s", ("x",)) == ["messages"]
@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+from storage.pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self, n):
+        self.n = n
+        self.alive = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFactory:
+    """connect/ping de DB-API falsos: cuenta las conexiones abiertas."""
+
+    def __init__(self):
+        self.opened = []
+
+    def connect(self):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+    def ping(self, conn):
+        return conn.alive
+
+
+def make_pool(factory, **kwargs):
+    options = {"min_size": 0, "max_size": 1, "timeout": 1.0, "check_interval": 0}
+    options.update(kwargs)
+    pool = ConnectionPool(factory.connect, factory.ping, **options)
+    pool.start()
+    return pool
+
+
+def wait_until(condition, limit=2.0):
+    deadline = time.monotonic() + limit
+    while not condition():
+        assert time.monotonic() < deadline, "la condición no se cumplió a tiempo"
+        time.sleep(0.01)
+
+
+def test_start_opens_min_size_and_reuses_idle():
+    factory = FakeFactory()
+    pool = make_pool(factory, min_size=2, max_size=3, check_interval=30)
+    try:
+        assert len(factory.opened) == 2
+        entry = pool.acquire()
+        pool.release(entry)
+        assert len(factory.opened) == 2
+        assert pool.stats()["idle"] == 2
+    finally:
+        pool.close()
+
+
+def test_checkout_times_out_when_exhausted():
+    factory = FakeFactory()
+    pool = make_pool(factory, timeout=0.05)
+    try:
+        entry = pool.acquire()
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+        stats = pool.stats()
+        assert stats["timeouts"] == 1 and stats["waiting"] == 0
+        pool.release(entry)
+        # tras el timeout el pool sigue sirviendo
+        pool.release(pool.acquire())
+    finally:
+        pool.close()
+
+
+def test_waiters_are_served_in_arrival_order():
+    factory = FakeFactory()
+    pool = make_pool(factory)
+    order = []
+    held = pool.acquire()
+
+    def worker(name):
+        entry = pool.acquire()
+        order.append(name)
+        pool.release(entry)
+
+    threads = []
+    try:
+        for i in range(4):
+            thread = threading.Thread(target=worker, args=(i,))
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: pool.stats()["waiting"] == i + 1)
+        pool.release(held)
+        for thread in threads:
+            thread.join(timeout=2)
+        assert order == [0, 1, 2, 3]
+        assert len(factory.opened) == 1
+    finally:
+        pool.close()
+
+
+def test_idle_connections_shrink_to_min_size():
+    factory = FakeFactory()
+    pool = make_pool(factory, min_size=1, max_size=3, idle_timeout=0.05, check_interval=0.02)
+    try:
+        entries = [pool.acquire() for _ in range(3)]
+        for entry in entries:
+            pool.release(entry)
+        assert pool.stats()["size"] == 3
+        wait_until(lambda: pool.stats()["size"] == 1)
+        assert sum(conn.closed for conn in factory.opened) == 2
+        assert pool.stats()["idle"] == 1
+    finally:
+        pool.close()
+
+
+def test_dead_connection_is_replaced_on_checkout():
+    factory = FakeFactory()
+    pool = make_pool(factory, min_size=1)
+    try:
+        first = factory.opened[0]
+        first.alive = False
+        time.sleep(0.01)
+        entry = pool.acquire()
+        assert entry.raw is not first and first.closed
+        assert pool.stats()["failedChecks"] == 1
+        pool.release(entry)
+        assert pool.stats()["size"] == 1
+    finally:
+        pool.close()
+
+
+def test_broken_release_frees_the_slot_for_a_waiter():
+    factory = FakeFactory()
+    pool = make_pool(factory)
+    held = pool.acquire()
+    result = []
+
+    def worker():
+        entry = pool.acquire()
+        result.append(entry.raw)
+        pool.release(entry)
+
+    thread = threading.Thread(target=worker)
+    try:
+        thread.start()
+        wait_until(lambda: pool.stats()["waiting"] == 1)
+        pool.release(held, broken=True)
+        thread.join(timeout=2)
+        assert held.raw.closed
+        assert result and result[0] is not held.raw
+    finally:
+        pool.close()
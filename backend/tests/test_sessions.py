@@ -0,0 +1,83 @@
+from sessions import SessionRegistry
+
+
+def open_bound(registry, ws, user_id, rooms=()):
+    session = registry.open(ws)
+    registry.bind(session, user_id)
+    for chat_id in rooms:
+        registry.join(session, chat_id)
+    return session
+
+
+def test_indexes_follow_join_leave_and_close():
+    registry = SessionRegistry()
+    a1 = open_bound(registry, "ws-a1", "ana", ["c1", "c2"])
+    a2 = open_bound(registry, "ws-a2", "ana", ["c1"])
+    b = open_bound(registry, "ws-b", "bob", ["c1"])
+
+    assert set(registry.sessions_of("ana")) == {a1, a2}
+    assert set(registry.room("c1")) == {a1, a2, b}
+    assert registry.leave(a1, "c2")
+    assert not registry.leave(a1, "c2")
+    assert list(registry.room("c2")) == []
+
+    session, last = registry.close("ws-a1")
+    assert session is a1 and not last
+    assert set(registry.room("c1")) == {a2, b}
+    assert registry.close("ws-a2") == (a2, True)
+    assert not registry.is_online("ana") and registry.is_online("bob")
+    assert registry.stats()["rooms"] == 1
+
+
+def test_rebinding_a_socket_drops_the_previous_user_rooms():
+    registry = SessionRegistry()
+    session = open_bound(registry, "ws", "ana", ["c1"])
+    registry.bind(session, "bob")
+    assert session.rooms is None
+    assert list(registry.room("c1")) == []
+    assert list(registry.sessions_of("ana")) == []
+    assert list(registry.sessions_of("bob")) == [session]
+
+
+def test_resume_ids_are_unique_across_registries():
+    # cada worker tiene su propio registro: los ids no pueden repetirse entre ellos
+    ids = set()
+    for worker in range(4):
+        registry = SessionRegistry()
+        for i in range(50):
+            ids.add(open_bound(registry, f"ws-{i}", "ana").resume_id)
+    assert len(ids) == 200
+    assert all(isinstance(i, str) and len(i) >= 16 for i in ids)
+
+
+def test_resume_returns_rooms_only_to_the_same_user_once():
+    registry = SessionRegistry()
+    old = open_bound(registry, "ws-old", "ana", ["c1", "c2"])
+    resume_id = old.resume_id
+    registry.close("ws-old")
+
+    intruder = open_bound(registry, "ws-bob", "bob")
+    assert registry.resume(intruder, resume_id) == frozenset()
+
+    # el intento de otro usuario no consume la sesión estacionada
+    new = open_bound(registry, "ws-new", "ana")
+    assert registry.resume(new, resume_id) == {"c1", "c2"}
+    assert registry.resume(new, resume_id) == frozenset()
+    assert registry.stats()["resumed"] == 1
+
+
+def test_parked_sessions_expire_and_are_bounded():
+    registry = SessionRegistry(resume_grace=0)
+    old = open_bound(registry, "ws-old", "ana", ["c1"])
+    registry.close("ws-old")
+    assert registry.resume(open_bound(registry, "ws-new", "ana"), old.resume_id) == frozenset()
+
+    registry = SessionRegistry(resume_max=2)
+    ids = []
+    for i in range(3):
+        ids.append(open_bound(registry, f"ws-{i}", "ana", ["c1"]).resume_id)
+        registry.close(f"ws-{i}")
+    assert registry.stats()["resumable"] == 2
+    session = open_bound(registry, "ws-new", "ana")
+    assert registry.resume(session, ids[0]) == frozenset()
+    assert registry.resume(session, ids[2]) == {"c1"}
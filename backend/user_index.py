@@ -0,0 +1,105 @@
+import bisect
+import threading
+import unicodedata
+
+# tipo de coincidencia, en orden de relevancia
+_USERNAME, _DISPLAY, _WORD = 0, 1, 2
+
+
+def fold(text: str) -> str:
+    # minúsculas y sin acentos: "Ángel" y "angel" son la misma clave
+    text = unicodedata.normalize("NFKD", (text or "").casefold())
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+class UserIndex:
+    """Búsqueda de usuarios por prefijo en memoria.
+
+    Guarda una lista ordenada de claves (username, displayName completo y cada
+    palabra siguiente del displayName) y responde con bisect: un prefijo es el rango
+    de claves que empiezan con él. Se llena con `build` al arrancar y con `add` en
+    cada registro. `scan_limit` acota las claves que se revisan por búsqueda.
+    """
+
+    def __init__(self, scan_limit: int = 2000):
+        self.scan_limit = scan_limit
+        # (clave, tipo, userId) ordenadas
+        self._entries: list[tuple[str, int, str]] = []
+        self._users: set[str] = set()
+        self._lock = threading.Lock()
+        self.ready = False
+        self.searches = 0
+
+    @staticmethod
+    def _keys(username: str, display_name: str | None) -> set[tuple[str, int]]:
+        keys = {(fold(username), _USERNAME)}
+        display = fold(display_name or "")
+        if display:
+            keys.add((display, _DISPLAY))
+            for word in display.split()[1:]:
+                keys.add((word, _WORD))
+        return keys
+
+    def build(self, users):
+        # users: iterable de {id, username, displayName}; un solo sort al final
+        entries, seen = [], set()
+        for u in users:
+            if u["id"] in seen:
+                continue
+            seen.add(u["id"])
+            entries.extend((key, kind, u["id"]) for key, kind in self._keys(u["username"], u.get("displayName")))
+        entries.sort()
+        with self._lock:
+            # registros que llegaron durante la carga
+            for entry in self._entries:
+                if entry[2] not in seen:
+                    bisect.insort(entries, entry)
+            seen |= self._users
+            self._entries = entries
+            self._users = seen
+            self.ready = True
+
+    def add(self, user_id: str, username: str, display_name: str | None):
+        with self._lock:
+            if user_id in self._users:
+                return
+            self._users.add(user_id)
+            for key, kind in self._keys(username, display_name):
+                bisect.insort(self._entries, (key, kind, user_id))
+
+    def search(self, query: str, limit: int, exclude: str | None = None) -> list[str]:
+        """userIds cuyo username o displayName empieza con `query`, los más relevantes primero.
+
+        Orden: username exacto, prefijo de username, de displayName, de otra palabra del
+        displayName; a igual tipo, la clave más corta.
+        """
+        q = fold(query)
+        if not q or limit <= 0:
+            return []
+        best: dict[str, tuple] = {}
+        with self._lock:
+            self.searches += 1
+            i = bisect.bisect_left(self._entries, (q,))
+            end = min(len(self._entries), i + self.scan_limit)
+            while i < end:
+                key, kind, user_id = self._entries[i]
+                if not key.startswith(q):
+                    break
+                i += 1
+                if user_id == exclude:
+                    continue
+                rank = (0 if kind == _USERNAME and key == q else kind + 1, len(key), key)
+                if user_id not in best or rank < best[user_id]:
+                    best[user_id] = rank
+        return sorted(best, key=best.__getitem__)[:limit]
+
+    def __len__(self):
+        return len(self._users)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "users": len(self._users),
+            "keys": len(self._entries),
+            "searches": self.searches,
+        }
@@ -0,0 +1,59 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+from typing import Callable
+
+from bus.unix import Broker
+
+
+async def _supervise(count: int, target: Callable[[], None], bus_path: str, peer_queue_bytes: int):
+    broker = Broker(bus_path, max_queue_bytes=peer_queue_bytes)
+    await broker.start()
+
+    ctx = multiprocessing.get_context("spawn")
+    procs: list = [None] * count
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    def spawn(i: int):
+        p = ctx.Process(target=target, name=f"chat-worker-{i}", daemon=False)
+        p.start()
+        procs[i] = p
+        print(f"[Workers] worker {i} pid={p.pid}")
+
+    try:
+        for i in range(count):
+            spawn(i)
+        while not stopping.is_set():
+            try:
+                await asyncio.wait_for(stopping.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+            for i, p in enumerate(procs):
+                if not stopping.is_set() and not p.is_alive():
+                    # un worker caído se reemplaza; sus usuarios ya salieron del directorio
+                    print(f"[Workers] worker {i} terminó (código {p.exitcode}), reiniciando")
+                    spawn(i)
+    finally:
+        # SIGTERM a cada worker: salida limpia (guardan mensajes y presencia pendientes)
+        for p in procs:
+            if p is not None and p.is_alive():
+                os.kill(p.pid, signal.SIGTERM)
+        for p in procs:
+            if p is not None:
+                await loop.run_in_executor(None, p.join, 30)
+                if p.is_alive():
+                    p.kill()
+        await broker.close()
+
+
+def run_workers(count: int, target: Callable[[], None], bus_path: str, peer_queue_bytes: int = 64 * 2**20):
+    """Levanta el broker del bus y `count` procesos que ejecutan `target`.
+
+    Cada worker abre el mismo puerto con SO_REUSEPORT y el kernel reparte las
+    conexiones entrantes entre ellos.
+    """
+    asyncio.run(_supervise(count, target, bus_path, peer_queue_bytes))
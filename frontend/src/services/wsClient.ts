@@ -48,6 +48,8 @@ class WSClient {
   private isOpen = false;
   private url = "";
   private helloToken?: string;
+  // id de la sesión anterior: al reconectar el servidor restaura sus rooms
+  private resumeId?: string;
   private reconnectTimer: ReturnType<typeof setTimeout> | null = null;
   private reconnectDelayMs = 1500;
   private readonly maxReconnectDelayMs = 10000;
@@ -77,13 +79,16 @@ class WSClient {
       console.log("[WS] connected:", this.url);
 
       if (this.helloToken) {
-        this.send("hello", { token: this.helloToken });
+        this.send("hello", { token: this.helloToken, resumeId: this.resumeId });
       }
     };
 
     this.ws.onmessage = (ev) => {
       try {
         const msg: WSMessage = JSON.parse(ev.data);
+        if (msg.type === "hello:ok" && msg.data?.sessionId) {
+          this.resumeId = msg.data.sessionId;
+        }
         this.handlers.forEach((h) => h(msg));
       } catch {
         console.log("[WS] invalid message:", ev.data);